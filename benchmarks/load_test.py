@@ -0,0 +1,324 @@
+"""
+Load test modelling a ticket drop against a running API and local Postgres
+
+Virtual users pick weighted tasks, Locust-style:
+
+- browse: anonymous catalog browsing (list_events, get_event)
+- seats:  seat-map polling for the on-sale event
+- login:  login storm with pre-registered accounts
+- book:   contention on a small set of hot seats through POST /bookings/,
+          followed by /pay or /cancel
+
+At the end the bookings table is checked for double-booked seats and a JSON
+report with p50/p95/p99 latency, throughput and error rates is written, so
+runs can be compared:
+
+    python benchmarks/load_test.py --base-url http://localhost:8000 --users 200 --duration 60
+    python benchmarks/load_test.py compare before.json after.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+API_PREFIX = "/api/v1"
+DEFAULT_MIX = "browse=45,seats=30,login=10,book=15"
+PASSWORD = "load-test-password"
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class Stats:
+    """Latency samples and outcome counters per request name"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.outcomes = defaultdict(lambda: defaultdict(int))
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def record(self, name, started, outcome):
+        self.latencies[name].append((time.perf_counter() - started) * 1000)
+        self.outcomes[name][outcome] += 1
+
+    def report(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        requests = {}
+        for name, samples in sorted(self.latencies.items()):
+            samples.sort()
+            outcomes = dict(self.outcomes[name])
+            errors = outcomes.get("error", 0)
+            requests[name] = {
+                "count": len(samples),
+                "rps": round(len(samples) / elapsed, 2),
+                "p50_ms": round(percentile(samples, 50), 2),
+                "p95_ms": round(percentile(samples, 95), 2),
+                "p99_ms": round(percentile(samples, 99), 2),
+                "max_ms": round(samples[-1], 2),
+                "error_rate": round(errors / len(samples), 4),
+                "outcomes": outcomes,
+            }
+        total = sum(len(s) for s in self.latencies.values())
+        errors = sum(o.get("error", 0) for o in self.outcomes.values())
+        return {
+            "duration_s": round(elapsed, 2),
+            "total_requests": total,
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0,
+            "error_rate": round(errors / total, 4) if total else 0,
+            "requests": requests,
+        }
+
+
+def classify(response):
+    """ok / rejected (expected 4xx such as a seat conflict) / error"""
+    if response.status_code < 400:
+        return "ok"
+    if response.status_code < 500 and response.status_code not in (401, 404, 422):
+        return "rejected"
+    return "error"
+
+
+class TicketDrop:
+    def __init__(self, client, args, stats):
+        self.client = client
+        self.args = args
+        self.stats = stats
+        self.accounts = []
+        self.tokens = []
+        self.event_id = None
+        self.hot_seats = []
+        self.catalog_ids = []
+        self.created_bookings = 0
+
+    async def call(self, name, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, API_PREFIX + path, **kwargs)
+        except httpx.HTTPError:
+            self.stats.record(name, started, "error")
+            return None
+        self.stats.record(name, started, classify(response))
+        return response
+
+    async def setup(self):
+        """Register accounts, log them in and pick the on-sale event and hot seats"""
+        run_id = uuid.uuid4().hex[:6]
+        self.accounts = [f"load_{run_id}_{i}" for i in range(self.args.accounts)]
+        semaphore = asyncio.Semaphore(20)
+
+        async def register(username):
+            async with semaphore:
+                await self.client.post(API_PREFIX + "/auth/register", json={
+                    "email": f"{username}@example.com", "username": username, "password": PASSWORD,
+                    "first_name": "Load", "last_name": "Test"
+                })
+                r = await self.client.post(API_PREFIX + "/auth/login", json={"username": username, "password": PASSWORD})
+                if r.status_code == 200:
+                    self.tokens.append(r.json()["access_token"])
+
+        await asyncio.gather(*(register(u) for u in self.accounts))
+        if not self.tokens:
+            raise SystemExit("Could not log in any load-test account")
+
+        r = await self.client.get(API_PREFIX + "/events/", params={"status": "planned", "limit": 100})
+        events = r.json().get("events", [])
+        if not events:
+            raise SystemExit("No planned events to sell - seed the database first")
+        self.catalog_ids = [e["event_id"] for e in events]
+        self.event_id = self.args.event_id or self.catalog_ids[0]
+
+        r = await self.client.get(API_PREFIX + f"/events/{self.event_id}/seats")
+        seats = [s for s in r.json().get("seats", []) if not s["is_booked"]]
+        self.hot_seats = [s["seat_id"] for s in seats[:self.args.hot_seats]]
+        if not self.hot_seats:
+            raise SystemExit(f"Event {self.event_id} has no free seats")
+
+    async def browse(self):
+        await self.call("GET /events/", "GET", "/events/", params={"page": random.randint(1, 3)})
+        await self.call("GET /events/{id}", "GET", f"/events/{random.choice(self.catalog_ids)}")
+
+    async def seats(self):
+        await self.call("GET /events/{id}/seats", "GET", f"/events/{self.event_id}/seats")
+
+    async def login(self):
+        await self.call("POST /auth/login", "POST", "/auth/login",
+                        json={"username": random.choice(self.accounts), "password": PASSWORD})
+
+    async def book(self):
+        headers = {"Authorization": f"Bearer {random.choice(self.tokens)}"}
+        r = await self.call("POST /bookings/", "POST", "/bookings/", headers=headers,
+                            json={"event_id": self.event_id, "seat_id": random.choice(self.hot_seats)})
+        if r is None or r.status_code != 201:
+            return
+        self.created_bookings += 1
+        booking_id = r.json()["booking_id"]
+        if random.random() < self.args.pay_ratio:
+            await self.call("POST /bookings/pay", "POST", "/bookings/pay", headers=headers,
+                            json={"booking_id": booking_id, "payment_method": "card"})
+        else:
+            await self.call("POST /bookings/{id}/cancel", "POST", f"/bookings/{booking_id}/cancel", headers=headers)
+
+    async def virtual_user(self, tasks, weights, deadline):
+        while time.perf_counter() < deadline:
+            task = random.choices(tasks, weights)[0]
+            await task()
+            if self.args.think_time:
+                await asyncio.sleep(random.uniform(0, self.args.think_time))
+
+    async def run(self, mix):
+        tasks = [getattr(self, name) for name in mix]
+        weights = list(mix.values())
+        deadline = time.perf_counter() + self.args.duration
+        users = []
+        per_tick = max(1, self.args.spawn_rate // 10)
+        while len(users) < self.args.users and time.perf_counter() < deadline:
+            for _ in range(min(per_tick, self.args.users - len(users))):
+                users.append(asyncio.create_task(self.virtual_user(tasks, weights, deadline)))
+            await asyncio.sleep(0.1)
+        await asyncio.gather(*users)
+        self.stats.finished = time.perf_counter()
+
+
+def check_double_bookings(event_id):
+    """Seats held by more than one active booking, plus seats paid twice"""
+    from database import get_db_connection
+
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT seat_id, COUNT(*)
+            FROM bookings
+            WHERE event_id = %s AND status IN ('confirmed', 'pending')
+            GROUP BY seat_id
+            HAVING COUNT(*) > 1
+        """, (event_id,))
+        double_active = cur.fetchall()
+        cur.execute("""
+            SELECT b.seat_id, COUNT(*)
+            FROM bookings b
+            JOIN transactions t ON t.booking_id = b.booking_id AND t.status = 'completed'
+            WHERE b.event_id = %s AND b.status = 'confirmed'
+            GROUP BY b.seat_id
+            HAVING COUNT(*) > 1
+        """, (event_id,))
+        double_paid = cur.fetchall()
+    return {
+        "double_booked_seats": [{"seat_id": s, "active_bookings": n} for s, n in double_active],
+        "double_paid_seats": [{"seat_id": s, "paid_bookings": n} for s, n in double_paid],
+        "passed": not double_active and not double_paid,
+    }
+
+
+def parse_mix(spec):
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in ("browse", "seats", "login", "book"):
+            raise SystemExit(f"Unknown task in --mix: {name}")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+async def main_run(args):
+    stats = Stats()
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        drop = TicketDrop(client, args, stats)
+        await drop.setup()
+        stats.started = time.perf_counter()
+        await drop.run(parse_mix(args.mix))
+
+    report = stats.report()
+    report["config"] = {k: v for k, v in vars(args).items() if k != "func"}
+    report["event_id"] = drop.event_id
+    report["hot_seats"] = drop.hot_seats
+    report["bookings_created"] = drop.created_bookings
+    if not args.skip_db_check:
+        report["integrity"] = check_double_bookings(drop.event_id)
+    return report
+
+
+def print_report(report):
+    print(f"{'request':32} {'count':>7} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'err%':>6}")
+    for name, r in report["requests"].items():
+        print(f"{name:32} {r['count']:>7} {r['rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} "
+              f"{r['p99_ms']:>8} {r['error_rate'] * 100:>6.2f}")
+    print(f"\ntotal {report['total_requests']} requests, {report['throughput_rps']} rps, "
+          f"error rate {report['error_rate'] * 100:.2f}%")
+    integrity = report.get("integrity")
+    if integrity:
+        print("double-booking check:", "passed" if integrity["passed"] else f"FAILED {integrity}")
+
+
+def compare(args):
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(f"{'request':32} {'p50':>18} {'p95':>18} {'p99':>18} {'rps':>16}")
+    for name in sorted(set(before["requests"]) | set(after["requests"])):
+        b, a = before["requests"].get(name), after["requests"].get(name)
+        if not b or not a:
+            print(f"{name:32} only in {'after' if a else 'before'}")
+            continue
+        cells = [f"{b[k]}->{a[k]}" for k in ("p50_ms", "p95_ms", "p99_ms", "rps")]
+        print(f"{name:32} {cells[0]:>18} {cells[1]:>18} {cells[2]:>18} {cells[3]:>16}")
+    print(f"\nthroughput {before['throughput_rps']} -> {after['throughput_rps']} rps, "
+          f"error rate {before['error_rate']} -> {after['error_rate']}")
+
+
+def run(args):
+    report = asyncio.run(main_run(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"report written to {args.output}")
+    if report.get("integrity") and not report["integrity"]["passed"]:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command")
+
+    cmp_parser = sub.add_parser("compare", help="Compare two JSON reports")
+    cmp_parser.add_argument("before")
+    cmp_parser.add_argument("after")
+    cmp_parser.set_defaults(func=compare)
+
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=100, help="Concurrent virtual users")
+    parser.add_argument("--spawn-rate", type=int, default=50, help="Users started per second")
+    parser.add_argument("--duration", type=float, default=30, help="Test duration in seconds")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Task weights (default {DEFAULT_MIX})")
+    parser.add_argument("--accounts", type=int, default=50, help="Accounts registered for the run")
+    parser.add_argument("--event-id", type=int, help="Event on sale (default: first planned event)")
+    parser.add_argument("--hot-seats", type=int, default=10, help="Number of contended seats")
+    parser.add_argument("--pay-ratio", type=float, default=0.7, help="Share of bookings that pay instead of cancel")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Max random pause between tasks, seconds")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--skip-db-check", action="store_true", help="Do not query Postgres for double bookings")
+    parser.set_defaults(func=run)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Micro-benchmarks for Python-level hot paths
+
+Every request pays for JWT decoding, building the current user, turning
+RealDictCursor rows into dicts, the log_api_request() calls and Pydantic
+validation of request bodies. These benchmarks time those paths in-process,
+without a server or database, and compare the results with the baseline
+stored in benchmarks/baselines/micro.json:
+
+    python benchmarks/micro.py                  # run and compare, exit 1 on regression
+    python benchmarks/micro.py --save           # record a new baseline
+    python benchmarks/micro.py -k phone --threshold 0.3
+
+A benchmark regresses when its best time per call (the least noisy figure,
+as the timeit docs suggest) exceeds the baseline by more than --threshold
+(default 25%); slow results are measured a second time before failing.
+Baselines are only meaningful on the machine and Python version they were
+recorded with; a mismatch is reported.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import timeit
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.security import HTTPAuthorizationCredentials  # noqa: E402
+from psycopg2.extras import RealDictRow  # noqa: E402
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "micro.json")
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a factory returning the zero-argument callable to time"""
+    def decorator(factory):
+        BENCHMARKS[name] = factory
+        return factory
+    return decorator
+
+
+def run_coroutine(coro):
+    """Drive a coroutine that never awaits anything pending, without an event loop"""
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("coroutine suspended")
+
+
+def make_token():
+    from utils.auth import create_access_token
+    return create_access_token(
+        {"sub": "42", "user_id": 42, "username": "bench_user", "role": "user"},
+        expires_delta=timedelta(hours=1)
+    )
+
+
+@benchmark("auth.decode_token")
+def bench_decode_token():
+    from utils.auth import decode_token
+    token = make_token()
+    return lambda: decode_token(token)
+
+
+@benchmark("auth.get_current_user")
+def bench_get_current_user():
+    from utils.auth import get_current_user
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=make_token())
+    return lambda: run_coroutine(get_current_user(credentials))
+
+
+@benchmark("rows.realdictrow_to_dict[100]")
+def bench_rows_to_dict():
+    now = datetime.now()
+    rows = []
+    for i in range(100):
+        row = RealDictRow()
+        row.update({
+            "booking_id": i, "user_id": 42, "event_id": 7, "seat_id": i, "status": "confirmed",
+            "booking_date": now, "title": "Вечеринка", "event_date": now, "seat_number": f"A-{i}",
+            "zone_name": "VIP", "zone_price": 3000.0, "payment_status": "completed",
+        })
+        rows.append(row)
+    return lambda: [dict(row) for row in rows]
+
+
+def make_seat_rows(count):
+    rows = []
+    for i in range(count):
+        row = RealDictRow()
+        row.update({
+            "seat_id": i, "seat_number": f"A-{i:05d}", "zone_id": i % 4, "zone_name": "VIP Зона",
+            "zone_price": Decimal("2000.00"), "is_booked": i % 3 == 0,
+        })
+        rows.append(row)
+    return rows
+
+
+@benchmark("responses.seat_map[stdlib][500]")
+def bench_seat_map_default():
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    rows = make_seat_rows(500)
+    return lambda: JSONResponse(jsonable_encoder({"seats": [dict(row) for row in rows]}))
+
+
+@benchmark("responses.seat_map[fast][500]")
+def bench_seat_map_fast():
+    from utils.responses import FastJSONResponse
+    rows = make_seat_rows(500)
+    return lambda: FastJSONResponse({"seats": rows})
+
+
+@benchmark("helpers.log_api_request[skipped]")
+def bench_log_api_request_skipped():
+    from utils.helpers import log_api_request
+    logging.getLogger("nightclub").setLevel(logging.INFO)
+    body = {"event_id": 7, "seat_id": 12}
+    return lambda: log_api_request("/bookings/", "POST", body=body, user_id=42)
+
+
+@benchmark("helpers.log_api_request[debug+json]")
+def bench_log_api_request_debug():
+    from utils.helpers import log_api_request
+    from utils.logging_config import JsonFormatter
+
+    class FormatOnlyHandler(logging.Handler):
+        """Formats in the calling thread, like the listener would, and drops the line"""
+        def emit(self, record):
+            self.format(record)
+
+    logger = logging.getLogger("nightclub")
+    handler = FormatOnlyHandler()
+    handler.setFormatter(JsonFormatter())
+    body = {"event_id": 7, "seat_id": 12, "zones": [{"zone_id": z, "price": 1000.0} for z in range(4)]}
+
+    def call():
+        logger.setLevel(logging.DEBUG)
+        logger.addHandler(handler)
+        logger.propagate = False
+        try:
+            log_api_request("/bookings/", "POST", params={"page": 1}, body=body, user_id=42)
+        finally:
+            logger.removeHandler(handler)
+            logger.propagate = True
+    return call
+
+
+@benchmark("helpers.validate_phone_number")
+def bench_validate_phone():
+    from utils.helpers import validate_phone_number
+    phones = ["+7 (912) 345-67-89", "89123456789", "912-345-67-89", "not a phone"]
+    return lambda: [validate_phone_number(p) for p in phones]
+
+
+@benchmark("helpers.format_phone_number")
+def bench_format_phone():
+    from utils.helpers import format_phone_number
+    phones = ["+7 (912) 345-67-89", "89123456789", "9123456789", "12345"]
+    return lambda: [format_phone_number(p) for p in phones]
+
+
+@benchmark("events.EventCreate[50 zones]")
+def bench_event_create():
+    from routers.events import EventCreate
+    payload = {
+        "category_id": 1,
+        "title": "Вечеринка",
+        "description": "Большой зал",
+        "event_date": "2030-01-01T22:00:00",
+        "duration": 240,
+        "zones": [{"zone_id": z, "available_seats": 100, "zone_price": 1500.0} for z in range(50)],
+        "status": "planned",
+    }
+    return lambda: EventCreate(**payload)
+
+
+def measure(func, rounds, min_time):
+    """Best and median time per call in microseconds over `rounds` timed batches"""
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(number, int(number * min_time / max(elapsed, 1e-9)))
+    samples = [t / number * 1e6 for t in timer.repeat(repeat=rounds, number=number)]
+    return {
+        "median_us": round(statistics.median(samples), 3),
+        "min_us": round(min(samples), 3),
+        "calls_per_round": number,
+    }
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+    }
+
+
+def load_baseline():
+    if not os.path.exists(BASELINE_FILE):
+        return None
+    with open(BASELINE_FILE) as f:
+        return json.load(f)
+
+
+def save_baseline(results):
+    os.makedirs(os.path.dirname(BASELINE_FILE), exist_ok=True)
+    with open(BASELINE_FILE, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", dest="filter", help="Only run benchmarks whose name contains this string")
+    parser.add_argument("--rounds", type=int, default=7, help="Timed rounds per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per round")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown vs baseline (0.25 = 25%%)")
+    parser.add_argument("--save", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    selected = {name: factory for name, factory in BENCHMARKS.items()
+                if not args.filter or args.filter in name}
+    results = {}
+    for name, factory in selected.items():
+        results[name] = measure(factory(), args.rounds, args.min_time)
+
+    baseline = load_baseline()
+    if baseline and baseline.get("environment") != environment():
+        print(f"warning: baseline recorded on {baseline.get('environment')}, comparing anyway")
+    base_results = (baseline or {}).get("results", {})
+
+    regressions = []
+    print(f"{'benchmark':40} {'min us':>10} {'median us':>11} {'baseline':>10} {'change':>8}")
+    for name, result in results.items():
+        base = base_results.get(name)
+        if base and not args.save and result["min_us"] > base["min_us"] * (1 + args.threshold):
+            # Confirm before failing: a neighbour stealing CPU looks like a regression
+            retry = measure(selected[name](), args.rounds, args.min_time)
+            if retry["min_us"] < result["min_us"]:
+                result = results[name] = retry
+        if base:
+            change = result["min_us"] / base["min_us"] - 1
+            flag = "  REGRESSION" if change > args.threshold else ""
+            if flag:
+                regressions.append(name)
+            print(f"{name:40} {result['min_us']:>10.3f} {result['median_us']:>11.3f} "
+                  f"{base['min_us']:>10.3f} {change * 100:>+7.1f}%{flag}")
+        else:
+            print(f"{name:40} {result['min_us']:>10.3f} {result['median_us']:>11.3f} {'-':>10} {'-':>8}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+
+    if args.save:
+        merged = dict(base_results)
+        merged.update(results)
+        save_baseline(merged)
+        print(f"\nbaseline saved to {os.path.relpath(BASELINE_FILE)}")
+        return 0
+
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) slower than baseline by more than "
+              f"{args.threshold * 100:.0f}%: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,11 +11,79 @@ DB_USER = os.getenv("DB_USER", "postgres")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "postgres")
 
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# Idle connections kept per worker; busier moments open extra ones that are closed after use
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+# Query time budgets per route class as "<class>=<statement>/<lock>/<deadline>" seconds
+# (0 = no limit): statement_timeout and lock_timeout of each query, and the request
+# age after which no query is started. Classes: default, public_read, booking_write,
+# admin_analytics; those not listed keep their built-in budgets
+DB_QUERY_BUDGETS = os.getenv("DB_QUERY_BUDGETS", "")
+# Requests allowed to wait on one in-flight coalesced read (event page, seat map)
+SINGLE_FLIGHT_MAX_WAITERS = int(os.getenv("SINGLE_FLIGHT_MAX_WAITERS", "1000"))
+# Best-available booking (POST /bookings/auto): seats per request, how many of the
+# best free blocks a pick chooses from, and how long a worker trusts its seat index
+AUTO_BOOKING_MAX_SEATS = int(os.getenv("AUTO_BOOKING_MAX_SEATS", "10"))
+AUTO_BOOKING_SPREAD = int(os.getenv("AUTO_BOOKING_SPREAD", "4"))
+SEAT_INDEX_TTL_SECONDS = float(os.getenv("SEAT_INDEX_TTL_SECONDS", "15"))
+# Admin dashboard queries run concurrently, each cancelled after this many seconds
+ADMIN_QUERY_TIMEOUT_SECONDS = float(os.getenv("ADMIN_QUERY_TIMEOUT_SECONDS", "5"))
 
 # JWT Settings
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-for-development")
 JWT_ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Access tokens are verified without the database, so keep them short-lived;
+# clients renew them with a rotating refresh token (POST /auth/refresh)
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "10"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+REFRESH_REUSE_GRACE_SECONDS = int(os.getenv("REFRESH_REUSE_GRACE_SECONDS", "10"))
+REFRESH_COOKIE_SECURE = os.getenv("REFRESH_COOKIE_SECURE", "false").lower() in ("1", "true", "yes")
+# Load shedding per worker: requests running at once across all route classes
+# (0 disables shedding), and per class "class=concurrency/queue_seconds/target_latency_seconds"
+# for catalog, seat_map, booking, auth, admin_analytics, default
+LOAD_SHED_MAX_IN_FLIGHT = int(os.getenv("LOAD_SHED_MAX_IN_FLIGHT", "128"))
+LOAD_SHED_LIMITS = os.getenv("LOAD_SHED_LIMITS", "")
+# Waiting rooms: queue tickets are signed with this key and admit for N minutes
+WAITING_ROOM_SECRET = os.getenv("WAITING_ROOM_SECRET", JWT_SECRET_KEY)
+WAITING_ROOM_ADMISSION_MINUTES = int(os.getenv("WAITING_ROOM_ADMISSION_MINUTES", "15"))
+
+# Audit rows are queued and written in batches
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "100"))
+AUDIT_FLUSH_INTERVAL_MS = int(os.getenv("AUDIT_FLUSH_INTERVAL_MS", "200"))
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+
+# Auth rate limits as "<attempts>/<seconds>" ("0/60" disables one);
+# backend "memory" (per worker) or "postgres" (shared by all workers)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+RATE_LIMIT_LOGIN_PER_IP = os.getenv("RATE_LIMIT_LOGIN_PER_IP", "20/60")
+RATE_LIMIT_LOGIN_PER_USERNAME = os.getenv("RATE_LIMIT_LOGIN_PER_USERNAME", "10/300")
+RATE_LIMIT_REGISTER_PER_IP = os.getenv("RATE_LIMIT_REGISTER_PER_IP", "10/3600")
+# Verified tokens kept in memory per worker; revocations are re-read from the DB every N seconds
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_REVOCATION_SYNC_SECONDS = float(os.getenv("TOKEN_REVOCATION_SYNC_SECONDS", "60"))
+# Current-user profile and booking stats kept in memory per worker
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "300"))
 
 # Application Settings
-API_PREFIX = "/api/v1" 
\ No newline at end of file
+API_PREFIX = "/api/v1"
+DEBUG = os.getenv("DEBUG", "false").lower() in ("1", "true", "yes")
+
+# Logging Settings
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.getenv("LOG_FILE", "debug.log")  # empty string disables the file handler
+LOG_ROTATION = os.getenv("LOG_ROTATION", "size")  # "size" or "time"
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_ROTATION_WHEN = os.getenv("LOG_ROTATION_WHEN", "midnight")
+# Per-route sampling of API debug records, e.g. "/events/=0.1,/events/{id}/seats=0.05"
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "/events/=0.1,/events/{id}/seats=0.1")
+
+# SQL tracing
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() in ("1", "true", "yes")
+QUERY_BUDGET_PER_REQUEST = int(os.getenv("QUERY_BUDGET_PER_REQUEST", "20"))
+
+# Tracing: "none", "console", "file" or "otlp"
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none").lower()
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+TRACING_SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "nightclub-booking-system")
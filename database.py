@@ -1,25 +1,665 @@
+import asyncio
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import psycopg2.errors
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extensions import BYTES, TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS, register_type
+from psycopg2.extras import NamedTupleCursor, RealDictCursor
 from contextlib import contextmanager
-from config import DATABASE_URL
+from contextvars import ContextVar, copy_context
+from typing import NamedTuple, Optional
+from fastapi import Request
+import contextlib
+import logging
+import re
+import sys
+import threading
+import time
+from config import DATABASE_URL, DB_POOL_SIZE, DB_QUERY_BUDGETS
+from utils.metrics import (
+    DB_CONNECTION_WAIT, DB_QUERY_LATENCY, DB_CONNECTIONS_OPENED, DB_QUERIES_INTERRUPTED,
+    PREPARED_STATEMENT_CALLS
+)
+from utils.query_trace import record_query, fingerprint, statement_text
+from utils.tracing import span
+
+logger = logging.getLogger('nightclub')
+
+_SKIP_FRAMES = {__file__, contextlib.__file__}
+
+def _call_site() -> str:
+    """Name of the function that opened the cursor, e.g. routers.bookings.create_booking"""
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename in _SKIP_FRAMES:
+        frame = frame.f_back
+    if frame is None:
+        return "unknown"
+    return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}"
+
+class _Instrumented:
+    """Cursor mixin that records statement latency and traces it to the current request"""
+
+    def __init__(self, *args, call_site: str = "unknown", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.call_site = call_site
+
+    def execute(self, query, vars=None):
+        with span("db.query", {"db.system": "postgresql", "code.function": self.call_site}) as db_span:
+            start = time.perf_counter()
+            try:
+                result = super().execute(query, vars)
+            except Exception as e:
+                DB_QUERY_LATENCY.labels(self.call_site).observe(time.perf_counter() - start)
+                _note_interruption(e)
+                raise
+            duration = time.perf_counter() - start
+            DB_QUERY_LATENCY.labels(self.call_site).observe(duration)
+            record_query(self, query, vars, duration, self.call_site)
+            if db_span is not None:
+                db_span.set_attribute("db.statement", fingerprint(statement_text(self, query)))
+                db_span.set_attribute("db.rowcount", self.rowcount)
+            return result
+
+class InstrumentedCursor(_Instrumented, RealDictCursor):
+    """Rows as dicts (RealDictRow)"""
+
+class InstrumentedRecordCursor(_Instrumented, NamedTupleCursor):
+    """Rows as namedtuples: one tuple per row, field names shared by the whole result"""
+
+def fetch_json(cur, query, vars=None) -> bytes:
+    """Run a SELECT and return its rows as a JSON array built by Postgres.
+
+    The rows are never materialized in Python: json_agg() encodes them and
+    the text comes back as bytes, ready for utils.responses.RawJSONResponse.
+    Row order follows the query's ORDER BY, as json_agg() reads the ordered
+    subquery.
+    """
+    # A separate cursor, so text columns of `cur` keep decoding to str
+    json_cur = InstrumentedCursor(cur.connection, call_site=cur.call_site)
+    try:
+        register_type(BYTES, json_cur)
+        json_cur.execute(f"SELECT COALESCE(json_agg(q), '[]')::text AS rows FROM ({query}) q", vars)
+        return json_cur.fetchone()["rows"]
+    finally:
+        json_cur.close()
+
+class PooledConnection(psycopg2.extensions.connection):
+    """Connection that remembers the statements PREPAREd on it and its timeouts"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        # (statement_timeout, lock_timeout) in ms set on the session; None if unknown
+        self.timeouts = None
+
+class ConnectionPool:
+    """Keeps up to `size` idle connections for reuse.
+
+    Never blocks: when none is idle a new connection is opened, and
+    connections returned while `size` are already idle are closed.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = psycopg2.connect(DATABASE_URL, connection_factory=PooledConnection)
+                DB_CONNECTIONS_OPENED.inc()
+                return conn
+            if not conn.closed:
+                return conn
+
+    def put(self, conn) -> None:
+        if not conn.closed:
+            try:
+                if conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                    conn.timeouts = None
+                if conn.autocommit:
+                    conn.autocommit = False
+            except psycopg2.Error:
+                conn.close()
+        if conn.closed:
+            return
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+pool = ConnectionPool(DB_POOL_SIZE)
+
+def _connect():
+    start = time.perf_counter()
+    conn = pool.get()
+    DB_CONNECTION_WAIT.observe(time.perf_counter() - start)
+    return conn
 
 @contextmanager
 def get_db_connection():
     conn = None
     try:
-        conn = psycopg2.connect(DATABASE_URL)
+        conn = _connect()
         yield conn
     finally:
         if conn is not None:
-            conn.close()
+            pool.put(conn)
+
+class PreparedStatement:
+    """A hot statement, PREPAREd once per pooled connection and then EXECUTEd by name.
+
+    `sql` uses %s placeholders like any other query; parameters are positional.
+    """
+
+    def __init__(self, name: str, sql: str):
+        self.name = name
+        self.sql = sql
+        param_count = sql.count("%s")
+        counter = iter(range(1, param_count + 1))
+        body = re.sub(r"%s", lambda _: f"${next(counter)}", sql).replace("%%", "%")
+        self.prepare_sql = f"PREPARE {name} AS {body}"
+        placeholders = ", ".join(["%s"] * param_count)
+        self.execute_sql = f"EXECUTE {name} ({placeholders})" if param_count else f"EXECUTE {name}"
+
+PREPARED_STATEMENTS = {}
+
+def prepared_statement(name: str, sql: str) -> PreparedStatement:
+    """Register a hot statement under a unique name"""
+    if name in PREPARED_STATEMENTS:
+        raise ValueError(f"Prepared statement {name!r} is already registered")
+    statement = PreparedStatement(name, sql)
+    PREPARED_STATEMENTS[name] = statement
+    return statement
+
+def execute_prepared(cur, statement: PreparedStatement, vars=()) -> None:
+    """Execute a registered statement on the cursor's connection, preparing it there first if needed"""
+    prepared = getattr(cur.connection, "prepared", None)
+    if prepared is None:
+        # Not a pool connection (e.g. a script's own connection): plain execute
+        cur.execute(statement.sql, vars)
+        return
+    if statement.name in prepared:
+        PREPARED_STATEMENT_CALLS.labels(statement.name, "reused").inc()
+    else:
+        # PREPARE is not undone by a rollback, so the name is only recorded
+        # once the server has accepted it
+        cur.execute(statement.prepare_sql)
+        prepared.add(statement.name)
+        PREPARED_STATEMENT_CALLS.labels(statement.name, "prepared").inc()
+    cur.execute(statement.execute_sql, vars)
+
+def prepared_statement_stats(cur) -> list:
+    """Plan cache figures of the statements prepared on this connection"""
+    cur.execute(
+        """
+        SELECT name, prepare_time, generic_plans, custom_plans
+        FROM pg_prepared_statements
+        ORDER BY name
+        """
+    )
+    return [dict(row) for row in cur.fetchall()]
+
+class QueryBudget(NamedTuple):
+    """Time limits in seconds (0 = none) for the queries of one route class.
+
+    statement_timeout and lock_timeout are applied to every query; no
+    query is started once the request is older than `deadline`.
+    """
+    statement_timeout: float
+    lock_timeout: float
+    deadline: float
+
+_DEFAULT_BUDGETS = {
+    "default": QueryBudget(10, 2, 30),
+    "public_read": QueryBudget(3, 1, 10),
+    "booking_write": QueryBudget(5, 2, 15),
+    "admin_analytics": QueryBudget(60, 5, 120),
+}
+
+def _parse_budgets(spec: str) -> dict:
+    """Parse "class=statement/lock/deadline,..." over the defaults, ignoring malformed entries"""
+    budgets = dict(_DEFAULT_BUDGETS)
+    for item in spec.split(","):
+        route_class, _, limits = item.strip().partition("=")
+        try:
+            budgets[route_class.strip()] = QueryBudget(*(float(v) for v in limits.split("/")))
+        except (TypeError, ValueError):
+            continue
+    return budgets
+
+QUERY_BUDGETS = _parse_budgets(DB_QUERY_BUDGETS)
+
+class QueryInterrupted(Exception):
+    """A request's query was refused or cancelled: deadline passed or client gone"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+def _apply_timeouts(connection, statement_timeout: float, lock_timeout: float) -> None:
+    # Session settings, so they hold in autocommit mode too; skipped when unchanged
+    timeouts = (int(statement_timeout * 1000), int(lock_timeout * 1000))
+    if connection.timeouts == timeouts:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT set_config('statement_timeout', %s, false), set_config('lock_timeout', %s, false)",
+            (str(timeouts[0]), str(timeouts[1]))
+        )
+    connection.timeouts = timeouts
+
+
+class RequestScope:
+    """One connection and one transaction shared by every get_db_cursor() of a request.
+
+    The connection is opened by the first cursor. A block opened with
+    commit=True commits the shared transaction when it exits; an exception
+    leaving any block rolls it back. Whatever is still uncommitted when the
+    request ends is rolled back.
+
+    Queries run under the route's QueryBudget. Once the client disconnects
+    no new query starts and those running in worker threads are cancelled;
+    `interrupted` then names why the request's database work stopped.
+    """
+
+    def __init__(self, request: Optional[Request] = None, parent: Optional["RequestScope"] = None):
+        self.connection = None
+        self.budget = QUERY_BUDGETS["default"]
+        self.started = time.monotonic()
+        self._disconnected = False
+        # Request whose work this scope does in a worker thread (run_in_thread)
+        self.parent = parent
+        self.interrupted: Optional[str] = None
+        self._on_commit = []
+        self._request = request
+        self._watcher = None
+        # Connections of gather_queries() and run_in_thread() currently in use
+        self._running = set()
+        self._running_lock = threading.Lock()
+
+    @property
+    def disconnected(self) -> bool:
+        return self._disconnected or (self.parent is not None and self.parent.disconnected)
+
+    @disconnected.setter
+    def disconnected(self, value: bool) -> None:
+        self._disconnected = value
+
+    def connect(self):
+        if self.connection is None:
+            self.connection = _connect()
+            if self.parent is not None:
+                self.parent.track(self.connection, True)
+            self._watch_disconnect()
+        return self.connection
+
+    def check(self) -> None:
+        """Refuse to start a query for a request that is out of time or abandoned"""
+        if self.disconnected:
+            raise self.interrupt("client_disconnected")
+        if self.budget.deadline and time.monotonic() - self.started > self.budget.deadline:
+            raise self.interrupt("deadline")
+
+    def interrupt(self, reason: str) -> QueryInterrupted:
+        if self.interrupted is None:
+            self.interrupted = reason
+            DB_QUERIES_INTERRUPTED.labels(reason).inc()
+            logger.warning(f"Request database work interrupted: {reason}")
+        return QueryInterrupted(reason)
+
+    def _watch_disconnect(self) -> None:
+        # Only requests that reach the database need watching
+        if self._request is None or self._watcher is not None:
+            return
+        try:
+            self._watcher = asyncio.get_running_loop().create_task(self._wait_for_disconnect())
+        except RuntimeError:
+            pass
+
+    async def _wait_for_disconnect(self) -> None:
+        # The body has already been read by FastAPI; what follows is the disconnect
+        while (await self._request.receive())["type"] != "http.disconnect":
+            pass
+        self.disconnected = True
+        with self._running_lock:
+            for connection in self._running:
+                connection.cancel()
+
+    def track(self, connection, running: bool) -> None:
+        with self._running_lock:
+            if running:
+                self._running.add(connection)
+            else:
+                self._running.discard(connection)
+
+    def in_transaction(self) -> bool:
+        return (self.connection is not None
+                and self.connection.info.transaction_status != TRANSACTION_STATUS_IDLE)
+
+    def commit(self) -> None:
+        self.connection.commit()
+        self._run_callbacks()
+
+    def rollback(self) -> None:
+        if self.connection is not None and not self.connection.closed:
+            self.connection.rollback()
+            # Undoes settings made in the transaction
+            self.connection.timeouts = None
+        self._on_commit.clear()
+
+    def on_commit(self, callback) -> None:
+        self._on_commit.append(callback)
+
+    def _wrote(self) -> bool:
+        """Whether the open transaction changed anything (or failed, so it may have)"""
+        if self.connection.info.transaction_status != TRANSACTION_STATUS_INTRANS:
+            return True
+        with self.connection.cursor() as cur:
+            cur.execute("SELECT txid_current_if_assigned() IS NOT NULL")
+            return cur.fetchone()[0]
+
+    def _run_callbacks(self) -> None:
+        callbacks, self._on_commit = self._on_commit, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"on_commit callback failed: {e}")
+
+    def close(self) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+        if self.connection is None:
+            return
+        try:
+            if self.in_transaction():
+                # Callbacks belong to writes that are rolled back here; only a
+                # transaction that read and never wrote (e.g. a GET logging an
+                # audit row) has nothing to lose
+                keep_callbacks = bool(self._on_commit) and not self._wrote()
+                self.connection.rollback()
+                self.connection.timeouts = None
+                if not keep_callbacks:
+                    self._on_commit.clear()
+            self._run_callbacks()
+        except psycopg2.Error as e:
+            self._on_commit.clear()
+            logger.warning(f"Failed to end request transaction: {e}")
+        finally:
+            if self.parent is not None:
+                self.parent.track(self.connection, False)
+            pool.put(self.connection)
+            self.connection = None
+
+_request_scope: ContextVar[Optional[RequestScope]] = ContextVar("db_request_scope", default=None)
+
+async def db_request_scope(request: Request):
+    """FastAPI dependency: share one connection and transaction for the whole request"""
+    scope = RequestScope(request)
+    # main.py turns interrupted database work into 503/504 responses
+    request.state.db_scope = scope
+    token = _request_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _request_scope.reset(token)
+        scope.close()
+
+def _note_interruption(exc: Exception) -> None:
+    # Recorded where the query fails, as routes often re-raise errors as a 500
+    scope = _request_scope.get()
+    if scope is None:
+        return
+    if isinstance(exc, psycopg2.errors.LockNotAvailable):
+        scope.interrupt("lock_timeout")
+    elif isinstance(exc, psycopg2.errors.QueryCanceled):
+        scope.interrupt("client_disconnected" if scope.disconnected else "statement_timeout")
+
+def db_budget(route_class: str):
+    """Route dependency putting the request's queries under a QUERY_BUDGETS class"""
+    budget = QUERY_BUDGETS[route_class]
+
+    async def apply_budget():
+        scope = _request_scope.get()
+        if scope is not None:
+            scope.budget = budget
+
+    return apply_budget
+
+def on_commit(callback) -> None:
+    """Run callback once the current request's transaction commits.
+
+    Runs it right away when nothing is uncommitted (or outside a request);
+    drops it if the transaction is rolled back because of an error, or
+    wrote and is still uncommitted when the request ends.
+    """
+    scope = _request_scope.get()
+    if scope is None or not scope.in_transaction():
+        callback()
+    else:
+        scope.on_commit(callback)
+
+def commit_now(cur) -> None:
+    """Commit cur's transaction before the block ends, e.g. to keep a
+    revocation when the request then fails; on_commit callbacks run too"""
+    scope = _request_scope.get()
+    if scope is not None and scope.connection is cur.connection:
+        scope.commit()
+    else:
+        cur.connection.commit()
+
+class ParallelQuery(NamedTuple):
+    """One read-only query for gather_queries(); fetch is "all" or "one" """
+    sql: str
+    params: Optional[tuple] = None
+    fetch: str = "all"
+
+# Threads running gather_queries(), run_detached() and run_in_thread() work, each on its own pooled connection
+_query_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="db-query")
+
+def _run_parallel_query(call_site: str, query: ParallelQuery, timeout: float,
+                        lock_timeout: float, parent: Optional[RequestScope]):
+    # Own connection, not the request's; traces still attach to the request
+    _request_scope.set(None)
+    with get_db_connection() as connection:
+        _apply_timeouts(connection, timeout, lock_timeout)
+        cursor = InstrumentedCursor(connection, call_site=call_site)
+        if parent is not None:
+            parent.track(connection, True)
+        try:
+            cursor.execute(query.sql, query.params)
+            if query.fetch == "one":
+                row = cursor.fetchone()
+                return dict(row) if row is not None else None
+            return [dict(row) for row in cursor.fetchall()]
+        finally:
+            if parent is not None:
+                parent.track(connection, False)
+            cursor.close()
+
+async def gather_queries(queries: dict, timeout: float) -> tuple:
+    """Run independent read-only queries concurrently; returns (results, errors).
+
+    Each query gets its own pooled connection and a server-side
+    statement_timeout, so the wall time is that of the slowest query.
+    A query that fails or times out is reported in `errors` by name and
+    its result is None; the other results are still returned.
+    """
+    call_site = _call_site()
+    scope = _request_scope.get()
+    lock_timeout = QUERY_BUDGETS["default"].lock_timeout
+    if scope is not None:
+        scope.check()
+        lock_timeout = scope.budget.lock_timeout
+    loop = asyncio.get_running_loop()
+    names = list(queries)
+    tasks = [
+        asyncio.wait_for(
+            loop.run_in_executor(
+                _query_executor, copy_context().run, _run_parallel_query,
+                f"{call_site}:{name}", queries[name], timeout, lock_timeout, scope
+            ),
+            # The server cancels at `timeout`; this only covers a hung connection
+            timeout + 1
+        )
+        for name in names
+    ]
+    if scope is not None:
+        # Lets the disconnect watcher run and cancel the queries
+        scope._watch_disconnect()
+    outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+    if scope is not None and scope.disconnected:
+        raise scope.interrupt("client_disconnected")
+
+    results, errors = {}, {}
+    for name, outcome in zip(names, outcomes):
+        if isinstance(outcome, BaseException):
+            results[name] = None
+            if isinstance(outcome, (asyncio.TimeoutError, psycopg2.errors.QueryCanceled)):
+                errors[name] = f"timed out after {timeout:g} s"
+            else:
+                errors[name] = (str(outcome).strip().splitlines() or [type(outcome).__name__])[0]
+            logger.warning(f"Query {call_site}:{name} failed: {errors[name]}")
+        else:
+            results[name] = outcome
+    return results, errors
+
+def _run_detached(budget: QueryBudget, fn, args, parent: Optional[RequestScope] = None):
+    scope = RequestScope(parent=parent)
+    scope.budget = budget
+    if parent is not None:
+        scope.started = parent.started
+    _request_scope.set(scope)
+    try:
+        return fn(*args)
+    except Exception as e:
+        if scope.interrupted is not None:
+            raise QueryInterrupted(scope.interrupted) from e
+        raise
+    finally:
+        scope.close()
+
+async def run_detached(fn, *args):
+    """Run fn(*args) in a worker thread with a request scope of its own.
+
+    For work whose result is shared by several requests (utils.single_flight):
+    it gets its own connection and transaction under the caller's budget and
+    keeps running if the caller's client disconnects.
+    """
+    caller = _request_scope.get()
+    budget = caller.budget if caller is not None else QUERY_BUDGETS["default"]
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _query_executor, copy_context().run, _run_detached, budget, fn, args
+    )
+
+async def run_in_thread(fn, *args):
+    """Run fn(*args) in a worker thread as part of the current request.
+
+    For long reads in async routes: the event loop (and the disconnect
+    watcher with it) keeps running meanwhile. fn gets its own connection
+    and transaction under the request's budget and deadline, and its
+    queries are cancelled when the client disconnects.
+    """
+    caller = _request_scope.get()
+    if caller is None:
+        return await run_detached(fn, *args)
+    caller.check()
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(
+        _query_executor, copy_context().run, _run_detached, caller.budget, fn, args, caller
+    )
+    caller._watch_disconnect()
+    try:
+        return await future
+    except QueryInterrupted as e:
+        # Counted by the worker's scope; recorded here for main.py's middleware,
+        # which then answers 503/504 even if the route re-raises it as a 500
+        if caller.interrupted is None:
+            caller.interrupted = e.reason
+        raise
+
+def run_in_background(fn, *args) -> None:
+    """Start fn(*args) like run_detached() without waiting for it; callable from any thread"""
+    caller = _request_scope.get()
+    budget = caller.budget if caller is not None else QUERY_BUDGETS["default"]
+    _query_executor.submit(copy_context().run, _run_detached, budget, fn, args)
 
 @contextmanager
-def get_db_cursor(commit=False):
+def _scoped_cursor(scope: RequestScope, call_site: str, commit: bool, autocommit: bool,
+                   cursor_class, statement_timeout: Optional[float], lock_timeout: Optional[float]):
+    scope.check()
+    connection = scope.connect()
+    # Autocommit only when the block does not join an open transaction; one
+    # that does commits it at exit, so its writes are never left pending
+    joined = autocommit and scope.in_transaction()
+    autocommit = autocommit and not joined
+    if autocommit:
+        connection.autocommit = True
+    cursor = cursor_class(connection, call_site=call_site)
+    try:
+        _apply_timeouts(
+            connection,
+            scope.budget.statement_timeout if statement_timeout is None else statement_timeout,
+            scope.budget.lock_timeout if lock_timeout is None else lock_timeout
+        )
+        yield cursor
+        if (commit and not autocommit) or joined:
+            scope.commit()
+    except BaseException:
+        scope.rollback()
+        raise
+    finally:
+        cursor.close()
+        if autocommit and not connection.closed:
+            connection.autocommit = False
+
+@contextmanager
+def get_db_cursor(commit=False, autocommit=False, records=False,
+                  statement_timeout: Optional[float] = None, lock_timeout: Optional[float] = None):
+    """Cursor on the request's shared connection, or a fresh one outside a request.
+
+    autocommit=True runs each statement in its own implicit transaction,
+    saving the BEGIN and COMMIT round trips for single-statement work.
+    Inside a request that already has an open transaction the block joins it
+    and commits it at exit.
+    records=True returns rows as namedtuples instead of dicts, for large
+    results processed in Python; see fetch_json() for results sent as JSON.
+    statement_timeout / lock_timeout (seconds) override the route's
+    QueryBudget for this block.
+    """
+    call_site = _call_site()
+    cursor_class = InstrumentedRecordCursor if records else InstrumentedCursor
+    scope = _request_scope.get()
+    if scope is not None:
+        with _scoped_cursor(scope, call_site, commit, autocommit, cursor_class,
+                            statement_timeout, lock_timeout) as cursor:
+            yield cursor
+        return
+    default = QUERY_BUDGETS["default"]
     with get_db_connection() as connection:
-        cursor = connection.cursor(cursor_factory=RealDictCursor)
+        connection.autocommit = autocommit
+        _apply_timeouts(
+            connection,
+            default.statement_timeout if statement_timeout is None else statement_timeout,
+            default.lock_timeout if lock_timeout is None else lock_timeout
+        )
+        cursor = cursor_class(connection, call_site=call_site)
         try:
             yield cursor
             if commit:
                 connection.commit()
         finally:
-            cursor.close() 
\ No newline at end of file
+            cursor.close()
@@ -6,17 +6,28 @@ from fastapi.responses import FileResponse, JSONResponse
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from starlette.responses import Response
 import uvicorn
-from config import API_PREFIX
+from config import API_PREFIX, DEBUG, ACCESS_TOKEN_EXPIRE_MINUTES
+from utils.audit import audit_writer
 from utils.auth import get_current_user
+from utils.logging_config import setup_logging, shutdown_logging
+from utils.metrics import REQUEST_LATENCY, REQUESTS_IN_FLIGHT, render_metrics, mark_process_dead
+from database import db_request_scope, QueryInterrupted, pool as db_pool
+from utils.load_shedding import load_shedder, classify, Overloaded
+from utils.responses import FastJSONResponse
+from utils.query_trace import start_request_trace, finish_request_trace
+from utils.token_store import start_revocation_listener, stop_revocation_listener
+from utils.user_cache import user_summary_response
+from utils.venue import load_venue
+from utils.waiting_room import load_rooms
+from utils.tracing import setup_tracing, shutdown_tracing, span
 import os
+import time
 import logging
 from contextlib import asynccontextmanager
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging (queue-based, file I/O runs off the event loop)
+setup_logging()
+setup_tracing()
 logger = logging.getLogger(__name__)
 
 @asynccontextmanager
@@ -27,9 +38,28 @@ async def lifespan(app: FastAPI):
     logger.info(f"🔗 API Base URL: {API_PREFIX}")
     logger.info(f"🏠 Admin Dashboard: /admin-dashboard.html")
     logger.info(f"👤 Profile Page: /profile.html")
+    start_revocation_listener(max_token_age=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+    # Zones, seats and categories stay in memory until they change; if the
+    # database is not ready yet, venue() loads them on first use instead
+    try:
+        load_venue()
+    except Exception as e:
+        logger.warning(f"Venue not loaded at startup, will load on first use: {e}")
+    # Open waiting rooms, kept in memory so admission checks need no query;
+    # loaded on the first check instead if the database is not ready yet
+    try:
+        load_rooms()
+    except Exception as e:
+        logger.warning(f"Waiting rooms not loaded at startup, will load on first use: {e}")
     yield
     # Shutdown
     logger.info("🛑 Nightclub Booking System shutting down...")
+    stop_revocation_listener()
+    audit_writer.stop()
+    db_pool.close()
+    mark_process_dead()
+    shutdown_tracing()
+    shutdown_logging()
 
 app = FastAPI(
     title="NightClub Booking System",
@@ -55,6 +85,9 @@ app = FastAPI(
     version="2.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=FastJSONResponse,
+    # One connection and transaction per request, shared with utils.helpers
+    dependencies=[Depends(db_request_scope)],
     lifespan=lifespan
 )
 
@@ -67,6 +100,53 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+# Requests whose database work hit a time budget or lost their client get
+# 503/504 instead of whatever error (usually a 500) the route made of it
+_DB_INTERRUPTED = {
+    "statement_timeout": (504, "Database query timed out"),
+    "deadline": (504, "Request deadline exceeded"),
+    "lock_timeout": (503, "Resource is busy, please retry"),
+    "client_disconnected": (503, "Client disconnected"),
+}
+
+@app.middleware("http")
+async def db_interruption_responses(request: Request, call_next):
+    error = response = None
+    try:
+        response = await call_next(request)
+    except Exception as e:
+        error = e
+    scope = getattr(request.state, "db_scope", None)
+    reason = scope.interrupted if scope is not None else None
+    if reason is None and isinstance(error, QueryInterrupted):
+        # Work shared with other requests (run_detached) was interrupted
+        reason = error.reason
+    if reason is None or (response is not None and response.status_code < 500):
+        if error is not None:
+            raise error
+        return response
+    status_code, detail = _DB_INTERRUPTED[reason]
+    headers = {"Retry-After": "1"} if status_code == 503 else None
+    return JSONResponse(status_code=status_code, content={"detail": detail}, headers=headers)
+
+# Per route class concurrency limits; requests over them queue briefly, then get
+# 503 + Retry-After, low priority classes first (utils/load_shedding.py)
+@app.middleware("http")
+async def shed_load(request: Request, call_next):
+    try:
+        route_class = await load_shedder.acquire(classify(request.method, request.url.path))
+    except Overloaded as e:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Server is busy, please retry"},
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    start = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        load_shedder.release(route_class, time.perf_counter() - start)
+
 # Custom middleware for development and security headers
 @app.middleware("http")
 async def add_security_headers(request: Request, call_next):
@@ -89,6 +169,58 @@ async def add_security_headers(request: Request, call_next):
     
     return response
 
+# Request metrics: latency per route template and status, in-flight requests
+@app.middleware("http")
+async def track_request_metrics(request: Request, call_next):
+    REQUESTS_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        REQUEST_LATENCY.labels(
+            request.method,
+            route.path if route is not None else "unmatched",
+            str(status)
+        ).observe(time.perf_counter() - start)
+        REQUESTS_IN_FLIGHT.dec()
+
+# Per-request SQL tracing; Server-Timing and X-DB-Queries headers in debug mode
+@app.middleware("http")
+async def trace_db_queries(request: Request, call_next):
+    trace, token = start_request_trace(request.method, request.url.path)
+    try:
+        response = await call_next(request)
+        if DEBUG:
+            response.headers["Server-Timing"] = trace.server_timing()
+            response.headers["X-DB-Queries"] = str(trace.count)
+        return response
+    finally:
+        finish_request_trace(trace, token)
+
+# Request span; registered last so it wraps every other middleware
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    with span(f"{request.method} {request.url.path}", {"http.method": request.method}) as request_span:
+        response = await call_next(request)
+        if request_span is not None:
+            route = request.scope.get("route")
+            if route is not None:
+                request_span.update_name(f"{request.method} {route.path}")
+                request_span.set_attribute("http.route", route.path)
+            request_span.set_attribute("http.status_code", response.status_code)
+        return response
+
+# Prometheus scrape endpoint
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Expose Prometheus metrics (aggregated across workers in multiprocess mode)"""
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
+
 # Health check endpoint with enhanced information
 @app.get("/health")
 async def health_check():
@@ -96,8 +228,8 @@ async def health_check():
     try:
         from database import get_db_cursor
         
-        # Test database connection
-        with get_db_cursor() as cur:
+        # Test database connection; a probe must answer fast
+        with get_db_cursor(statement_timeout=1) as cur:
             cur.execute("SELECT 1")
             db_status = "healthy"
     except Exception as e:
@@ -182,58 +314,7 @@ async def verify_user(current_user: dict = Depends(get_current_user)):
 @app.get(f"{API_PREFIX}/auth/me")
 async def get_auth_me(current_user: dict = Depends(get_current_user)):
     """Get current user info via auth endpoint (backward compatibility)"""
-    try:
-        from database import get_db_cursor
-        
-        with get_db_cursor() as cur:
-            # Get user and profile data using user_id from token
-            user_id = current_user.get("user_id")
-            
-            cur.execute(
-                """
-                SELECT u.*, p.first_name, p.last_name
-                FROM users u
-                LEFT JOIN user_profiles p ON u.user_id = p.user_id
-                WHERE u.user_id = %s AND u.is_active = true
-                """,
-                (user_id,)
-            )
-            user_data = cur.fetchone()
-            
-            if not user_data:
-                raise HTTPException(status_code=404, detail="User not found")
-            
-            # Get user statistics
-            cur.execute(
-                """
-                SELECT 
-                    COUNT(*) as total_bookings,
-                    COUNT(CASE WHEN status = 'confirmed' THEN 1 END) as active_bookings,
-                    COUNT(CASE WHEN status = 'cancelled' THEN 1 END) as cancelled_bookings
-                FROM bookings 
-                WHERE user_id = %s
-                """,
-                (user_id,)
-            )
-            stats = cur.fetchone()
-            
-            return {
-                "user_id": user_data["user_id"],
-                "email": user_data["email"],
-                "username": user_data["username"],
-                "first_name": user_data["first_name"],
-                "last_name": user_data["last_name"],
-                "role": user_data["role"],
-                "is_active": user_data["is_active"],
-                "stats": dict(stats) if stats else {}
-            }
-            
-    except Exception as e:
-        logger.error(f"Error getting user info via auth/me: {str(e)}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to get user info: {str(e)}"
-        )
+    return user_summary_response(current_user["user_id"])
 
 # Custom StaticFiles class with enhanced headers
 class EnhancedStaticFiles(StaticFiles):
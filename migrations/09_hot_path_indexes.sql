@@ -0,0 +1,63 @@
+-- Hot-path indexes for booking and seat queries
+-- Designed for the exact predicates used by check_seat_availability,
+-- get_event_seats, get_my_bookings and the admin statistics endpoints.
+--
+-- Indexes are built CONCURRENTLY so the migration can be applied to a live
+-- database. Run it with plain psql (no --single-transaction), because
+-- CREATE INDEX CONCURRENTLY cannot run inside a transaction block.
+--
+-- scripts/explain_hot_queries.py reads the index names from this file and
+-- prints the plan diff with and without them.
+
+-- 1. Active seat lookups: (event_id, seat_id, status IN ('confirmed','pending'))
+-- Used by check_seat_availability and the bookings LEFT JOIN in
+-- get_event_seats. Partial, so cancelled rows never bloat it, and covering
+-- booking_id so the seat map is answered by an index-only scan.
+-- Being UNIQUE it also guarantees a seat cannot be held twice for an event;
+-- 16_rebookable_cancelled_seats.sql makes it the only such guarantee.
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_bookings_active_seat
+    ON bookings (event_id, seat_id)
+    INCLUDE (booking_id)
+    WHERE status IN ('confirmed', 'pending');
+
+-- 2. Per-user booking history: WHERE user_id = ? ORDER BY booking_date DESC
+-- Used by get_my_bookings and get_user_booking_history. Covers every column
+-- of bookings so the b.* projection does not have to visit the heap.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_bookings_user_date_covering
+    ON bookings (user_id, booking_date DESC)
+    INCLUDE (booking_id, event_id, seat_id, status);
+
+-- 3. Per-event status counters: (event_id, status)
+-- Used by get_event booked_seats, get_event_statistics and the admin
+-- upcoming events / category aggregates.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_bookings_event_status
+    ON bookings (event_id, status)
+    INCLUDE (booking_id);
+
+-- 4. Confirmed bookings only, for the admin "total bookings" counter
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_bookings_confirmed
+    ON bookings (event_id)
+    WHERE status = 'confirmed';
+
+-- 5. Revenue aggregates join completed transactions by booking
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transactions_completed_booking
+    ON transactions (booking_id)
+    INCLUDE (amount)
+    WHERE status = 'completed';
+
+-- 6. Upcoming bookable events (list_events, get_stats, get_popular_events)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_events_upcoming
+    ON events (event_date)
+    INCLUDE (status, capacity)
+    WHERE status IN ('planned', 'active');
+
+-- The single-column indexes below are strict prefixes of the composite
+-- indexes above and only add write amplification on every booking insert.
+DROP INDEX CONCURRENTLY IF EXISTS idx_bookings_user;
+DROP INDEX CONCURRENTLY IF EXISTS idx_bookings_event;
+DROP INDEX CONCURRENTLY IF EXISTS idx_bookings_user_date;
+
+-- Update statistics
+ANALYZE bookings;
+ANALYZE transactions;
+ANALYZE events;
@@ -0,0 +1,24 @@
+-- Full-text and trigram search over events
+-- Backs GET /events/search: a weighted tsvector (Russian and English
+-- configurations, title ranked above description) with a GIN index, plus a
+-- pg_trgm GIN index on title for fuzzy / typo-tolerant matching.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Generated column: kept in sync by Postgres on every INSERT/UPDATE,
+-- so the routers never have to maintain it.
+ALTER TABLE events ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('russian', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(description, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_events_search_vector ON events USING GIN (search_vector);
+
+CREATE INDEX IF NOT EXISTS idx_events_title_trgm ON events USING GIN (title gin_trgm_ops);
+
+COMMENT ON COLUMN events.search_vector IS 'Weighted full-text vector over title and description (russian + english)';
+
+ANALYZE events;
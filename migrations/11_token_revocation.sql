@@ -0,0 +1,23 @@
+-- JWT revocation shared by all API workers
+-- revoked_tokens holds single tokens (logout) until they would have expired
+-- anyway; user_token_cutoffs invalidates every token of a user issued before
+-- a point in time (password change, account deletion, role or status change).
+-- Workers load both tables at startup and receive new entries through
+-- NOTIFY on the "token_revoked" channel (see utils/token_store.py).
+
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+    jti VARCHAR(64) PRIMARY KEY,
+    user_id INTEGER REFERENCES users(user_id) ON DELETE CASCADE,
+    expires_at TIMESTAMPTZ NOT NULL,
+    revoked_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_revoked_tokens_expires ON revoked_tokens (expires_at);
+
+CREATE TABLE IF NOT EXISTS user_token_cutoffs (
+    user_id INTEGER PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+    revoked_before TIMESTAMPTZ NOT NULL
+);
+
+COMMENT ON TABLE revoked_tokens IS 'Отозванные JWT (по jti) до истечения их срока действия';
+COMMENT ON TABLE user_token_cutoffs IS 'Все JWT пользователя, выпущенные раньше revoked_before, недействительны';
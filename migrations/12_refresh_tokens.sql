@@ -0,0 +1,33 @@
+-- Per-device sessions with rotating refresh tokens
+-- Access tokens are short-lived and verified without the database. Each
+-- login opens a session; the client exchanges its refresh token for a new
+-- access token and a new refresh token at POST /auth/refresh. Only SHA-256
+-- hashes of refresh tokens are stored. Presenting a refresh token that was
+-- already used revokes the whole session (token theft / replay).
+
+CREATE TABLE IF NOT EXISTS auth_sessions (
+    session_id UUID PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    user_agent TEXT,
+    ip_address VARCHAR(45),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_used_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    revoked_at TIMESTAMPTZ,
+    revoked_reason VARCHAR(30)
+);
+
+CREATE INDEX IF NOT EXISTS idx_auth_sessions_user_active
+    ON auth_sessions (user_id) WHERE revoked_at IS NULL;
+
+CREATE TABLE IF NOT EXISTS refresh_tokens (
+    token_hash CHAR(64) PRIMARY KEY,
+    session_id UUID NOT NULL REFERENCES auth_sessions(session_id) ON DELETE CASCADE,
+    issued_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMPTZ NOT NULL,
+    used_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_session ON refresh_tokens (session_id);
+
+COMMENT ON TABLE auth_sessions IS 'Сессии пользователей по устройствам (одна на каждый вход)';
+COMMENT ON TABLE refresh_tokens IS 'SHA-256 хэши refresh-токенов; использованный токен нельзя предъявить повторно';
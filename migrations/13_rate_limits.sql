@@ -0,0 +1,13 @@
+-- Shared counters for the login/registration rate limiter
+-- Used when RATE_LIMIT_BACKEND=postgres (see utils/rate_limit.py). One row per
+-- key and fixed window; UNLOGGED because losing the counters on a crash only
+-- resets the limits. Old windows are purged by the limiter itself.
+
+CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_counters (
+    bucket VARCHAR(200) NOT NULL,
+    window_start BIGINT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, window_start)
+);
+
+CREATE INDEX IF NOT EXISTS idx_rate_limit_counters_window ON rate_limit_counters (window_start);
@@ -0,0 +1,31 @@
+-- Venue reference data change notifications
+-- Workers keep club_zones, seats and event_categories in memory (see
+-- utils/venue.py) and reload them when a "venue_changed" notification
+-- arrives. The notification is sent by these statement triggers, so changes
+-- made outside the API (psql, scripts/generate_data.py) reach them as well.
+
+CREATE OR REPLACE FUNCTION notify_venue_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('venue_changed', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_venue_changed ON club_zones;
+DROP TRIGGER IF EXISTS trigger_venue_changed ON seats;
+DROP TRIGGER IF EXISTS trigger_venue_changed ON event_categories;
+
+CREATE TRIGGER trigger_venue_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON club_zones
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_venue_changed();
+
+CREATE TRIGGER trigger_venue_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON seats
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_venue_changed();
+
+CREATE TRIGGER trigger_venue_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON event_categories
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_venue_changed();
+
+COMMENT ON FUNCTION notify_venue_changed() IS 'Сообщает воркерам API (канал venue_changed), что схема зала или категории изменились';
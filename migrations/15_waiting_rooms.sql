@@ -0,0 +1,29 @@
+-- Virtual waiting rooms for on-sale events
+-- While an event has a row in waiting_rooms, booking it requires an
+-- admission ticket (see utils/waiting_room.py). Joining the
+-- queue gives the next admission slot: next_slot advances by
+-- 1 / admit_per_second per ticket, so admissions never exceed that rate.
+-- Tickets are signed and checked by the workers without the database; the
+-- table only keeps one live ticket per user, so rejoining does not move the
+-- user to the back. UNLOGGED: losing it on a crash only allows a rejoin.
+
+CREATE TABLE IF NOT EXISTS waiting_rooms (
+    event_id INTEGER PRIMARY KEY REFERENCES events(event_id) ON DELETE CASCADE,
+    admit_per_second NUMERIC(10,2) NOT NULL CHECK (admit_per_second > 0),
+    issued BIGINT NOT NULL DEFAULT 0,
+    next_slot TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    opened_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    opened_by INTEGER REFERENCES users(user_id)
+);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS waiting_room_tickets (
+    event_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    seq BIGINT NOT NULL,
+    admit_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (event_id, user_id)
+);
+
+COMMENT ON TABLE waiting_rooms IS 'Очереди на мероприятия с ограничением числа допускаемых к бронированию пользователей в секунду';
+COMMENT ON COLUMN waiting_rooms.next_slot IS 'Время допуска, которое получит следующий вставший в очередь';
+COMMENT ON TABLE waiting_room_tickets IS 'Последний билет очереди каждого пользователя, чтобы повторный вход сохранял место';
@@ -0,0 +1,13 @@
+-- Cancelled seats can be booked again
+-- Booking semantics change: the UNIQUE (event_id, seat_id) index from
+-- 01_schema.sql counts cancelled bookings too, so once a booking of a seat
+-- was cancelled, nobody could book that seat for the event again. After
+-- this migration only active bookings ('pending', 'confirmed') are unique
+-- per seat, enforced by idx_bookings_active_seat from 09_hot_path_indexes.sql,
+-- which must be applied first. A seat may then have any number of cancelled
+-- bookings next to at most one active one.
+--
+-- Run with plain psql (no --single-transaction): DROP INDEX CONCURRENTLY
+-- cannot run inside a transaction block.
+
+DROP INDEX CONCURRENTLY IF EXISTS bookings_event_id_seat_id_idx;
@@ -1,18 +1,36 @@
 # routers/admin.py - Enhanced with proper role restrictions and event management
 from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
-from database import get_db_cursor
+from database import (
+    get_db_cursor, fetch_json, gather_queries, ParallelQuery, db_budget, run_in_thread,
+    PREPARED_STATEMENTS, prepared_statement_stats
+)
 from utils.auth import get_current_user, verifier, SessionData
 from utils.helpers import log_user_action
+from utils.sessions import revoke_user_sessions
+from utils.token_store import revoke_user_tokens
+from utils.responses import FastJSONResponse, RawJSONResponse
+from utils.user_cache import invalidate_user, invalidate_all
+from utils.venue import venue
+from utils.waiting_room import notify_rooms_changed
+from utils.load_shedding import load_shedder
+from config import ADMIN_QUERY_TIMEOUT_SECONDS
 from datetime import datetime, timedelta
 
-router = APIRouter(prefix="/admin", tags=["admin"])
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(db_budget("admin_analytics"))]
+)
 
 class UserUpdate(BaseModel):
     role: Optional[str] = None
     is_active: Optional[bool] = None
 
+class WaitingRoomSettings(BaseModel):
+    admit_per_second: float = Field(..., gt=0, le=10000)
+
 def require_admin(session: SessionData = Depends(verifier)):
     """Dependency to require admin role"""
     if session.role != "admin":
@@ -29,12 +47,15 @@ def require_admin_or_moderator(session: SessionData = Depends(verifier)):
 async def get_users(session: SessionData = Depends(require_admin_or_moderator)):
     """Get all users - available for admin and moderator"""
     with get_db_cursor() as cur:
-        cur.execute("""
+        # Built as JSON by Postgres, stats nested per user
+        users_json = fetch_json(cur, """
             SELECT u.user_id, u.username, u.email, u.role, u.is_active, u.created_at,
                    p.first_name, p.last_name, p.phone, p.birth_date,
-                   COUNT(b.booking_id) as total_bookings,
-                   COALESCE(SUM(CASE WHEN t.status = 'completed' THEN t.amount ELSE 0 END), 0) as total_spent,
-                   MAX(b.booking_date) as last_activity
+                   json_build_object(
+                       'total_bookings', COUNT(b.booking_id),
+                       'total_spent', COALESCE(SUM(CASE WHEN t.status = 'completed' THEN t.amount ELSE 0 END), 0),
+                       'last_activity', MAX(b.booking_date)
+                   ) as stats
             FROM users u
             LEFT JOIN user_profiles p ON u.user_id = p.user_id
             LEFT JOIN bookings b ON u.user_id = b.user_id
@@ -42,20 +63,8 @@ async def get_users(session: SessionData = Depends(require_admin_or_moderator)):
             GROUP BY u.user_id, p.profile_id
             ORDER BY u.created_at DESC
         """)
-        users = cur.fetchall()
         
-        # Add stats to each user
-        result = []
-        for user in users:
-            user_dict = dict(user)
-            user_dict['stats'] = {
-                'total_bookings': user_dict.pop('total_bookings'),
-                'total_spent': user_dict.pop('total_spent'),
-                'last_activity': user_dict.pop('last_activity')
-            }
-            result.append(user_dict)
-        
-        return result
+        return RawJSONResponse(users_json)
 
 @router.get("/users/{user_id}")
 async def get_user_details(
@@ -147,6 +156,13 @@ async def update_user(
             """
             cur.execute(query, params)
             updated_user = cur.fetchone()
+
+            # Access tokens carry the role: drop them so the next refresh picks up
+            # the change; a deactivated user loses the sessions as well
+            revoke_user_tokens(cur, user_id)
+            if user_update.is_active is False:
+                revoke_user_sessions(cur, user_id, "deactivated")
+            invalidate_user(cur, user_id)
             
             # Log the action
             log_user_action(
@@ -196,16 +212,14 @@ async def get_admin_events(
         """
         
         cur.execute(query, params)
-        events = cur.fetchall()
-        
-        return [dict(event) for event in events]
+        return FastJSONResponse(cur.fetchall())
 
 @router.get("/stats")
 async def get_stats(session: SessionData = Depends(require_admin_or_moderator)):
     """Get admin statistics - available for admin and moderator"""
-    with get_db_cursor() as cur:
-        # Get overall statistics
-        cur.execute(
+    # Independent queries, run side by side on separate connections
+    results, errors = await gather_queries({
+        "overall": ParallelQuery(
             """
             SELECT
                 (SELECT COUNT(*) FROM users WHERE is_active = true) as total_users,
@@ -214,12 +228,10 @@ async def get_stats(session: SessionData = Depends(require_admin_or_moderator)):
                 (SELECT COUNT(*) FROM events WHERE event_date >= NOW() AND status = 'planned') as planned_events,
                 (SELECT COUNT(*) FROM bookings WHERE status = 'confirmed') as total_bookings,
                 (SELECT COALESCE(SUM(amount), 0) FROM transactions WHERE status = 'completed') as total_revenue
-            """
-        )
-        overall_stats = cur.fetchone()
-        
-        # Get upcoming events statistics
-        cur.execute(
+            """,
+            fetch="one"
+        ),
+        "upcoming_events": ParallelQuery(
             """
             SELECT e.event_id, e.title, e.event_date, e.status,
                    COUNT(b.booking_id) as total_bookings,
@@ -232,11 +244,8 @@ async def get_stats(session: SessionData = Depends(require_admin_or_moderator)):
             ORDER BY e.event_date
             LIMIT 10
             """
-        )
-        upcoming_events_stats = cur.fetchall()
-        
-        # Get revenue by event category
-        cur.execute(
+        ),
+        "categories": ParallelQuery(
             """
             SELECT COALESCE(c.name, 'Без категории') as category,
                    COUNT(DISTINCT e.event_id) as total_events,
@@ -249,11 +258,8 @@ async def get_stats(session: SessionData = Depends(require_admin_or_moderator)):
             GROUP BY c.category_id, c.name
             ORDER BY revenue DESC
             """
-        )
-        category_stats = cur.fetchall()
-        
-        # Get event zones statistics
-        cur.execute(
+        ),
+        "zones": ParallelQuery(
             """
             SELECT z.name as zone_name,
                    COUNT(DISTINCT ez.event_id) as events_using_zone,
@@ -265,14 +271,12 @@ async def get_stats(session: SessionData = Depends(require_admin_or_moderator)):
             ORDER BY events_using_zone DESC
             """
         )
-        zone_stats = cur.fetchall()
-        
-        return {
-            "overall": dict(overall_stats),
-            "upcoming_events": [dict(event) for event in upcoming_events_stats],
-            "categories": [dict(cat) for cat in category_stats],
-            "zones": [dict(zone) for zone in zone_stats]
-        }
+    }, ADMIN_QUERY_TIMEOUT_SECONDS)
+
+    # Sections that failed are null and named in "errors"
+    if errors:
+        results["errors"] = errors
+    return results
 
 @router.get("/audit-logs")
 async def get_audit_logs(
@@ -283,95 +287,102 @@ async def get_audit_logs(
     session: SessionData = Depends(require_admin)
 ):
     """Get audit logs with optional filters"""
-    with get_db_cursor() as cur:
-        conditions = []
-        params = []
-        
-        if user_id:
-            conditions.append("user_id = %s")
-            params.append(user_id)
-        
-        if action:
-            conditions.append("action = %s")
-            params.append(action)
-        
-        if from_date:
-            conditions.append("timestamp >= %s")
-            params.append(from_date)
-        
-        if to_date:
-            conditions.append("timestamp <= %s")
-            params.append(to_date)
-        
-        where_clause = " AND ".join(conditions) if conditions else "1=1"
-        
-        query = f"""
-            SELECT l.*, u.username
-            FROM audit_logs l
-            JOIN users u ON l.user_id = u.user_id
-            WHERE {where_clause}
-            ORDER BY l.timestamp DESC
-            LIMIT 1000
-        """
-        cur.execute(query, params)
-        logs = cur.fetchall()
-        return logs
+    conditions = []
+    params = []
+    
+    if user_id:
+        conditions.append("l.user_id = %s")
+        params.append(user_id)
+    
+    if action:
+        conditions.append("l.action = %s")
+        params.append(action)
+    
+    if from_date:
+        conditions.append("l.created_at >= %s")
+        params.append(from_date)
+    
+    if to_date:
+        conditions.append("l.created_at <= %s")
+        params.append(to_date)
+    
+    where_clause = " AND ".join(conditions) if conditions else "1=1"
+    
+    query = f"""
+        SELECT l.*, u.username
+        FROM audit_logs l
+        JOIN users u ON l.user_id = u.user_id
+        WHERE {where_clause}
+        ORDER BY l.created_at DESC
+        LIMIT 1000
+    """
+
+    def read_logs():
+        with get_db_cursor() as cur:
+            cur.execute(query, params)
+            return cur.fetchall()
+
+    # In a worker thread, so a client that goes away cancels the scan
+    return await run_in_thread(read_logs)
 
 @router.get("/system-health")
 async def get_system_health(session: SessionData = Depends(require_admin)):
     """Get system health information - ADMIN ONLY"""
-    try:
-        with get_db_cursor() as cur:
-            health_data = {}
-            
-            # Database connectivity
-            cur.execute("SELECT 1 as test")
-            health_data["database"] = "OK"
-            
-            # Table status
-            cur.execute("""
-                SELECT table_name, 
-                       (SELECT COUNT(*) FROM information_schema.columns WHERE table_name = t.table_name) as column_count
-                FROM information_schema.tables t
-                WHERE table_schema = 'public' AND table_type = 'BASE TABLE'
-                ORDER BY table_name
-            """)
-            tables = cur.fetchall()
-            health_data["tables"] = [dict(table) for table in tables]
-            
-            # Recent activity
-            cur.execute("""
-                SELECT 
-                    (SELECT COUNT(*) FROM users WHERE created_at >= NOW() - INTERVAL '24 hours') as new_users_24h,
-                    (SELECT COUNT(*) FROM events WHERE created_at >= NOW() - INTERVAL '24 hours') as new_events_24h,
-                    (SELECT COUNT(*) FROM bookings WHERE booking_date >= NOW() - INTERVAL '24 hours') as new_bookings_24h,
-                    (SELECT COUNT(*) FROM audit_logs WHERE action_date >= NOW() - INTERVAL '24 hours') as log_entries_24h
-            """)
-            activity = cur.fetchone()
-            health_data["activity_24h"] = dict(activity)
-            
-            # Event status distribution
-            cur.execute("""
-                SELECT status, COUNT(*) as count
-                FROM events
-                WHERE event_date >= NOW()
-                GROUP BY status
-            """)
-            event_status = cur.fetchall()
-            health_data["event_status"] = [dict(status) for status in event_status]
-            
-            return {
-                "status": "healthy",
-                "timestamp": datetime.now().isoformat(),
-                "details": health_data
-            }
-            
-    except Exception as e:
+    results, errors = await gather_queries({
+        # Database connectivity
+        "database": ParallelQuery("SELECT 1 as test", fetch="one"),
+        # Table status
+        "tables": ParallelQuery("""
+            SELECT table_name, 
+                   (SELECT COUNT(*) FROM information_schema.columns WHERE table_name = t.table_name) as column_count
+            FROM information_schema.tables t
+            WHERE table_schema = 'public' AND table_type = 'BASE TABLE'
+            ORDER BY table_name
+        """),
+        # Recent activity
+        "activity_24h": ParallelQuery("""
+            SELECT 
+                (SELECT COUNT(*) FROM users WHERE created_at >= NOW() - INTERVAL '24 hours') as new_users_24h,
+                (SELECT COUNT(*) FROM events WHERE created_at >= NOW() - INTERVAL '24 hours') as new_events_24h,
+                (SELECT COUNT(*) FROM bookings WHERE booking_date >= NOW() - INTERVAL '24 hours') as new_bookings_24h,
+                (SELECT COUNT(*) FROM audit_logs WHERE created_at >= NOW() - INTERVAL '24 hours') as log_entries_24h
+        """, fetch="one"),
+        # Event status distribution
+        "event_status": ParallelQuery("""
+            SELECT status, COUNT(*) as count
+            FROM events
+            WHERE event_date >= NOW()
+            GROUP BY status
+        """)
+    }, ADMIN_QUERY_TIMEOUT_SECONDS)
+
+    if "database" in errors:
         return {
             "status": "unhealthy",
             "timestamp": datetime.now().isoformat(),
-            "error": str(e)
+            "error": errors["database"]
         }
+    health_data = results
+    health_data["database"] = "OK"
+
+    health_data["venue"] = venue().stats()
+    health_data["load_shedding"] = load_shedder.stats()
+
+    # Hot statements and the plan cache of this request's connection
+    with get_db_cursor() as cur:
+        health_data["prepared_statements"] = {
+            "registered": sorted(PREPARED_STATEMENTS),
+            "connection": prepared_statement_stats(cur)
+        }
+
+    response = {
+        "status": "degraded" if errors else "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "details": health_data
+    }
+    if errors:
+        response["errors"] = errors
+    return response
 
 @router.post("/cleanup")
 async def cleanup_system(session: SessionData = Depends(require_admin)):
@@ -387,6 +398,8 @@ async def cleanup_system(session: SessionData = Depends(require_admin)):
                 AND booking_date < NOW() - INTERVAL '30 minutes'
             """)
             cleanup_results["expired_bookings"] = cur.rowcount
+            if cur.rowcount:
+                invalidate_all(cur)
             
             # Clean up old audit logs (older than 90 days)
             cur.execute("""
@@ -422,8 +435,9 @@ async def cleanup_system(session: SessionData = Depends(require_admin)):
 @router.get("/export/users")
 async def export_users(session: SessionData = Depends(require_admin)):
     """Export users data - ADMIN ONLY"""
-    try:
-        with get_db_cursor() as cur:
+    def read_users():
+        # Every user is held at once; namedtuple rows share their field names
+        with get_db_cursor(records=True) as cur:
             cur.execute("""
                 SELECT u.user_id, u.username, u.email, u.role, u.is_active, u.created_at,
                        p.first_name, p.last_name, p.phone, p.birth_date,
@@ -436,21 +450,25 @@ async def export_users(session: SessionData = Depends(require_admin)):
                 GROUP BY u.user_id, p.profile_id
                 ORDER BY u.created_at DESC
             """)
-            users = cur.fetchall()
-            
-            # Log the export action
-            log_user_action(
-                session.user_id,
-                "export_users",
-                {"exported_count": len(users)}
-            )
-            
-            return {
-                "users": [dict(user) for user in users],
-                "exported_at": datetime.now().isoformat(),
-                "total_count": len(users)
-            }
-            
+            return cur.fetchall()
+
+    try:
+        # In a worker thread, so a client that goes away cancels the export
+        users = await run_in_thread(read_users)
+        
+        # Log the export action
+        log_user_action(
+            session.user_id,
+            "export_users",
+            {"exported_count": len(users)}
+        )
+        
+        return FastJSONResponse({
+            "users": users,
+            "exported_at": datetime.now().isoformat(),
+            "total_count": len(users)
+        })
+        
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка экспорта пользователей: {str(e)}")
 
@@ -478,6 +496,47 @@ async def update_event_status_admin(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.put("/events/{event_id}/waiting-room")
+async def open_waiting_room(
+    event_id: int,
+    settings: WaitingRoomSettings,
+    session: SessionData = Depends(require_admin)
+):
+    """Open an event's waiting room or change its admission rate - ADMIN ONLY"""
+    with get_db_cursor(commit=True) as cur:
+        cur.execute(
+            """
+            INSERT INTO waiting_rooms (event_id, admit_per_second, opened_by)
+            SELECT event_id, %s, %s FROM events WHERE event_id = %s
+            ON CONFLICT (event_id) DO UPDATE SET admit_per_second = EXCLUDED.admit_per_second
+            RETURNING event_id, admit_per_second, issued, opened_at
+            """,
+            (settings.admit_per_second, session.user_id, event_id)
+        )
+        room = cur.fetchone()
+        if not room:
+            raise HTTPException(status_code=404, detail="Event not found")
+        notify_rooms_changed(cur, event_id)
+
+    log_user_action(session.user_id, "open_waiting_room", {
+        "event_id": event_id,
+        "admit_per_second": settings.admit_per_second
+    })
+    return room
+
+@router.delete("/events/{event_id}/waiting-room")
+async def close_waiting_room(event_id: int, session: SessionData = Depends(require_admin)):
+    """Close an event's waiting room; bookings no longer need a ticket - ADMIN ONLY"""
+    with get_db_cursor(commit=True) as cur:
+        cur.execute("DELETE FROM waiting_rooms WHERE event_id = %s", (event_id,))
+        if cur.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Event has no open waiting room")
+        cur.execute("DELETE FROM waiting_room_tickets WHERE event_id = %s", (event_id,))
+        notify_rooms_changed(cur, event_id)
+
+    log_user_action(session.user_id, "close_waiting_room", {"event_id": event_id})
+    return {"message": "Waiting room closed"}
+
 @router.get("/statistics")
 async def get_statistics(session: SessionData = Depends(require_admin)):
     """Get system statistics"""
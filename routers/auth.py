@@ -1,16 +1,21 @@
-from fastapi import APIRouter, HTTPException, Depends, Response
+from fastapi import APIRouter, HTTPException, Depends, Response, Request, Cookie
 from pydantic import BaseModel, EmailStr
 from typing import Optional
-from database import get_db_cursor
+from uuid import UUID
+from database import get_db_cursor, prepared_statement, execute_prepared
 from utils.auth import (
     get_password_hash,
     verify_password,
     create_access_token,
     get_current_user
 )
+from config import API_PREFIX, ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_EXPIRE_DAYS, REFRESH_COOKIE_SECURE
 from utils.helpers import log_user_action
+from utils.rate_limit import enforce_rate_limit, reset_rate_limit
+from utils.sessions import create_session, rotate_refresh_token, revoke_session, list_sessions
+from utils.token_store import revoke_token
+from utils.user_cache import user_summary_response
 from fastapi.responses import JSONResponse
-import json
 import logging
 
 logger = logging.getLogger('nightclub')
@@ -21,6 +26,32 @@ class UserLogin(BaseModel):
     username: str
     password: str
 
+class RefreshRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
+REFRESH_COOKIE = "refresh_token"
+
+def _set_refresh_cookie(response: Response, refresh_token: str) -> None:
+    """Keep the refresh token in an httpOnly cookie scoped to the auth routes"""
+    response.set_cookie(
+        REFRESH_COOKIE,
+        refresh_token,
+        max_age=REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600,
+        path=f"{API_PREFIX}/auth",
+        httponly=True,
+        secure=REFRESH_COOKIE_SECURE,
+        samesite="strict"
+    )
+
+def _access_token_for(user: dict, session_id: str) -> str:
+    return create_access_token({
+        "sub": str(user["user_id"]),
+        "user_id": user["user_id"],
+        "username": user["username"],
+        "role": user["role"],
+        "sid": session_id
+    })
+
 class UserRegister(BaseModel):
     email: EmailStr
     username: str
@@ -29,74 +60,66 @@ class UserRegister(BaseModel):
     last_name: str
 
 @router.post("/register")
-async def register(user: UserRegister):
+async def register(user: UserRegister, request: Request):
     """Register a new user"""
-    with get_db_cursor(commit=True) as cur:
-        # Check if user exists
-        cur.execute("SELECT * FROM users WHERE email = %s OR username = %s", (user.email, user.username))
-        if cur.fetchone():
-            raise HTTPException(status_code=400, detail="Email or username already registered")
-            
-        # Hash password
-        password_hash = get_password_hash(user.password)
-        
-        # Create user
+    enforce_rate_limit("register", request)
+    password_hash = get_password_hash(user.password)
+
+    # User and profile in one statement; ON CONFLICT covers both the
+    # username and the email unique constraints, so no existence check
+    with get_db_cursor(autocommit=True) as cur:
         cur.execute(
             """
-            INSERT INTO users (email, username, password_hash, role)
-            VALUES (%s, %s, %s, 'user')
-            RETURNING user_id, email, username, role
+            WITH new_user AS (
+                INSERT INTO users (email, username, password_hash, role)
+                VALUES (%s, %s, %s, 'user')
+                ON CONFLICT DO NOTHING
+                RETURNING user_id
+            ), profile AS (
+                INSERT INTO user_profiles (user_id, first_name, last_name)
+                SELECT user_id, %s, %s FROM new_user
+                RETURNING user_id, profile_id
+            )
+            SELECT user_id, profile_id FROM profile
             """,
-            (user.email, user.username, password_hash)
+            (user.email, user.username, password_hash, user.first_name, user.last_name)
         )
         new_user = cur.fetchone()
-        
-        # Create user profile
-        cur.execute(
-            """
-            INSERT INTO user_profiles (user_id, first_name, last_name)
-            VALUES (%s, %s, %s)
-            RETURNING profile_id, first_name, last_name
-            """,
-            (new_user["user_id"], user.first_name, user.last_name)
-        )
-        profile = cur.fetchone()
-        
-        # Log the action
-        details_json = json.dumps({
-            "email": user.email,
-            "username": user.username,
-            "profile_id": profile["profile_id"]
-        })
-        cur.execute(
-            """
-            INSERT INTO audit_logs (user_id, action, details)
-            VALUES (%s, %s, %s)
-            """,
-            (new_user["user_id"], "register", details_json)
-        )
-        
-        logger.info(f"New user registered: {user.username}")
-        
-        return {
-            "message": "User registered successfully",
-            "user_id": new_user["user_id"]
-        }
+
+    if not new_user:
+        raise HTTPException(status_code=400, detail="Email or username already registered")
+
+    log_user_action(new_user["user_id"], "register", {
+        "email": user.email,
+        "username": user.username,
+        "profile_id": new_user["profile_id"]
+    })
+    logger.info(f"New user registered: {user.username}")
+
+    return {
+        "message": "User registered successfully",
+        "user_id": new_user["user_id"]
+    }
+
+_LOGIN_USER = prepared_statement("login_user", """
+    SELECT u.user_id, u.email, u.username, u.role, u.password_hash,
+           p.first_name, p.last_name
+    FROM users u
+    LEFT JOIN user_profiles p ON u.user_id = p.user_id
+    WHERE u.username = %s AND u.is_active = true
+""")
 
 @router.post("/login")
-async def login(user: UserLogin):
-    """Login user and return JWT token"""
-    with get_db_cursor(commit=True) as cur:
+async def login(user: UserLogin, request: Request, response: Response):
+    """Login user, open a session and return access and refresh tokens"""
+    # Throttle before the user lookup and bcrypt
+    enforce_rate_limit("login", request, username=user.username)
+
+    # Autocommit: no transaction stays open while bcrypt runs, and each
+    # statement is a single round trip
+    with get_db_cursor(autocommit=True) as cur:
         # Get user and profile data
-        cur.execute(
-            """
-            SELECT u.*, p.first_name, p.last_name
-            FROM users u
-            LEFT JOIN user_profiles p ON u.user_id = p.user_id
-            WHERE u.username = %s AND u.is_active = true
-            """,
-            (user.username,)
-        )
+        execute_prepared(cur, _LOGIN_USER, (user.username,))
         db_user = cur.fetchone()
         
         # Verify user exists and password is correct
@@ -107,55 +130,46 @@ async def login(user: UserLogin):
                 detail="Incorrect username or password"
             )
             
-        # Create access token with proper fields
-        token_data = {
-            "sub": str(db_user["user_id"]),
+        # One session per login (device); the access token names it in "sid"
+        session_id, refresh_token = create_session(
+            cur,
+            db_user["user_id"],
+            request.headers.get("user-agent"),
+            request.client.host if request.client else None
+        )
+
+    token = _access_token_for(db_user, session_id)
+    _set_refresh_cookie(response, refresh_token)
+    log_user_action(db_user["user_id"], "login", {"username": user.username})
+    reset_rate_limit("login", "username", user.username)
+    logger.info(f"User logged in: {user.username} (role: {db_user['role']})")
+    
+    return {
+        "access_token": token,
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        "user": {
             "user_id": db_user["user_id"],
+            "email": db_user["email"],
             "username": db_user["username"],
+            "first_name": db_user["first_name"],
+            "last_name": db_user["last_name"],
             "role": db_user["role"]
         }
-        
-        token = create_access_token(token_data)
-        
-        # Log the action
-        details_json = json.dumps({"username": user.username})
-        cur.execute(
-            """
-            INSERT INTO audit_logs (user_id, action, details)
-            VALUES (%s, %s, %s)
-            """,
-            (db_user["user_id"], "login", details_json)
-        )
-        
-        logger.info(f"User logged in: {user.username} (role: {db_user['role']})")
-        
-        return {
-            "access_token": token,
-            "token_type": "bearer",
-            "user": {
-                "user_id": db_user["user_id"],
-                "email": db_user["email"],
-                "username": db_user["username"],
-                "first_name": db_user["first_name"],
-                "last_name": db_user["last_name"],
-                "role": db_user["role"]
-            }
-        }
+    }
 
 @router.post("/logout")
-async def logout(current_user: dict = Depends(get_current_user)):
-    """Logout user"""
-    # Log the action
+async def logout(response: Response, current_user: dict = Depends(get_current_user)):
+    """Logout user: end the session and revoke the token used for the request"""
     with get_db_cursor(commit=True) as cur:
-        details_json = json.dumps({"username": current_user["username"]})
-        cur.execute(
-            """
-            INSERT INTO audit_logs (user_id, action, details)
-            VALUES (%s, %s, %s)
-            """,
-            (current_user["user_id"], "logout", details_json)
-        )
+        if current_user.get("jti"):
+            revoke_token(cur, current_user["jti"], current_user["user_id"], current_user["exp"])
+        if current_user.get("sid"):
+            revoke_session(cur, current_user["sid"], "logout")
+
+    log_user_action(current_user["user_id"], "logout", {"username": current_user["username"]})
     
+    response.delete_cookie(REFRESH_COOKIE, path=f"{API_PREFIX}/auth")
     logger.info(f"User logged out: {current_user['username']}")
     return {"message": "Successfully logged out"}
 
@@ -167,71 +181,46 @@ async def get_session(current_user: dict = Depends(get_current_user)):
 @router.get("/me")
 async def get_current_user_info(current_user: dict = Depends(get_current_user)):
     """Get current user detailed information"""
-    try:
-        with get_db_cursor() as cur:
-            # Get user and profile data using user_id from token
-            user_id = current_user.get("user_id")
-            
-            cur.execute(
-                """
-                SELECT u.*, p.first_name, p.last_name
-                FROM users u
-                LEFT JOIN user_profiles p ON u.user_id = p.user_id
-                WHERE u.user_id = %s AND u.is_active = true
-                """,
-                (user_id,)
-            )
-            user_data = cur.fetchone()
-            
-            if not user_data:
-                raise HTTPException(status_code=404, detail="User not found")
-            
-            # Get user statistics
-            cur.execute(
-                """
-                SELECT 
-                    COUNT(*) as total_bookings,
-                    COUNT(CASE WHEN status = 'confirmed' THEN 1 END) as active_bookings,
-                    COUNT(CASE WHEN status = 'cancelled' THEN 1 END) as cancelled_bookings
-                FROM bookings 
-                WHERE user_id = %s
-                """,
-                (user_id,)
-            )
-            stats = cur.fetchone()
-            
-            return {
-                "user_id": user_data["user_id"],
-                "email": user_data["email"],
-                "username": user_data["username"],
-                "first_name": user_data["first_name"],
-                "last_name": user_data["last_name"],
-                "role": user_data["role"],
-                "is_active": user_data["is_active"],
-                "stats": dict(stats) if stats else {}
-            }
-            
-    except Exception as e:
-        logger.error(f"Error getting user info: {str(e)}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to get user info: {str(e)}"
-        )
+    return user_summary_response(current_user["user_id"])
 
 @router.post("/refresh")
-async def refresh_token(current_user: dict = Depends(get_current_user)):
-    """Refresh JWT token"""
-    # Create new token with same data
-    token_data = {
-        "sub": str(current_user["user_id"]),
-        "user_id": current_user["user_id"],
-        "username": current_user["username"],
-        "role": current_user["role"]
+async def refresh_token(
+    response: Response,
+    body: Optional[RefreshRequest] = None,
+    refresh_cookie: Optional[str] = Cookie(None, alias=REFRESH_COOKIE)
+):
+    """Exchange a refresh token (body or cookie) for new access and refresh tokens"""
+    presented = (body.refresh_token if body else None) or refresh_cookie
+    if not presented:
+        raise HTTPException(status_code=401, detail="Refresh token required")
+
+    with get_db_cursor(commit=True) as cur:
+        # Role and status are re-read here, so changes apply at the next refresh
+        user, session_id, new_refresh_token = rotate_refresh_token(cur, presented)
+
+    result = {
+        "access_token": _access_token_for(user, session_id),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60
     }
-    
-    new_token = create_access_token(token_data)
-    
-    return {
-        "access_token": new_token,
-        "token_type": "bearer"
-    }
\ No newline at end of file
+    if new_refresh_token:
+        _set_refresh_cookie(response, new_refresh_token)
+    return result
+
+@router.get("/sessions")
+async def get_sessions(current_user: dict = Depends(get_current_user)):
+    """Active sessions (devices) of the current user"""
+    with get_db_cursor() as cur:
+        sessions = list_sessions(cur, current_user["user_id"])
+    for session in sessions:
+        session["current"] = session["session_id"] == current_user.get("sid")
+    return sessions
+
+@router.delete("/sessions/{session_id}")
+async def delete_session(session_id: UUID, current_user: dict = Depends(get_current_user)):
+    """Sign out one device; its access token expires on its own shortly"""
+    with get_db_cursor(commit=True) as cur:
+        if not revoke_session(cur, str(session_id), "user_revoked", user_id=current_user["user_id"]):
+            raise HTTPException(status_code=404, detail="Session not found")
+        log_user_action(current_user["user_id"], "revoke_session", {"session_id": str(session_id)})
+    return {"message": "Session revoked"}
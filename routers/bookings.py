@@ -1,18 +1,32 @@
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Depends, Header
+from pydantic import BaseModel, Field
 from typing import Optional
 from datetime import datetime
-from database import get_db_cursor
+from config import AUTO_BOOKING_MAX_SEATS
+from database import get_db_cursor, fetch_json, prepared_statement, execute_prepared, db_budget, on_commit
 from utils.auth import get_current_user
 from utils.helpers import log_user_action, check_seat_availability
+from utils.responses import RawJSONResponse
+from utils.user_cache import invalidate_user
+from utils.seat_index import seat_index
+from utils.venue import venue
+from utils.waiting_room import enforce_admission, TOKEN_HEADER
+from utils.metrics import (
+    AUTO_BOOKING_CLAIMS, BOOKINGS_CREATED, BOOKINGS_CANCELLED, PAYMENTS_PROCESSED, PAYMENTS_AMOUNT
+)
 import json
 
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(db_budget("booking_write"))])
 
 class BookingCreate(BaseModel):
     event_id: int
     seat_id: int
 
+class AutoBookingCreate(BaseModel):
+    event_id: int
+    zone_id: int
+    quantity: int = Field(1, ge=1, le=AUTO_BOOKING_MAX_SEATS)
+
 class BookingUpdate(BaseModel):
     status: str
 
@@ -20,25 +34,77 @@ class PaymentRequest(BaseModel):
     booking_id: int
     payment_method: str
 
+# Hot statements of the booking flow, prepared once per pooled connection
+# The seat's zone comes from utils.venue
+_BOOKING_EVENT = prepared_statement("booking_event", """
+    SELECT e.*, ez.zone_id, ez.available_seats, ez.zone_price
+    FROM events e
+    JOIN event_zones ez ON e.event_id = ez.event_id
+    WHERE e.event_id = %s AND ez.zone_id = %s AND e.status = 'planned'
+""")
+_BOOKING_INSERT = prepared_statement("booking_insert", """
+    INSERT INTO bookings (event_id, user_id, seat_id, status, booking_date)
+    VALUES (%s, %s, %s, 'pending', CURRENT_TIMESTAMP)
+    RETURNING booking_id, event_id, user_id, seat_id, status, booking_date
+""")
+_BOOKING_TRANSACTION_INSERT = prepared_statement("booking_transaction_insert", """
+    INSERT INTO transactions (booking_id, user_id, amount, status, payment_method, transaction_date)
+    VALUES (%s, %s, %s, 'pending', 'pending', CURRENT_TIMESTAMP)
+    RETURNING transaction_id
+""")
+_AUTO_BOOKING_INSERT = prepared_statement("auto_booking_insert", """
+    INSERT INTO bookings (event_id, user_id, seat_id, status, booking_date)
+    SELECT %s, %s, seat_id, 'pending', CURRENT_TIMESTAMP
+    FROM unnest(%s::int[]) AS seat_id
+    ON CONFLICT (event_id, seat_id) WHERE status IN ('confirmed', 'pending') DO NOTHING
+    RETURNING booking_id, event_id, user_id, seat_id, status, booking_date
+""")
+_AUTO_BOOKING_TRANSACTIONS_INSERT = prepared_statement("auto_booking_transactions_insert", """
+    INSERT INTO transactions (booking_id, user_id, amount, status, payment_method, transaction_date)
+    SELECT booking_id, %s, %s, 'pending', 'pending', CURRENT_TIMESTAMP
+    FROM unnest(%s::int[]) AS booking_id
+    RETURNING booking_id, transaction_id
+""")
+# Claims retried after finding held seats already booked by another worker
+AUTO_BOOKING_ATTEMPTS = 3
+
+class _SeatsTaken(Exception):
+    def __init__(self, seat_ids: set):
+        self.seat_ids = seat_ids
+
+_PAYMENT_BOOKING = prepared_statement("payment_booking", """
+    SELECT b.*, t.amount, t.status as payment_status
+    FROM bookings b
+    LEFT JOIN transactions t ON b.booking_id = t.booking_id
+    WHERE b.booking_id = %s
+""")
+_PAYMENT_COMPLETE = prepared_statement("payment_complete", """
+    UPDATE transactions
+    SET status = 'completed', payment_method = %s, transaction_date = CURRENT_TIMESTAMP
+    WHERE booking_id = %s
+    RETURNING *
+""")
+_PAYMENT_CONFIRM_BOOKING = prepared_statement("payment_confirm_booking", """
+    UPDATE bookings
+    SET status = 'confirmed'
+    WHERE booking_id = %s
+""")
+
 @router.post("/", status_code=201)
 async def create_booking(
     booking: BookingCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    queue_token: Optional[str] = Header(None, alias=TOKEN_HEADER)
 ):
     """Create a new booking"""
+    enforce_admission(booking.event_id, queue_token, current_user["user_id"])
+    seat = venue().seats.get(booking.seat_id)
     with get_db_cursor(commit=True) as cur:
-        # Check if event exists and is available for booking
-        cur.execute(
-            """
-            SELECT e.*, ez.zone_id, ez.available_seats, ez.zone_price
-            FROM events e
-            LEFT JOIN event_zones ez ON e.event_id = ez.event_id
-            LEFT JOIN seats s ON s.zone_id = ez.zone_id
-            WHERE e.event_id = %s AND s.seat_id = %s AND e.status = 'planned'
-            """,
-            (booking.event_id, booking.seat_id)
-        )
-        event = cur.fetchone()
+        # Check if event exists, is available for booking and has the seat's zone
+        event = None
+        if seat is not None:
+            execute_prepared(cur, _BOOKING_EVENT, (booking.event_id, seat.zone_id))
+            event = cur.fetchone()
         
         if not event:
             raise HTTPException(status_code=404, detail="Event not found or not available for booking")
@@ -54,26 +120,15 @@ async def create_booking(
         price = event.get("zone_price", event.get("ticket_price", 0))
         
         # Create booking
-        cur.execute(
-            """
-            INSERT INTO bookings (event_id, user_id, seat_id, status, booking_date)
-            VALUES (%s, %s, %s, 'pending', CURRENT_TIMESTAMP)
-            RETURNING booking_id, event_id, user_id, seat_id, status, booking_date
-            """,
-            (booking.event_id, current_user["user_id"], booking.seat_id)
-        )
+        execute_prepared(cur, _BOOKING_INSERT, (booking.event_id, current_user["user_id"], booking.seat_id))
         new_booking = cur.fetchone()
         
         # Create pending transaction
-        cur.execute(
-            """
-            INSERT INTO transactions (booking_id, user_id, amount, status, payment_method, transaction_date)
-            VALUES (%s, %s, %s, 'pending', 'pending', CURRENT_TIMESTAMP)
-            RETURNING transaction_id
-            """,
-            (new_booking["booking_id"], current_user["user_id"], price)
-        )
+        execute_prepared(cur, _BOOKING_TRANSACTION_INSERT, (new_booking["booking_id"], current_user["user_id"], price))
         transaction = cur.fetchone()
+        invalidate_user(cur, current_user["user_id"])
+        on_commit(lambda: seat_index.mark_taken(booking.event_id, [booking.seat_id]))
+        BOOKINGS_CREATED.inc()
         
         # Log the action
         log_user_action(
@@ -93,11 +148,94 @@ async def create_booking(
         
         return result
 
+@router.post("/auto", status_code=201)
+async def create_auto_booking(
+    booking: AutoBookingCreate,
+    current_user: dict = Depends(get_current_user),
+    queue_token: Optional[str] = Header(None, alias=TOKEN_HEADER)
+):
+    """Book the best `quantity` adjacent free seats of a zone"""
+    enforce_admission(booking.event_id, queue_token, current_user["user_id"])
+    with get_db_cursor() as cur:
+        execute_prepared(cur, _BOOKING_EVENT, (booking.event_id, booking.zone_id))
+        event = cur.fetchone()
+    
+    if not event:
+        raise HTTPException(status_code=404, detail="Event not found or not available for booking")
+    
+    if event["event_date"] <= datetime.now():
+        raise HTTPException(status_code=400, detail="Event has already started or ended")
+    
+    price = event["zone_price"] if event["zone_price"] is not None else event["ticket_price"]
+    
+    for _ in range(AUTO_BOOKING_ATTEMPTS):
+        with get_db_cursor() as cur:
+            seat_ids = seat_index.hold(cur, booking.event_id, booking.zone_id, booking.quantity)
+        if seat_ids is None:
+            AUTO_BOOKING_CLAIMS.labels("sold_out").inc()
+            raise HTTPException(
+                status_code=409,
+                detail=f"No {booking.quantity} adjacent free seats left in this zone"
+            )
+        
+        try:
+            # All seats or none: the unique active-seat index decides
+            with get_db_cursor(commit=True) as cur:
+                execute_prepared(cur, _AUTO_BOOKING_INSERT,
+                                 (booking.event_id, current_user["user_id"], seat_ids))
+                new_bookings = sorted(cur.fetchall(), key=lambda b: seat_ids.index(b["seat_id"]))
+                if len(new_bookings) < len(seat_ids):
+                    raise _SeatsTaken(set(seat_ids) - {b["seat_id"] for b in new_bookings})
+                
+                execute_prepared(cur, _AUTO_BOOKING_TRANSACTIONS_INSERT,
+                                 (current_user["user_id"], price, [b["booking_id"] for b in new_bookings]))
+                transactions = {t["booking_id"]: t["transaction_id"] for t in cur.fetchall()}
+                invalidate_user(cur, current_user["user_id"])
+        except _SeatsTaken as e:
+            seat_index.settle(booking.event_id, seat_ids, taken=e.seat_ids, stale=True)
+            AUTO_BOOKING_CLAIMS.labels("conflict").inc()
+            continue
+        except BaseException:
+            seat_index.settle(booking.event_id, seat_ids)
+            raise
+        
+        seat_index.settle(booking.event_id, seat_ids, taken=seat_ids)
+        AUTO_BOOKING_CLAIMS.labels("claimed").inc()
+        BOOKINGS_CREATED.inc(len(new_bookings))
+        log_user_action(
+            current_user["user_id"],
+            "create_auto_booking",
+            {
+                "booking_ids": [b["booking_id"] for b in new_bookings],
+                "event_id": booking.event_id,
+                "zone_id": booking.zone_id,
+                "seat_ids": seat_ids,
+                "price": float(price)
+            }
+        )
+        
+        seats = venue().seats
+        return {
+            "bookings": [
+                dict(b, seat_number=seats[b["seat_id"]].seat_number, price=price,
+                     transaction_id=transactions[b["booking_id"]])
+                for b in new_bookings
+            ],
+            "total_price": price * len(new_bookings)
+        }
+    
+    raise HTTPException(
+        status_code=409,
+        detail="Seats were taken while booking, please retry",
+        headers={"Retry-After": "1"}
+    )
+
 @router.get("/my")
 async def get_my_bookings(current_user: dict = Depends(get_current_user)):
     """Get user's bookings"""
     with get_db_cursor() as cur:
-        cur.execute(
+        bookings_json = fetch_json(
+            cur,
             """
             SELECT b.*, e.title as event_title, e.event_date,
                    s.seat_number, z.name as zone_name,
@@ -113,8 +251,7 @@ async def get_my_bookings(current_user: dict = Depends(get_current_user)):
             """,
             (current_user["user_id"],)
         )
-        bookings = cur.fetchall()
-        return [dict(booking) for booking in bookings]
+        return RawJSONResponse(bookings_json)
 
 @router.get("/{booking_id}")
 async def get_booking(
@@ -196,6 +333,7 @@ async def confirm_booking(
             (booking_id,)
         )
         updated_booking = cur.fetchone()
+        invalidate_user(cur, booking["user_id"])
         
         # Log the action
         log_user_action(
@@ -256,6 +394,9 @@ async def cancel_booking(
             """,
             (booking_id,)
         )
+        invalidate_user(cur, booking["user_id"])
+        on_commit(lambda: seat_index.release(booking["event_id"], [booking["seat_id"]]))
+        BOOKINGS_CANCELLED.labels("user").inc()
         
         # Log the action
         log_user_action(
@@ -274,15 +415,7 @@ async def process_payment(
     """Process payment for a booking (simulation)"""
     with get_db_cursor(commit=True) as cur:
         # Check if booking exists and belongs to user
-        cur.execute(
-            """
-            SELECT b.*, t.amount, t.status as payment_status
-            FROM bookings b
-            LEFT JOIN transactions t ON b.booking_id = t.booking_id
-            WHERE b.booking_id = %s
-            """,
-            (payment.booking_id,)
-        )
+        execute_prepared(cur, _PAYMENT_BOOKING, (payment.booking_id,))
         booking = cur.fetchone()
         
         if not booking:
@@ -298,26 +431,14 @@ async def process_payment(
             raise HTTPException(status_code=400, detail="Payment already completed")
         
         # Update transaction
-        cur.execute(
-            """
-            UPDATE transactions
-            SET status = 'completed', payment_method = %s, transaction_date = CURRENT_TIMESTAMP
-            WHERE booking_id = %s
-            RETURNING *
-            """,
-            (payment.payment_method, payment.booking_id)
-        )
+        execute_prepared(cur, _PAYMENT_COMPLETE, (payment.payment_method, payment.booking_id))
         transaction = cur.fetchone()
         
         # Update booking status to confirmed
-        cur.execute(
-            """
-            UPDATE bookings
-            SET status = 'confirmed'
-            WHERE booking_id = %s
-            """,
-            (payment.booking_id,)
-        )
+        execute_prepared(cur, _PAYMENT_CONFIRM_BOOKING, (payment.booking_id,))
+        invalidate_user(cur, booking["user_id"])
+        PAYMENTS_PROCESSED.inc()
+        PAYMENTS_AMOUNT.inc(float(transaction["amount"]))
         
         # Log the action
         log_user_action(
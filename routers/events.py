@@ -1,17 +1,35 @@
 # routers/events.py - Enhanced with zone support and status management
-from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Header
 from pydantic import BaseModel, validator
 from typing import Optional, List
 from datetime import datetime, timedelta
-from database import get_db_cursor
+from database import get_db_cursor, fetch_json, prepared_statement, execute_prepared, db_budget
 from utils.auth import get_current_user, check_role, verifier, SessionData
 from utils.helpers import log_user_action, log_api_request
+from utils.metrics import BOOKINGS_CANCELLED
+from utils.responses import FastJSONResponse, RawJSONResponse, dumps
+from utils.single_flight import SingleFlight
+from utils.seat_index import booked_seat_ids
+from utils.venue import venue
+from utils import waiting_room
+from utils.user_cache import invalidate_all
 from fastapi.responses import JSONResponse
 import traceback
+import base64
+import logging
 import pytz
 
+logger = logging.getLogger('nightclub')
+
 router = APIRouter()
 
+# Catalog and seat map reads run under the public_read query budget
+PUBLIC_READ = [Depends(db_budget("public_read"))]
+
+# Hot reads coalesced per worker when many clients ask at once
+_event_reads = SingleFlight("event")
+_seat_map_reads = SingleFlight("seat_map")
+
 class EventZoneConfig(BaseModel):
     zone_id: int
     available_seats: int
@@ -64,48 +82,33 @@ class EventStatusUpdate(BaseModel):
             raise ValueError(f'Статус должен быть одним из: {", ".join(allowed_statuses)}')
         return v
 
-@router.get("/categories")
+@router.get("/categories", dependencies=PUBLIC_READ)
 async def get_categories(request: Request):
     """Get all event categories"""
     try:
         log_api_request("/events/categories", "GET")
         
-        with get_db_cursor() as cur:
-            cur.execute("SELECT * FROM event_categories ORDER BY name")
-            categories = cur.fetchall()
-            result = [dict(cat) for cat in categories]
-            
-            log_api_request("/events/categories", "GET", body={"count": len(result)})
-            return result
+        layout = venue()
+        log_api_request("/events/categories", "GET", body={"count": len(layout.categories)})
+        return RawJSONResponse(layout.categories_json)
     except Exception as e:
         log_api_request("/events/categories", "GET", error=e)
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-@router.get("/zones")
+@router.get("/zones", dependencies=PUBLIC_READ)
 async def get_zones(request: Request):
     """Get all available zones with seat information"""
     try:
         log_api_request("/events/zones", "GET")
         
-        with get_db_cursor() as cur:
-            cur.execute("""
-                SELECT z.zone_id, z.name, z.description, z.capacity,
-                       COUNT(s.seat_id) as total_seats
-                FROM club_zones z
-                LEFT JOIN seats s ON z.zone_id = s.zone_id
-                GROUP BY z.zone_id, z.name, z.description, z.capacity
-                ORDER BY z.zone_id
-            """)
-            zones = cur.fetchall()
-            result = [dict(zone) for zone in zones]
-            
-            log_api_request("/events/zones", "GET", body={"count": len(result)})
-            return result
+        layout = venue()
+        log_api_request("/events/zones", "GET", body={"count": len(layout.zones)})
+        return RawJSONResponse(layout.zones_json)
     except Exception as e:
         log_api_request("/events/zones", "GET", error=e)
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-@router.get("/")
+@router.get("/", dependencies=PUBLIC_READ)
 async def list_events(
     request: Request,
     category: Optional[int] = None,
@@ -201,7 +204,7 @@ async def list_events(
                     "page": page
                 })
                 
-                return result
+                return FastJSONResponse(result)
                 
             except Exception as e:
                 log_api_request("/events/", "GET", params=params, error=e)
@@ -217,6 +220,98 @@ async def list_events(
             detail=f"Failed to list events: {str(e)}\n{traceback.format_exc()}"
         )
 
+def _encode_search_cursor(rank: float, event_id: int) -> str:
+    """Encode the last row of a search page into an opaque keyset cursor"""
+    raw = f"{rank!r}:{event_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_search_cursor(cursor: str) -> tuple:
+    """Decode a keyset cursor produced by _encode_search_cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        rank, event_id = base64.urlsafe_b64decode(padded).decode().split(":")
+        return float(rank), int(event_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid search cursor")
+
+@router.get("/search", dependencies=PUBLIC_READ)
+async def search_events(
+    q: str = Query(..., min_length=2, max_length=100),
+    cursor: Optional[str] = None,
+    include_past: bool = False,
+    limit: int = Query(10, gt=0, le=50)
+):
+    """Full-text and fuzzy search over event titles and descriptions.
+
+    Results are ranked by full-text relevance plus title trigram similarity,
+    highlighted with <mark> tags and keyset-paginated: pass the returned
+    next_cursor to fetch the following page.
+    """
+    conditions = ["(e.search_vector @@ q.ts OR e.title %% q.raw)"]
+    params = [q, q, q]
+
+    if not include_past:
+        conditions.append("e.event_date >= NOW()")
+
+    keyset = ""
+    if cursor:
+        cursor_rank, cursor_id = _decode_search_cursor(cursor)
+        keyset = "WHERE (m.rank, m.event_id) < (%s::float8, %s)"
+
+    query = f"""
+        WITH q AS (
+            SELECT websearch_to_tsquery('russian', %s) || websearch_to_tsquery('english', %s) AS ts,
+                   %s::text AS raw
+        ),
+        matches AS (
+            SELECT e.event_id,
+                   ts_rank_cd(e.search_vector, q.ts)::float8
+                       + similarity(e.title, q.raw)::float8 AS rank
+            FROM events e, q
+            WHERE {" AND ".join(conditions)}
+        )
+        SELECT e.event_id, e.category_id, e.title, e.event_date, e.status,
+               e.ticket_price, e.capacity, c.name as category_name, m.rank,
+               ts_headline('russian', e.title, q.ts,
+                           'StartSel=<mark>, StopSel=</mark>, HighlightAll=true') as title_highlight,
+               ts_headline('russian', coalesce(e.description, ''), q.ts,
+                           'StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=20, MinWords=5') as description_highlight
+        FROM (
+            SELECT * FROM matches m
+            {keyset}
+            ORDER BY m.rank DESC, m.event_id DESC
+            LIMIT %s
+        ) m
+        JOIN events e ON e.event_id = m.event_id
+        LEFT JOIN event_categories c ON e.category_id = c.category_id
+        CROSS JOIN q
+        ORDER BY m.rank DESC, m.event_id DESC
+    """
+    if cursor:
+        params.extend([cursor_rank, cursor_id])
+    params.append(limit + 1)
+
+    try:
+        with get_db_cursor() as cur:
+            cur.execute(query, params)
+            rows = cur.fetchall()
+    except Exception as e:
+        log_api_request("/events/search", "GET", params={"q": q, "cursor": cursor}, error=e)
+        raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
+
+    has_more = len(rows) > limit
+    results = [dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if has_more:
+        last = results[-1]
+        next_cursor = _encode_search_cursor(last["rank"], last["event_id"])
+
+    return {
+        "query": q,
+        "results": results,
+        "next_cursor": next_cursor
+    }
+
 @router.post("/", status_code=201)
 async def create_event(
     request: Request,
@@ -256,13 +351,7 @@ async def create_event(
             try:
                 # Verify all zones exist
                 zone_ids = [z.zone_id for z in event.zones]
-                cur.execute(
-                    "SELECT zone_id FROM club_zones WHERE zone_id = ANY(%s)",
-                    (zone_ids,)
-                )
-                existing_zones = {row["zone_id"] for row in cur.fetchall()}
-                
-                invalid_zones = set(zone_ids) - existing_zones
+                invalid_zones = set(zone_ids) - venue().zones.keys()
                 if invalid_zones:
                     raise HTTPException(
                         status_code=400,
@@ -350,9 +439,8 @@ async def create_event(
             detail=f"Failed to create event: {str(e)}\n{traceback.format_exc()}"
         )
 
-@router.get("/{event_id}")
-async def get_event(event_id: int):
-    """Get a specific event by ID with zone information"""
+def _load_event(event_id: int) -> bytes:
+    """Event with its zones, encoded for get_event()"""
     try:
         with get_db_cursor() as cur:
             cur.execute(
@@ -388,11 +476,19 @@ async def get_event(event_id: int):
             zones = cur.fetchall()
             event_dict['zones'] = [dict(zone) for zone in zones]
             
-            return event_dict
+            return dumps(event_dict)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error getting event: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+@router.get("/{event_id}", dependencies=PUBLIC_READ)
+async def get_event(event_id: int):
+    """Get a specific event by ID with zone information"""
+    # Concurrent requests for the same event share one load
+    return RawJSONResponse(await _event_reads.do(event_id, _load_event, event_id))
+
 @router.put("/{event_id}")
 async def update_event(
     event_id: int,
@@ -476,13 +572,7 @@ async def update_event(
             
             # Verify all zones exist
             zone_ids = [z.zone_id for z in event.zones]
-            cur.execute(
-                "SELECT zone_id FROM club_zones WHERE zone_id = ANY(%s)",
-                (zone_ids,)
-            )
-            existing_zones = {row["zone_id"] for row in cur.fetchall()}
-            
-            invalid_zones = set(zone_ids) - existing_zones
+            invalid_zones = set(zone_ids) - venue().zones.keys()
             if invalid_zones:
                 raise HTTPException(
                     status_code=400,
@@ -598,6 +688,8 @@ async def update_event_status(
                 "UPDATE bookings SET status = 'cancelled' WHERE event_id = %s AND status = 'confirmed'",
                 (event_id,)
             )
+            invalidate_all(cur)
+            BOOKINGS_CANCELLED.labels("event_cancelled").inc(cancelled_bookings + cur.rowcount)
         
         # Log the action
         log_details = {
@@ -628,13 +720,21 @@ async def update_event_status(
 
 # Fixed routers/events.py with better error handling for seats endpoint
 
-@router.get("/{event_id}/seats")
-async def get_event_seats(event_id: int, zone_id: Optional[int] = None):
-    """Get available seats for an event, optionally filtered by zone"""
+_SEAT_MAP_EVENT = prepared_statement("seat_map_event", "SELECT * FROM events WHERE event_id = %s")
+# The layout comes from utils.venue; only the event's prices and bookings are read
+_SEAT_MAP_ZONE_PRICES = prepared_statement("seat_map_zone_prices", """
+    SELECT zone_id, zone_price
+    FROM event_zones
+    WHERE event_id = %s
+""")
+
+def _load_seat_map(event_id: int, zone_id: Optional[int]) -> bytes:
+    """Seat map JSON for get_event_seats()"""
     try:
+        layout = venue()
         with get_db_cursor() as cur:
             # Check if event exists
-            cur.execute("SELECT * FROM events WHERE event_id = %s", (event_id,))
+            execute_prepared(cur, _SEAT_MAP_EVENT, (event_id,))
             event = cur.fetchone()
             if not event:
                 raise HTTPException(status_code=404, detail="Мероприятие не найдено")
@@ -652,124 +752,73 @@ async def get_event_seats(event_id: int, zone_id: Optional[int] = None):
                     detail="Мероприятие уже началось"
                 )
             
-            # Improved query with better error handling
-            # First, check if event has zone configurations
-            cur.execute("""
-                SELECT COUNT(*) as zone_count
-                FROM event_zones ez
-                WHERE ez.event_id = %s
-            """, (event_id,))
-            
-            zone_config_count = cur.fetchone()["zone_count"]
+            # Check if event has zone configurations
+            execute_prepared(cur, _SEAT_MAP_ZONE_PRICES, (event_id,))
+            prices = {row["zone_id"]: row["zone_price"] for row in cur.fetchall()}
             
-            if zone_config_count == 0:
+            if not prices:
                 # No zone configuration exists for this event
                 # Create default zone configuration
                 log_api_request(f"/events/{event_id}/seats", "GET", 
                                error=Exception("No zone configuration found, creating default"))
                 
-                # Get all available zones
-                cur.execute("SELECT zone_id, capacity FROM club_zones")
-                all_zones = cur.fetchall()
-                
-                if not all_zones:
+                if not layout.zones:
                     raise HTTPException(
                         status_code=500,
                         detail="Системная ошибка: нет настроенных зон"
                     )
                 
                 # Create default event_zones entries
-                for zone in all_zones:
+                for zone in layout.zones.values():
                     default_price = 1000.0  # Default price
-                    available_seats = min(zone["capacity"], 50)  # Max 50 seats per zone by default
+                    available_seats = min(zone.capacity, 50)  # Max 50 seats per zone by default
                     
                     try:
                         cur.execute("""
                             INSERT INTO event_zones (event_id, zone_id, available_seats, zone_price)
                             VALUES (%s, %s, %s, %s)
                             ON CONFLICT (event_id, zone_id) DO NOTHING
-                        """, (event_id, zone["zone_id"], available_seats, default_price))
+                        """, (event_id, zone.zone_id, available_seats, default_price))
                     except Exception as e:
                         logger.error(f"Failed to create default zone config: {e}")
                         continue
                 
                 # Commit the changes
                 cur.connection.commit()
+                execute_prepared(cur, _SEAT_MAP_ZONE_PRICES, (event_id,))
+                prices = {row["zone_id"]: row["zone_price"] for row in cur.fetchall()}
             
-            # Now get seats with improved query
-            if zone_id:
-                # Specific zone requested
-                query = """
-                    SELECT s.seat_id, s.seat_number, s.zone_id, z.name as zone_name,
-                           COALESCE(ez.zone_price, %s) as zone_price,
-                           CASE WHEN b.booking_id IS NOT NULL THEN true ELSE false END as is_booked
-                    FROM seats s
-                    JOIN club_zones z ON s.zone_id = z.zone_id
-                    LEFT JOIN event_zones ez ON s.zone_id = ez.zone_id AND ez.event_id = %s
-                    LEFT JOIN bookings b ON s.seat_id = b.seat_id 
-                        AND b.event_id = %s 
-                        AND b.status IN ('confirmed', 'pending')
-                    WHERE s.zone_id = %s
-                    ORDER BY s.seat_number
-                """
-                params = [event["ticket_price"] or 1000.0, event_id, event_id, zone_id]
-            else:
-                # All zones
-                query = """
-                    SELECT s.seat_id, s.seat_number, s.zone_id, z.name as zone_name,
-                           COALESCE(ez.zone_price, %s) as zone_price,
-                           CASE WHEN b.booking_id IS NOT NULL THEN true ELSE false END as is_booked
-                    FROM seats s
-                    JOIN club_zones z ON s.zone_id = z.zone_id
-                    LEFT JOIN event_zones ez ON s.zone_id = ez.zone_id AND ez.event_id = %s
-                    LEFT JOIN bookings b ON s.seat_id = b.seat_id 
-                        AND b.event_id = %s 
-                        AND b.status IN ('confirmed', 'pending')
-                    ORDER BY z.zone_id, s.seat_number
-                """
-                params = [event["ticket_price"] or 1000.0, event_id, event_id]
-            
+            default_price = event["ticket_price"] or 1000.0
             try:
-                cur.execute(query, params)
-                seats = cur.fetchall()
+                booked = booked_seat_ids(cur, event_id)
+                seats_json = layout.seat_map_json(prices, default_price, booked, zone_id)
                 
                 log_api_request(f"/events/{event_id}/seats", "GET", 
                                params={"zone_id": zone_id}, 
-                               body={"seats_found": len(seats)})
+                               body={"seats_bytes": len(seats_json)})
                 
-                return {"seats": [dict(seat) for seat in seats]}
+                return b'{"seats":' + seats_json + b'}'
                 
             except Exception as db_error:
                 logger.error(f"Database error in get_event_seats: {str(db_error)}")
-                logger.error(f"Query: {query}")
-                logger.error(f"Params: {params}")
                 
-                # Try a simpler fallback query
-                try:
-                    fallback_query = """
-                        SELECT s.seat_id, s.seat_number, s.zone_id, z.name as zone_name,
-                               %s as zone_price,
-                               false as is_booked
-                        FROM seats s
-                        JOIN club_zones z ON s.zone_id = z.zone_id
-                        WHERE s.zone_id = COALESCE(%s, s.zone_id)
-                        ORDER BY s.seat_number
-                        LIMIT 100
-                    """
-                    fallback_params = [event["ticket_price"] or 1000.0, zone_id]
-                    
-                    cur.execute(fallback_query, fallback_params)
-                    fallback_seats = cur.fetchall()
-                    
-                    logger.warning(f"Used fallback query, found {len(fallback_seats)} seats")
-                    return {"seats": [dict(seat) for seat in fallback_seats]}
-                    
-                except Exception as fallback_error:
-                    logger.error(f"Fallback query also failed: {str(fallback_error)}")
-                    raise HTTPException(
-                        status_code=500, 
-                        detail=f"Ошибка базы данных при загрузке мест: {str(db_error)}"
-                    )
+                # Fall back to the first seats of the layout, without bookings
+                seats = [
+                    seat for seat in layout.seats.values()
+                    if zone_id is None or seat.zone_id == zone_id
+                ][:100]
+                logger.warning(f"Used fallback seat map, {len(seats)} seats")
+                return dumps({"seats": [
+                    {
+                        "seat_id": seat.seat_id,
+                        "seat_number": seat.seat_number,
+                        "zone_id": seat.zone_id,
+                        "zone_name": layout.zones[seat.zone_id].name,
+                        "zone_price": default_price,
+                        "is_booked": False
+                    }
+                    for seat in seats
+                ]})
                 
     except HTTPException:
         raise
@@ -783,6 +832,34 @@ async def get_event_seats(event_id: int, zone_id: Optional[int] = None):
             detail=f"Неожиданная ошибка: {str(e)}"
         )
 
+@router.get("/{event_id}/seats", dependencies=PUBLIC_READ)
+async def get_event_seats(event_id: int, zone_id: Optional[int] = None):
+    """Get available seats for an event, optionally filtered by zone"""
+    # Concurrent requests for the same seat map share one load
+    return RawJSONResponse(
+        await _seat_map_reads.do((event_id, zone_id), _load_seat_map, event_id, zone_id)
+    )
+
+@router.post("/{event_id}/waiting-room")
+async def join_waiting_room(event_id: int, current_user: dict = Depends(get_current_user)):
+    """Join an event's waiting room; the ticket goes in X-Queue-Token when booking"""
+    ticket = waiting_room.join(event_id, current_user["user_id"])
+    if ticket is None:
+        raise HTTPException(status_code=404, detail="Event has no open waiting room")
+    return {"token": waiting_room.encode_ticket(ticket), **waiting_room.ticket_status(ticket)}
+
+@router.get("/{event_id}/waiting-room")
+async def get_waiting_room_status(
+    event_id: int,
+    token: Optional[str] = None,
+    queue_token: Optional[str] = Header(None, alias=waiting_room.TOKEN_HEADER)
+):
+    """Position and ETA of a waiting room ticket, answered from memory"""
+    ticket = waiting_room.decode_ticket(queue_token or token)
+    if ticket is None or ticket.event_id != event_id:
+        raise HTTPException(status_code=403, detail="Invalid waiting room ticket")
+    return waiting_room.ticket_status(ticket)
+
 @router.delete("/{event_id}")
 async def delete_event(
     event_id: int,
@@ -830,6 +907,8 @@ async def delete_event(
                 "UPDATE bookings SET status = 'cancelled' WHERE event_id = %s",
                 (event_id,)
             )
+            invalidate_all(cur)
+            BOOKINGS_CANCELLED.labels("event_cancelled").inc(cur.rowcount)
             
             # Log the action
             log_user_action(
@@ -6,9 +6,13 @@ from database import get_db_cursor
 from utils.auth import (
     get_current_user, 
     verify_password, 
-    get_password_hash
+    get_password_hash,
+    create_access_token
 )
 from utils.helpers import log_user_action
+from utils.sessions import revoke_user_sessions
+from utils.token_store import revoke_user_tokens
+from utils.user_cache import user_summary_response, invalidate_user
 import json
 
 router = APIRouter()
@@ -28,45 +32,8 @@ class AccountDelete(BaseModel):
 
 @router.get("/me")
 async def get_profile(current_user: dict = Depends(get_current_user)):
-    """Get user profile"""
-    with get_db_cursor() as cur:
-        cur.execute(
-            """
-            SELECT u.user_id, u.username, u.email, u.role, u.is_active, u.created_at,
-                   p.first_name, p.last_name, p.phone, p.birth_date
-            FROM users u
-            LEFT JOIN user_profiles p ON u.user_id = p.user_id
-            WHERE u.user_id = %s
-            """,
-            (current_user["user_id"],)
-        )
-        profile = cur.fetchone()
-        
-        if not profile:
-            raise HTTPException(status_code=404, detail="Profile not found")
-        
-        # Get user statistics
-        cur.execute(
-            """
-            SELECT 
-                COUNT(*) as total_bookings,
-                COUNT(CASE WHEN status = 'confirmed' THEN 1 END) as active_bookings,
-                COUNT(CASE WHEN status = 'cancelled' THEN 1 END) as cancelled_bookings
-            FROM bookings 
-            WHERE user_id = %s
-            """,
-            (current_user["user_id"],)
-        )
-        stats = cur.fetchone()
-        
-        result = dict(profile)
-        result['stats'] = dict(stats) if stats else {
-            'total_bookings': 0,
-            'active_bookings': 0,
-            'cancelled_bookings': 0
-        }
-        
-        return result
+    """Get user profile with booking stats (cached, see utils/user_cache.py)"""
+    return user_summary_response(current_user["user_id"])
 
 @router.put("/me")
 async def update_profile(
@@ -143,6 +110,8 @@ async def update_profile(
             updated_profile = cur.fetchone()
             updated_fields.extend(["first_name", "last_name", "phone"])
         
+        invalidate_user(cur, current_user["user_id"])
+        
         # Log the action
         log_user_action(
             current_user["user_id"],
@@ -195,6 +164,17 @@ async def update_password(
             (new_password_hash, current_user["user_id"])
         )
         
+        # Sign out every other session; the caller continues with a fresh token
+        revoke_user_sessions(cur, current_user["user_id"], "password_change", keep_session=current_user.get("sid"))
+        revoke_user_tokens(cur, current_user["user_id"])
+        new_token = create_access_token({
+            "sub": str(current_user["user_id"]),
+            "user_id": current_user["user_id"],
+            "username": current_user["username"],
+            "role": current_user["role"],
+            "sid": current_user.get("sid")
+        })
+        
         # Log the action
         log_user_action(
             current_user["user_id"],
@@ -202,7 +182,11 @@ async def update_password(
             {"timestamp": datetime.now().isoformat()}
         )
         
-        return {"message": "Password updated successfully"}
+        return {
+            "message": "Password updated successfully",
+            "access_token": new_token,
+            "token_type": "bearer"
+        }
 
 @router.delete("/me")
 async def delete_account(
@@ -257,6 +241,9 @@ async def delete_account(
             "UPDATE users SET is_active = false, email = %s WHERE user_id = %s",
             (f"deleted_{current_user['user_id']}@deleted.local", current_user["user_id"])
         )
+        revoke_user_sessions(cur, current_user["user_id"], "account_deleted")
+        revoke_user_tokens(cur, current_user["user_id"])
+        invalidate_user(cur, current_user["user_id"])
         
         return {"message": "Account successfully deleted"}
 
@@ -0,0 +1,271 @@
+"""
+Run EXPLAIN (ANALYZE, BUFFERS) on the hot booking and seat queries and print
+the plan diff with and without the indexes from a migration.
+
+Both sets of plans run against temporary copies of the tables the migration
+indexes (bookings, transactions, events), which shadow the real tables for
+the session: the "after" copies carry the current indexes, the "before"
+copies lack the ones the migration creates and get back the ones it drops.
+No DDL ever touches the real tables; they are only read to fill the copies,
+under a short lock_timeout. Copying still reads every row of those tables,
+so prefer a staging database or a replica restored from production over the
+production primary. Run it against a seeded database, otherwise every plan
+is a sequential scan over a handful of rows:
+
+    python scripts/explain_hot_queries.py
+    python scripts/explain_hot_queries.py --query get_event_seats
+    python scripts/explain_hot_queries.py --migration migrations/09_hot_path_indexes.sql
+"""
+
+import argparse
+import difflib
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import get_db_connection  # noqa: E402
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+DEFAULT_MIGRATION = os.path.join(MIGRATIONS_DIR, "09_hot_path_indexes.sql")
+
+CREATE_INDEX_RE = re.compile(
+    r"CREATE\s+(UNIQUE\s+)?INDEX\s+(?:CONCURRENTLY\s+)?(?:IF\s+NOT\s+EXISTS\s+)?(\w+)\s+ON\s+(?:public\.)?(\w+)[^;]*;",
+    re.IGNORECASE,
+)
+
+# Give up instead of queueing behind (and in front of) DDL on the real tables
+LOCK_TIMEOUT = "2s"
+DROP_INDEX_RE = re.compile(
+    r"DROP\s+INDEX\s+(?:CONCURRENTLY\s+)?(?:IF\s+EXISTS\s+)?(\w+)\s*;",
+    re.IGNORECASE,
+)
+
+# Indexes created without an explicit name in older migrations. Restored as
+# non-unique for the "before" plans: cancelled rows may already duplicate
+# (event_id, seat_id), and the plan shape does not depend on uniqueness.
+UNNAMED_LEGACY_INDEXES = {
+    "bookings_event_id_seat_id_idx": "CREATE INDEX bookings_event_id_seat_id_idx ON bookings (event_id, seat_id);",
+}
+
+# name -> (sql, params builder taking the sample row)
+HOT_QUERIES = {
+    "check_seat_availability": (
+        """
+        SELECT COUNT(*) as count
+        FROM bookings
+        WHERE event_id = %s AND seat_id = %s AND status IN ('confirmed', 'pending')
+        """,
+        lambda s: (s["event_id"], s["seat_id"]),
+    ),
+    "get_event_seats": (
+        """
+        SELECT COALESCE(array_agg(seat_id), '{}') as seat_ids
+        FROM bookings
+        WHERE event_id = %s AND status IN ('confirmed', 'pending')
+        """,
+        lambda s: (s["event_id"],),
+    ),
+    "get_my_bookings": (
+        """
+        SELECT b.*, e.title as event_title, e.event_date,
+               s.seat_number, z.name as zone_name,
+               t.status as payment_status, t.payment_method, t.amount as price,
+               t.transaction_date as payment_date
+        FROM bookings b
+        JOIN events e ON b.event_id = e.event_id
+        JOIN seats s ON b.seat_id = s.seat_id
+        JOIN club_zones z ON s.zone_id = z.zone_id
+        LEFT JOIN transactions t ON b.booking_id = t.booking_id
+        WHERE b.user_id = %s
+        ORDER BY b.booking_date DESC
+        """,
+        lambda s: (s["user_id"],),
+    ),
+    "get_event_booked_seats": (
+        """
+        SELECT COUNT(*) FROM bookings b
+        WHERE b.event_id = %s AND b.status = 'confirmed'
+        """,
+        lambda s: (s["event_id"],),
+    ),
+    "admin_stats_overall": (
+        """
+        SELECT
+            (SELECT COUNT(*) FROM events WHERE event_date >= NOW()) as total_events,
+            (SELECT COUNT(*) FROM bookings WHERE status = 'confirmed') as total_bookings,
+            (SELECT COALESCE(SUM(amount), 0) FROM transactions WHERE status = 'completed') as total_revenue
+        """,
+        lambda s: (),
+    ),
+    "admin_stats_upcoming_events": (
+        """
+        SELECT e.event_id, e.title, e.event_date, e.status,
+               COUNT(b.booking_id) as total_bookings,
+               e.capacity,
+               (COUNT(b.booking_id)::float / NULLIF(e.capacity, 0) * 100)::numeric(5,2) as booking_percentage
+        FROM events e
+        LEFT JOIN bookings b ON e.event_id = b.event_id AND b.status = 'confirmed'
+        WHERE e.event_date >= NOW()
+        GROUP BY e.event_id, e.title, e.capacity, e.event_date, e.status
+        ORDER BY e.event_date
+        LIMIT 10
+        """,
+        lambda s: (),
+    ),
+    "admin_stats_categories": (
+        """
+        SELECT COALESCE(c.name, 'Без категории') as category,
+               COUNT(DISTINCT e.event_id) as total_events,
+               COUNT(b.booking_id) as total_bookings,
+               COALESCE(SUM(t.amount), 0) as revenue
+        FROM events e
+        LEFT JOIN event_categories c ON e.category_id = c.category_id
+        LEFT JOIN bookings b ON e.event_id = b.event_id AND b.status = 'confirmed'
+        LEFT JOIN transactions t ON b.booking_id = t.booking_id AND t.status = 'completed'
+        GROUP BY c.category_id, c.name
+        ORDER BY revenue DESC
+        """,
+        lambda s: (),
+    ),
+}
+
+
+def load_index_changes(migration_path):
+    """Return ({created index name: table}, dropped index names) for a migration"""
+    with open(migration_path, encoding="utf-8") as f:
+        sql = f.read()
+    sql = re.sub(r"--[^\n]*", "", sql)
+    created = {m.group(2): m.group(3) for m in CREATE_INDEX_RE.finditer(sql)}
+    dropped = [m.group(1) for m in DROP_INDEX_RE.finditer(sql)]
+    return created, dropped
+
+
+def load_legacy_definitions(exclude_path):
+    """Map index name -> CREATE INDEX statement from every other migration"""
+    definitions = dict(UNNAMED_LEGACY_INDEXES)
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        path = os.path.join(MIGRATIONS_DIR, filename)
+        if not filename.endswith(".sql") or os.path.abspath(path) == os.path.abspath(exclude_path):
+            continue
+        with open(path, encoding="utf-8") as f:
+            sql = re.sub(r"--[^\n]*", "", f.read())
+        for match in CREATE_INDEX_RE.finditer(sql):
+            statement = re.sub(r"\s+CONCURRENTLY", "", match.group(0), flags=re.IGNORECASE)
+            definitions[match.group(2)] = statement
+    return definitions
+
+
+def pick_sample(cur):
+    """Pick the busiest event, one of its booked seats and the busiest user"""
+    cur.execute("""
+        SELECT event_id, seat_id
+        FROM bookings
+        WHERE event_id = (
+            SELECT event_id FROM bookings GROUP BY event_id ORDER BY COUNT(*) DESC LIMIT 1
+        )
+        LIMIT 1
+    """)
+    row = cur.fetchone()
+    if not row:
+        raise SystemExit("No bookings found - seed the database before running this script")
+    event_id, seat_id = row
+    cur.execute("SELECT user_id FROM bookings GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1")
+    user_id = cur.fetchone()[0]
+    return {"event_id": event_id, "seat_id": seat_id, "user_id": user_id}
+
+
+def explain(cur, sql, params):
+    cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + sql, params)
+    return [row[0] for row in cur.fetchall()]
+
+
+def existing_indexes(cur, names):
+    cur.execute("SELECT indexname FROM pg_indexes WHERE indexname = ANY(%s)", (list(names),))
+    return {row[0] for row in cur.fetchall()}
+
+
+def create_scratch_copies(cur, tables, skip=(), create=()):
+    """Shadow `tables` with temporary copies carrying their indexes except `skip`, plus `create`"""
+    for table in tables:
+        cur.execute(f"CREATE TEMP TABLE {table} (LIKE public.{table} INCLUDING DEFAULTS) ON COMMIT DROP")
+        cur.execute(f"INSERT INTO pg_temp.{table} SELECT * FROM public.{table}")
+        cur.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = 'public' AND tablename = %s",
+            (table,)
+        )
+        for name, definition in cur.fetchall():
+            if name not in skip:
+                cur.execute(definition.replace(f" ON public.{table} ", f" ON pg_temp.{table} ", 1))
+    # Unqualified table names resolve to the temporary copies
+    for statement in create:
+        cur.execute(statement)
+    for table in tables:
+        cur.execute(f"ANALYZE pg_temp.{table}")
+
+
+def collect_plans(conn, queries, sample, tables, skip=(), create=()):
+    """Collect plans on scratch copies of `tables`; the transaction is always rolled back"""
+    plans = {}
+    with conn.cursor() as cur:
+        try:
+            create_scratch_copies(cur, tables, skip, create)
+            for name in queries:
+                sql, build_params = HOT_QUERIES[name]
+                plans[name] = explain(cur, sql, build_params(sample))
+        finally:
+            conn.rollback()
+    return plans
+
+
+def execution_time(plan):
+    for line in reversed(plan):
+        if line.startswith("Execution Time"):
+            return line.split(":", 1)[1].strip()
+    return "n/a"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--migration", default=DEFAULT_MIGRATION, help="Migration whose indexes are compared")
+    parser.add_argument("--query", action="append", choices=sorted(HOT_QUERIES), help="Only explain this query")
+    args = parser.parse_args()
+
+    queries = args.query or list(HOT_QUERIES)
+    created, dropped = load_index_changes(args.migration)
+    legacy = load_legacy_definitions(args.migration)
+    tables = sorted(set(created.values()) | {
+        CREATE_INDEX_RE.match(legacy[name]).group(3) for name in dropped if name in legacy
+    })
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT set_config('lock_timeout', %s, false)", (LOCK_TIMEOUT,))
+        # Committed, so the setting outlives the rolled-back transactions below
+        conn.commit()
+        with conn.cursor() as cur:
+            sample = pick_sample(cur)
+            present = existing_indexes(cur, list(created) + dropped)
+        conn.rollback()
+
+        missing = [name for name in created if name not in present]
+        if missing:
+            print(f"Warning: indexes not applied yet, 'after' plans will not use them: {', '.join(missing)}")
+
+        restore = [legacy[name] for name in dropped if name not in present and name in legacy]
+        before = collect_plans(conn, queries, sample, tables, skip=created, create=restore)
+        after = collect_plans(conn, queries, sample, tables)
+
+    print(f"Sample parameters: {sample}\n")
+    for name in queries:
+        print("=" * 80)
+        print(f"{name}: {execution_time(before[name])} -> {execution_time(after[name])}")
+        print("=" * 80)
+        diff = difflib.unified_diff(before[name], after[name], "without indexes", "with indexes", lineterm="")
+        print("\n".join(diff) or "(plans are identical)")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+Large-scale synthetic data generator for performance testing
+
+Creates production-sized volumes on top of the existing schema and venue:
+users with profiles, events spread over several years with zone pricing,
+bookings with skewed popularity (a few sold-out nights, a long tail of quiet
+ones, a small share of very active customers), matching transactions and
+audit rows. Everything is loaded with COPY from a pool of worker processes.
+
+Generation is deterministic: each chunk derives its own RNG from --seed and
+the chunk number, so the same seed produces the same data regardless of
+--workers. Row counts scale linearly with --scale (1.0 is roughly 1M users,
+5k events and 10M+ bookings):
+
+    python scripts/generate_data.py --scale 0.01 --seed 42
+    python scripts/generate_data.py --scale 1 --workers 8
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2  # noqa: E402
+
+from config import DATABASE_URL  # noqa: E402
+
+# Row counts at --scale 1.0
+BASE_USERS = 1_000_000
+BASE_EVENTS = 5_000
+BASE_SEATS = 5_000
+
+USER_CHUNK = 50_000
+EVENT_CHUNK = 25
+SALE_DAYS = 60
+
+# bcrypt("password"), shared by every generated account so no hashing is needed
+PASSWORD_HASH = "$2b$12$6It1o7A7q4a9i0hiMWZmSOM5ZkVgyllSwuKQ62VBEx8LmkPPhTzry"
+
+FIRST_NAMES = ["Анна", "Иван", "Мария", "Дмитрий", "Елена", "Алексей", "Ольга", "Сергей",
+               "Наталья", "Андрей", "Alex", "Maria", "John", "Kate", "Max", "Sofia"]
+LAST_NAMES = ["Иванов", "Петрова", "Смирнов", "Кузнецова", "Попов", "Соколова", "Лебедев",
+              "Козлова", "Новиков", "Морозова", "Smith", "Brown", "Wilson", "Taylor"]
+ARTISTS = ["Огни города", "Night Drive", "Северный ветер", "Bass Theory", "Полночь",
+           "Deep Echo", "Красная линия", "Neon Youth", "Тёплый ламповый", "Sunset Crew"]
+FORMATS = {
+    "Концерт": "Живой концерт: {artist}",
+    "Вечеринка": "Вечеринка {artist}: хиты {decade}-х",
+    "Караоке": "Караоке-ночь с {artist}",
+    "Stand-up": "Stand-up вечер: {artist}",
+    "Корпоратив": "Корпоративный вечер {artist}",
+    "Частное мероприятие": "Закрытая вечеринка {artist}",
+}
+PAYMENT_METHODS = ["card", "card", "card", "sbp", "cash"]
+ZONE_PRICES = [3000, 1000, 1500, 1200, 800, 2000]
+
+
+def copy_rows(cur, table, columns, rows):
+    """COPY an iterable of tuples into a table (None becomes NULL)"""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join("\\N" if v is None else str(v).replace("\\", "\\\\") for v in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+
+def chunk_rng(seed, *parts):
+    return random.Random(f"{seed}:{':'.join(map(str, parts))}")
+
+
+def skewed_index(rng, n, power=3.0):
+    """Index in [0, n) biased towards 0: a few very active users, a long tail"""
+    return int(n * rng.random() ** power)
+
+
+def fmt_ts(value):
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def generate_users(task):
+    """Worker: users and their profiles for one id range"""
+    seed, first_id, count, now = task
+    rng = chunk_rng(seed, "users", first_id)
+    users, profiles = [], []
+    for user_id in range(first_id, first_id + count):
+        created = now - timedelta(days=rng.randint(0, 5 * 365), seconds=rng.randint(0, 86400))
+        users.append((user_id, f"gen_user_{user_id}", f"gen_user_{user_id}@example.com",
+                      PASSWORD_HASH, "user", fmt_ts(created), "t"))
+        phone = f"+7 (9{rng.randint(10, 99)}) {rng.randint(100, 999)}-{rng.randint(10, 99)}-{rng.randint(10, 99)}"
+        birth = (now - timedelta(days=rng.randint(18 * 365, 60 * 365))).date()
+        profiles.append((user_id, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES),
+                         phone if rng.random() < 0.7 else None, birth))
+
+    with psycopg2.connect(DATABASE_URL) as conn, conn.cursor() as cur:
+        copy_rows(cur, "users", ["user_id", "username", "email", "password_hash", "role", "created_at", "is_active"], users)
+        copy_rows(cur, "user_profiles", ["user_id", "first_name", "last_name", "phone", "birth_date"], profiles)
+    conn.close()
+    return count
+
+
+def generate_bookings(task):
+    """Worker: bookings, transactions and audit rows for a slice of events"""
+    (seed, events, seats, zone_price, user_range, booking_base, max_per_event,
+     audit_date_column, now) = task
+    first_user, user_count = user_range
+    bookings, transactions, audits = [], [], []
+
+    for event in events:
+        rng = chunk_rng(seed, "bookings", event["event_id"])
+        event_date = event["event_date"]
+        sale_start = event_date - timedelta(days=SALE_DAYS)
+        sale_end = min(event_date, now)
+        if sale_end <= sale_start:
+            continue
+        # Upcoming events have only sold the part of the sale window already elapsed
+        sold_share = min(1.0, (sale_end - sale_start) / timedelta(days=SALE_DAYS))
+        free = [(seat_id, int(zone_price[zone_id] * event["multiplier"])) for seat_id, zone_id in seats]
+        rng.shuffle(free)
+        active = int(len(free) * event["occupancy"] * sold_share)
+        cancelled = int(active * rng.uniform(0.05, 0.2))
+        sale_seconds = int((sale_end - sale_start).total_seconds())
+        booking_id = booking_base + event["index"] * max_per_event
+
+        for n in range(min(active + cancelled, max_per_event)):
+            # Active bookings take distinct seats; cancelled ones may repeat a seat
+            seat_id, price = free[n] if n < active else rng.choice(free)
+            if n >= active or event["status"] == "cancelled":
+                status = "cancelled"
+            elif event_date < now or rng.random() < 0.9:
+                status = "confirmed"
+            else:
+                status = "pending"
+            user_id = first_user + skewed_index(rng, user_count)
+            booked_at = sale_start + timedelta(seconds=rng.randint(0, sale_seconds))
+            paid_at = booked_at + timedelta(minutes=rng.randint(1, 15))
+            paid = status == "confirmed" or (status == "cancelled" and rng.random() < 0.7)
+            method = rng.choice(PAYMENT_METHODS) if paid else "pending"
+            tx_status = {"confirmed": "completed", "pending": "pending"}.get(status, "refunded" if paid else "pending")
+            booking_id += 1
+
+            bookings.append((booking_id, user_id, event["event_id"], seat_id, fmt_ts(booked_at), status))
+            transactions.append((booking_id, booking_id, user_id, price, method,
+                                 fmt_ts(paid_at if paid else booked_at), tx_status))
+            audits.append((user_id, "create_booking", fmt_ts(booked_at), json.dumps(
+                {"booking_id": booking_id, "event_id": event["event_id"], "seat_id": seat_id, "price": price})))
+            if paid:
+                audits.append((user_id, "process_payment", fmt_ts(paid_at), json.dumps(
+                    {"booking_id": booking_id, "amount": price, "payment_method": method})))
+            if status == "cancelled":
+                cancelled_at = min(paid_at + timedelta(days=rng.randint(0, 7)), sale_end)
+                audits.append((user_id, "cancel_booking", fmt_ts(cancelled_at), json.dumps({"booking_id": booking_id})))
+
+    with psycopg2.connect(DATABASE_URL) as conn, conn.cursor() as cur:
+        copy_rows(cur, "bookings", ["booking_id", "user_id", "event_id", "seat_id", "booking_date", "status"], bookings)
+        copy_rows(cur, "transactions", ["transaction_id", "booking_id", "user_id", "amount", "payment_method",
+                                        "transaction_date", "status"], transactions)
+        copy_rows(cur, "audit_logs", ["user_id", "action", audit_date_column, "details"], audits)
+    conn.close()
+    return len(bookings), len(audits)
+
+
+def ensure_venue(cur, target_seats):
+    """Grow the venue with generated seats so events can hold target_seats bookings"""
+    cur.execute("SELECT zone_id, capacity FROM club_zones ORDER BY zone_id")
+    zones = cur.fetchall()
+    if not zones:
+        raise SystemExit("No club zones found - apply the migrations first")
+    cur.execute("SELECT COUNT(*) FROM seats")
+    missing = target_seats - cur.fetchone()[0]
+    if missing > 0:
+        total_capacity = sum(c for _, c in zones)
+        for zone_id, capacity in zones:
+            extra = max(1, missing * capacity // total_capacity)
+            cur.execute("""
+                INSERT INTO seats (zone_id, seat_number)
+                SELECT %s, 'G' || %s || '-' || LPAD(i::text, 5, '0')
+                FROM generate_series(1, %s) AS i
+                ON CONFLICT (zone_id, seat_number) DO NOTHING
+            """, (zone_id, zone_id, extra))
+    cur.execute("SELECT seat_id, zone_id FROM seats ORDER BY seat_id")
+    return cur.fetchall(), [z for z, _ in zones]
+
+
+def build_events(cur, rng, count, years, seats, zone_ids, now):
+    """Insert events and event_zones, return the rows bookings are generated for"""
+    cur.execute("SELECT category_id, name FROM event_categories ORDER BY category_id")
+    categories = cur.fetchall()
+    cur.execute("SELECT user_id FROM users WHERE role = 'admin' ORDER BY user_id LIMIT 1")
+    admin = cur.fetchone()
+    created_by = admin[0] if admin else None
+    cur.execute("SELECT COALESCE(MAX(event_id), 0) FROM events")
+    first_id = cur.fetchone()[0] + 1
+
+    start = now - timedelta(days=int(365 * years))
+    span_seconds = int((now + timedelta(days=90) - start).total_seconds())
+    zone_price = {zone_id: ZONE_PRICES[i % len(ZONE_PRICES)] for i, zone_id in enumerate(zone_ids)}
+
+    events, event_rows, zone_rows = [], [], []
+    for index in range(count):
+        event_id = first_id + index
+        category_id, category = rng.choice(categories)
+        title = FORMATS.get(category, "{artist}").format(artist=rng.choice(ARTISTS), decade=rng.choice([80, 90, 2000]))
+        event_date = (start + timedelta(seconds=rng.randint(0, span_seconds))).replace(minute=0, second=0, microsecond=0)
+        status = "planned" if event_date > now else rng.choice(["active", "active", "cancelled"])
+        # Skewed popularity: most nights are quiet, a few sell out
+        occupancy = min(0.98, rng.betavariate(0.8, 1.6) if rng.random() > 0.05 else rng.uniform(0.9, 0.98))
+        multiplier = rng.choice([0.8, 1.0, 1.0, 1.2, 1.5])
+
+        event_rows.append((event_id, category_id, title.replace("\t", " "), f"{title}. Сгенерировано для нагрузочных тестов",
+                           fmt_ts(event_date), "3 hours", len(seats), int(min(zone_price.values()) * multiplier),
+                           created_by, status))
+        for zone_id in zone_ids:
+            zone_rows.append((event_id, zone_id, 0, int(zone_price[zone_id] * multiplier)))
+        events.append({"event_id": event_id, "index": index, "event_date": event_date, "status": status,
+                       "occupancy": occupancy, "multiplier": multiplier})
+
+    copy_rows(cur, "events", ["event_id", "category_id", "title", "description", "event_date", "duration",
+                              "capacity", "ticket_price", "created_by", "status"], event_rows)
+    copy_rows(cur, "event_zones", ["event_id", "zone_id", "available_seats", "zone_price"], zone_rows)
+    cur.execute("""
+        UPDATE event_zones ez
+        SET available_seats = (SELECT COUNT(*) FROM seats s WHERE s.zone_id = ez.zone_id)
+        WHERE ez.event_id BETWEEN %s AND %s
+    """, (first_id, first_id + count - 1))
+    return events, zone_price
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=0.01, help="Scale factor (1.0 = production size)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--years", type=float, default=3, help="History covered by generated events")
+    parser.add_argument("--users", type=int, help="Override the scaled user count")
+    parser.add_argument("--events", type=int, help="Override the scaled event count")
+    parser.add_argument("--seats", type=int, help="Override the scaled venue size")
+    args = parser.parse_args()
+
+    n_users = args.users or max(100, int(BASE_USERS * args.scale))
+    n_events = args.events or max(10, int(BASE_EVENTS * args.scale))
+    n_seats = args.seats or max(190, int(BASE_SEATS * min(1.0, args.scale * 10)))
+    now = datetime.now().replace(microsecond=0)
+    rng = chunk_rng(args.seed, "main")
+    started = time.perf_counter()
+
+    conn = psycopg2.connect(DATABASE_URL)
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT COALESCE(MAX(user_id), 0) FROM users")
+        first_user = cur.fetchone()[0] + 1
+        cur.execute("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_name = 'audit_logs' AND column_name IN ('created_at', 'action_date')
+        """)
+        audit_date_column = cur.fetchone()[0]
+        seats, zone_ids = ensure_venue(cur, n_seats)
+
+    print(f"Generating {n_users} users, {n_events} events on a {len(seats)}-seat venue "
+          f"(scale {args.scale}, seed {args.seed}, {args.workers} workers)")
+
+    with Pool(args.workers) as pool:
+        user_tasks = [(args.seed, first_id, min(USER_CHUNK, first_user + n_users - first_id), now)
+                      for first_id in range(first_user, first_user + n_users, USER_CHUNK)]
+        loaded = sum(pool.imap_unordered(generate_users, user_tasks))
+        print(f"  users: {loaded} ({time.perf_counter() - started:.1f}s)")
+
+        with conn, conn.cursor() as cur:
+            events, zone_price = build_events(cur, rng, n_events, args.years, seats, zone_ids, now)
+            cur.execute("""
+                SELECT GREATEST((SELECT COALESCE(MAX(booking_id), 0) FROM bookings),
+                                (SELECT COALESCE(MAX(transaction_id), 0) FROM transactions))
+            """)
+            booking_base = cur.fetchone()[0]
+        print(f"  events: {len(events)} ({time.perf_counter() - started:.1f}s)")
+
+        max_per_event = int(len(seats) * 1.25) + 1
+        booking_tasks = [
+            (args.seed, events[i:i + EVENT_CHUNK], seats, zone_price, (first_user, n_users),
+             booking_base, max_per_event, audit_date_column, now)
+            for i in range(0, len(events), EVENT_CHUNK)
+        ]
+        n_bookings = n_audits = 0
+        for done, (b, a) in enumerate(pool.imap_unordered(generate_bookings, booking_tasks), 1):
+            n_bookings += b
+            n_audits += a
+            if done % 20 == 0 or done == len(booking_tasks):
+                print(f"  bookings: {n_bookings} in {done}/{len(booking_tasks)} chunks "
+                      f"({time.perf_counter() - started:.1f}s)")
+
+    with conn, conn.cursor() as cur:
+        for table, column in [("users", "user_id"), ("user_profiles", "profile_id"), ("events", "event_id"),
+                              ("bookings", "booking_id"), ("transactions", "transaction_id")]:
+            cur.execute(f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), "
+                        f"(SELECT COALESCE(MAX({column}), 1) FROM {table}))")
+    conn.close()
+
+    analyze = psycopg2.connect(DATABASE_URL)
+    analyze.autocommit = True
+    with analyze.cursor() as cur:
+        for table in ["users", "user_profiles", "events", "event_zones", "seats", "bookings", "transactions", "audit_logs"]:
+            cur.execute(f"ANALYZE {table}")
+    analyze.close()
+
+    print(f"Done: {n_users} users, {len(events)} events, {n_bookings} bookings and transactions, "
+          f"{n_audits} audit rows in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -41,6 +41,7 @@ async function loadAdminPanel() {
 
         let users = [];
         let stats = null;
+        let statsErrors = {};
         
         try {
             console.log('Fetching admin data...');
@@ -75,6 +76,9 @@ async function loadAdminPanel() {
                 };
             }
             
+            // Sections that timed out come back as null and are named in stats.errors
+            statsErrors = stats.errors || {};
+            
         } catch (error) {
             console.error('Critical error loading admin data:', error);
             $('#content').html(`
@@ -140,11 +144,20 @@ async function loadAdminPanel() {
                 </div>
             ` : ''}
             
+            <!-- Partially loaded statistics -->
+            ${Object.keys(statsErrors).length > 0 ? `
+                <div class="alert alert-warning mb-4">
+                    <i class="fas fa-exclamation-triangle me-2"></i>
+                    <strong>Часть статистики недоступна:</strong>
+                    ${Object.entries(statsErrors).map(([section, message]) => `${section} (${message})`).join(', ')}
+                </div>
+            ` : ''}
+            
             <!-- Statistics Overview -->
             <div class="admin-stats">
                 <div class="stats-card">
                     <h3>Всего пользователей</h3>
-                    <h2 class="text-primary">${stats.overall.total_users || users.length}</h2>
+                    <h2 class="text-primary">${stats.overall ? (stats.overall.total_users || users.length) : '—'}</h2>
                     <div class="trend trend-up">
                         <i class="fas fa-users me-1"></i>
                         <span>Активные аккаунты</span>
@@ -152,7 +165,7 @@ async function loadAdminPanel() {
                 </div>
                 <div class="stats-card">
                     <h3>Предстоящие мероприятия</h3>
-                    <h2 class="text-info">${stats.overall.total_events || 0}</h2>
+                    <h2 class="text-info">${stats.overall ? (stats.overall.total_events || 0) : '—'}</h2>
                     <div class="trend trend-up">
                         <i class="fas fa-calendar-alt me-1"></i>
                         <span>Запланировано</span>
@@ -160,7 +173,7 @@ async function loadAdminPanel() {
                 </div>
                 <div class="stats-card">
                     <h3>Подтвержденные бронирования</h3>
-                    <h2 class="text-success">${stats.overall.total_bookings || 0}</h2>
+                    <h2 class="text-success">${stats.overall ? (stats.overall.total_bookings || 0) : '—'}</h2>
                     <div class="trend trend-up">
                         <i class="fas fa-ticket-alt me-1"></i>
                         <span>Подтверждено</span>
@@ -168,7 +181,7 @@ async function loadAdminPanel() {
                 </div>
                 <div class="stats-card">
                     <h3>Общая выручка</h3>
-                    <h2 class="text-warning">${formatPrice(stats.overall.total_revenue || 0)}</h2>
+                    <h2 class="text-warning">${stats.overall ? formatPrice(stats.overall.total_revenue || 0) : '—'}</h2>
                     <div class="trend trend-up">
                         <i class="fas fa-ruble-sign me-1"></i>
                         <span>Получено</span>
@@ -185,11 +198,16 @@ async function loadAdminPanel() {
                             <h5 class="card-title">
                                     <i class="fas fa-chart-line me-2"></i>Предстоящие мероприятия
                             </h5>
-                                <span class="badge bg-primary">${stats.upcoming_events.length} мероприятий</span>
+                                <span class="badge bg-primary">${stats.upcoming_events ? `${stats.upcoming_events.length} мероприятий` : 'нет данных'}</span>
                             </div>
                         </div>
                         <div class="card-body">
-                            ${stats.upcoming_events.length > 0 ? `
+                            ${!stats.upcoming_events ? `
+                                <div class="text-center py-4">
+                                    <i class="fas fa-exclamation-circle fa-3x text-muted mb-3"></i>
+                                    <h5 class="text-muted">Данные временно недоступны</h5>
+                                </div>
+                            ` : stats.upcoming_events.length > 0 ? `
                                 <div class="table-responsive">
                                     <table class="table admin-table">
                                         <thead>
@@ -263,7 +281,12 @@ async function loadAdminPanel() {
                             </h5>
                         </div>
                         <div class="card-body">
-                            ${stats.categories.length > 0 ? `
+                            ${!stats.categories ? `
+                                <div class="text-center py-3">
+                                    <i class="fas fa-exclamation-circle fa-2x text-muted mb-2"></i>
+                                    <p class="text-muted mb-0">Данные временно недоступны</p>
+                                </div>
+                            ` : stats.categories.length > 0 ? `
                                 <div class="category-stats">
                                     ${stats.categories.slice(0, 5).map(category => `
                                         <div class="category-item mb-3">
@@ -56,8 +56,9 @@ async function login(usernameOrEvent, password = null) {
         });
 
         if (response && response.access_token) {
-            // Store token
+            // Store token; the refresh token stays in an httpOnly cookie
             localStorage.setItem('access_token', response.access_token);
+            scheduleTokenRefresh();
             
             // Update current user
             currentUser = response.user;
@@ -93,6 +94,7 @@ async function logout() {
     } finally {
         // Always clear local data
         localStorage.removeItem('access_token');
+        clearTimeout(refreshTimer);
         currentUser = null;
         
         console.log('User logged out');
@@ -168,25 +170,62 @@ async function register(userDataOrEvent) {
     }
 }
 
-// Session refresh function
+// Session refresh: trade the refresh token cookie for a new access token.
+// Concurrent callers share one request, since each refresh token works once.
+let refreshInFlight = null;
+let refreshTimer = null;
+
 async function refreshSession() {
-    try {
-        const response = await apiRequest('/auth/refresh', {
-            method: 'POST'
-        });
+    if (!refreshInFlight) {
+        refreshInFlight = (async () => {
+            try {
+                const response = await apiRequest('/auth/refresh', {
+                    method: 'POST'
+                });
 
-        if (response && response.access_token) {
-            localStorage.setItem('access_token', response.access_token);
-            console.log('Session refreshed successfully');
-            return true;
-        }
-        return false;
+                if (response && response.access_token) {
+                    localStorage.setItem('access_token', response.access_token);
+                    scheduleTokenRefresh();
+                    console.log('Session refreshed successfully');
+                    return true;
+                }
+                return false;
+            } catch (error) {
+                console.error('Session refresh error:', error);
+                return false;
+            } finally {
+                refreshInFlight = null;
+            }
+        })();
+    }
+    return refreshInFlight;
+}
+
+// Expiry (ms since epoch) of the stored access token, or null
+function accessTokenExpiry() {
+    const token = localStorage.getItem('access_token');
+    if (!token) return null;
+    try {
+        const payload = JSON.parse(atob(token.split('.')[1].replace(/-/g, '+').replace(/_/g, '/')));
+        return payload.exp ? payload.exp * 1000 : null;
     } catch (error) {
-        console.error('Session refresh error:', error);
-        return false;
+        return null;
     }
 }
 
+// Refresh a minute before the access token expires
+function scheduleTokenRefresh() {
+    clearTimeout(refreshTimer);
+    const expiry = accessTokenExpiry();
+    if (!expiry) return;
+    const delay = Math.max(expiry - Date.now() - 60 * 1000, 5 * 1000);
+    refreshTimer = setTimeout(async () => {
+        if (currentUser && localStorage.getItem('access_token')) {
+            await refreshSession();
+        }
+    }, delay);
+}
+
 // Check authentication status
 async function checkAuthStatus() {
     try {
@@ -215,6 +254,7 @@ async function checkAuthStatus() {
             
             console.log('Auth check successful, user:', currentUser);
             updateAuthUI();
+            scheduleTokenRefresh();
             return true;
         }
     } catch (error) {
@@ -449,12 +489,6 @@ $(document).ready(function() {
         await logout();
     });
     
-    // Start session refresh timer (every 25 minutes)
-    setInterval(async () => {
-        if (currentUser && localStorage.getItem('access_token')) {
-            await refreshSession();
-        }
-    }, 25 * 60 * 1000);
 });
 
 // Make functions globally available
@@ -462,5 +496,6 @@ window.login = login;
 window.register = register;
 window.logout = logout;
 window.checkAuthStatus = checkAuthStatus;
+window.refreshSession = refreshSession;
 window.showLoginModal = showLoginModal;
 window.showRegisterModal = showRegisterModal;
\ No newline at end of file
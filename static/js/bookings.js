@@ -178,6 +178,68 @@ async function loadMyBookings() {
     }
 }
 
+// Waiting room: high-demand events admit buyers in turns. The ticket from
+// POST /events/{id}/waiting-room is kept per event for the browser session
+// and sent in X-Queue-Token with the booking once it is admitted.
+const QUEUE_TOKEN_HEADER = 'X-Queue-Token';
+const QUEUE_POLL_MAX_SECONDS = 5;
+
+function getQueueTicket(eventId) {
+    try {
+        const ticket = JSON.parse(sessionStorage.getItem(`queue_ticket_${eventId}`));
+        return ticket && Date.now() / 1000 < ticket.expires_at ? ticket : null;
+    } catch (error) {
+        return null;
+    }
+}
+
+function setQueueTicket(eventId, ticket) {
+    if (ticket) {
+        sessionStorage.setItem(`queue_ticket_${eventId}`, JSON.stringify(ticket));
+    } else {
+        sessionStorage.removeItem(`queue_ticket_${eventId}`);
+    }
+}
+
+function showQueueStatus(ticket) {
+    $('#confirmBookingBtn').prop('disabled', true).html(`
+        <i class="fas fa-hourglass-half me-1"></i>В очереди: позиция ${ticket.position},
+        осталось ~${Math.ceil(ticket.eta_seconds)} с
+    `);
+}
+
+// Join the event's waiting room if needed and wait for admission;
+// returns the headers for the booking request (none when no room is open)
+async function waitForAdmission(eventId) {
+    let ticket = getQueueTicket(eventId);
+    if (!ticket) {
+        try {
+            ticket = await apiRequest(`/events/${eventId}/waiting-room`, { method: 'POST', quiet: true });
+        } catch (error) {
+            if (error.status === 404) {
+                return {};
+            }
+            throw error;
+        }
+        setQueueTicket(eventId, ticket);
+    }
+    
+    while (!ticket.admitted) {
+        showQueueStatus(ticket);
+        const delay = Math.min(Math.max(ticket.eta_seconds, 0.5), QUEUE_POLL_MAX_SECONDS);
+        await new Promise(resolve => setTimeout(resolve, delay * 1000));
+        const status = await apiRequest(`/events/${eventId}/waiting-room`, {
+            headers: { [QUEUE_TOKEN_HEADER]: ticket.token },
+            quiet: true
+        });
+        ticket = { ...ticket, ...status };
+        setQueueTicket(eventId, ticket);
+    }
+    
+    $('#confirmBookingBtn').html('<i class="fas fa-spinner fa-spin me-1"></i>Создание...');
+    return { [QUEUE_TOKEN_HEADER]: ticket.token };
+}
+
 // Create booking
 async function createBooking(eventId, seatId, zonePrice) {
     try {
@@ -188,14 +250,29 @@ async function createBooking(eventId, seatId, zonePrice) {
             return;
         }
 
-        const response = await apiRequest('/bookings/', {
+        const postBooking = async (quiet) => apiRequest('/bookings/', {
             method: 'POST',
+            headers: await waitForAdmission(eventId),
             body: JSON.stringify({
                 event_id: eventId,
                 seat_id: seatId
-            })
+            }),
+            quiet
         });
         
+        let response;
+        try {
+            response = await postBooking(true);
+        } catch (error) {
+            // 403/429: no ticket, an expired one, or a room opened meanwhile;
+            // queue (again) and retry once
+            if (error.status !== 403 && error.status !== 429) {
+                throw error;
+            }
+            setQueueTicket(eventId, null);
+            response = await postBooking(false);
+        }
+        
         if (response) {
             $('#bookingModal').modal('hide');
             showSuccess('Бронирование создано успешно');
@@ -124,6 +124,17 @@ async function apiRequest(endpoint, options = {}) {
         
         console.log(`API ${options.method || 'GET'} ${url}: ${response.status}`);
         
+        // Errors carry the status so callers can react to 403/404/429
+        const httpError = (message) => Object.assign(new Error(message), { status: response.status });
+        
+        // Expired access token: refresh once and repeat the request
+        const noRetry = ['/auth/refresh', '/auth/login', '/auth/logout'].some(path => endpoint.includes(path));
+        if (response.status === 401 && !noRetry && !options._retried && typeof refreshSession === 'function') {
+            if (await refreshSession()) {
+                return apiRequest(endpoint, { ...options, _retried: true });
+            }
+        }
+        
         // Handle specific status codes
         if (response.status === 401) {
             console.warn('Unauthorized - clearing auth data');
@@ -140,12 +151,12 @@ async function apiRequest(endpoint, options = {}) {
         
         if (response.status === 403) {
             const errorData = await response.json().catch(() => ({}));
-            throw new Error(errorData.detail || 'У вас нет прав для выполнения этого действия');
+            throw httpError(errorData.detail || 'У вас нет прав для выполнения этого действия');
         }
         
         if (response.status === 500) {
             const errorData = await response.json().catch(() => ({}));
-            throw new Error(errorData.detail || 'Внутренняя ошибка сервера');
+            throw httpError(errorData.detail || 'Внутренняя ошибка сервера');
         }
         
         // Parse JSON response
@@ -153,21 +164,21 @@ async function apiRequest(endpoint, options = {}) {
         if (contentType && contentType.includes('application/json')) {
             const data = await response.json();
             if (!response.ok) {
-                throw new Error(data.detail || `HTTP ${response.status}: ${response.statusText}`);
+                throw httpError(data.detail || `HTTP ${response.status}: ${response.statusText}`);
             }
             return data;
         }
         
         if (!response.ok) {
-            throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+            throw httpError(`HTTP ${response.status}: ${response.statusText}`);
         }
         
         return null;
     } catch (error) {
         console.error(`API error (${url}):`, error);
         
-        // Don't show network errors for auth endpoints
-        if (!endpoint.includes('/auth/') && !error.message.includes('Unauthorized')) {
+        // Don't show network errors for auth endpoints, nor errors the caller handles (quiet)
+        if (!options.quiet && !endpoint.includes('/auth/') && !error.message.includes('Unauthorized')) {
             // Only show error if it's not a network issue during auth check
             if (!(error.name === 'TypeError' && error.message.includes('fetch'))) {
                 showError(error.message || 'Ошибка сети');
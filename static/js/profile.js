@@ -340,7 +340,7 @@ async function changePassword() {
             return;
         }
         
-        await apiRequest('/users/me/password', {
+        const response = await apiRequest('/users/me/password', {
             method: 'PUT',
             body: JSON.stringify({
                 current_password: formData.get('current_password'),
@@ -348,6 +348,11 @@ async function changePassword() {
             })
         });
         
+        // Other sessions are signed out; keep this one with the new token
+        if (response && response.access_token) {
+            localStorage.setItem('access_token', response.access_token);
+        }
+        
         // Close modal and show success message
         $('#changePasswordModal').modal('hide');
         showSuccess('Пароль успешно изменен');
@@ -0,0 +1,147 @@
+"""
+Batched audit log writer
+
+log_user_action() used to open a connection and commit one INSERT per
+audited action, on the request path. AuditWriter queues the rows instead;
+a background thread writes them with one multi-row INSERT per batch, every
+AUDIT_FLUSH_INTERVAL_MS or as soon as AUDIT_BATCH_SIZE rows are waiting.
+Each row keeps the time it was queued, so created_at does not depend on
+when the batch lands. Pending rows are flushed on shutdown.
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from config import DATABASE_URL, AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL_MS, AUDIT_QUEUE_SIZE
+from utils.metrics import AUDIT_ROWS
+from utils.tracing import span
+
+logger = logging.getLogger('nightclub')
+
+
+class AuditWriter:
+    def __init__(self, batch_size: int, flush_interval: float, max_queue: int):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def submit(self, user_id: Optional[int], action: str, details: dict) -> None:
+        """Queue one audit row; never blocks the caller"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((user_id, action, json.dumps(details, default=str), datetime.now()))
+        except queue.Full:
+            AUDIT_ROWS.labels("dropped").inc()
+            logger.error(f"Audit queue full, dropped '{action}' for user {user_id}")
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                    self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Write everything queued so far and stop the thread"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = None
+            while len(batch) < self.batch_size:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if batch:
+                self._write(batch)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _insert(self, batch: list) -> None:
+        if self._conn is None or self._conn.closed:
+            self._conn = psycopg2.connect(DATABASE_URL)
+        with span("audit.write", {"audit.rows": len(batch)}), self._conn, self._conn.cursor() as cur:
+            execute_values(
+                cur,
+                "INSERT INTO audit_logs (user_id, action, details, created_at) VALUES %s",
+                batch,
+                page_size=len(batch)
+            )
+
+    def _drop_connection(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _insert_valid(self, batch: list) -> list:
+        """Insert the rows that satisfy the constraints, halving on failure; returns the rejected rows"""
+        try:
+            self._insert(batch)
+            return []
+        except psycopg2.IntegrityError:
+            if len(batch) == 1:
+                return batch
+        middle = len(batch) // 2
+        return self._insert_valid(batch[:middle]) + self._insert_valid(batch[middle:])
+
+    def _write(self, batch: list) -> None:
+        for attempt in (1, 2):
+            try:
+                self._insert(batch)
+                AUDIT_ROWS.labels("written").inc(len(batch))
+                return
+            except psycopg2.IntegrityError:
+                # One bad row (e.g. unknown user_id) must not cost the whole batch
+                try:
+                    rejected = self._insert_valid(batch)
+                except Exception as e:
+                    self._drop_connection()
+                    logger.error(f"Failed to write {len(batch)} audit rows: {e}")
+                    break
+                AUDIT_ROWS.labels("written").inc(len(batch) - len(rejected))
+                if rejected:
+                    AUDIT_ROWS.labels("failed").inc(len(rejected))
+                    actions = sorted({row[1] for row in rejected})
+                    logger.error(f"Dropped {len(rejected)} of {len(batch)} audit rows violating constraints: {actions}")
+                return
+            except psycopg2.OperationalError as e:
+                # Connection lost: reconnect once
+                self._drop_connection()
+                if attempt == 2:
+                    logger.error(f"Failed to write {len(batch)} audit rows: {e}")
+            except Exception as e:
+                logger.error(f"Failed to write {len(batch)} audit rows: {e}")
+                break
+        AUDIT_ROWS.labels("failed").inc(len(batch))
+
+
+audit_writer = AuditWriter(AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL_MS / 1000, AUDIT_QUEUE_SIZE)
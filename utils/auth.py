@@ -1,10 +1,15 @@
 from datetime import datetime, timedelta
 from typing import Optional
+import time
+import uuid
 import jwt
 from passlib.context import CryptContext
 from fastapi import HTTPException, Depends, Request, Cookie
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from config import JWT_SECRET_KEY, JWT_ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from utils.metrics import track_bcrypt, TOKEN_CACHE_LOOKUPS
+from utils.token_store import token_cache, revocations
+from utils.tracing import span
 import logging
 from pydantic import BaseModel
 
@@ -22,21 +27,25 @@ class SessionData(BaseModel):
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    with track_bcrypt("verify"), span("bcrypt.verify"):
+        return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """Get password hash"""
-    return pwd_context.hash(password)
+    with track_bcrypt("hash"), span("bcrypt.hash"):
+        return pwd_context.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
-    """Create JWT access token"""
+    """Create JWT access token with a unique jti so it can be revoked"""
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode.update({"exp": expire})
+    # iat keeps sub-second precision so a password change revokes tokens
+    # issued earlier in the same second but not the next login's token
+    to_encode.update({"exp": expire, "iat": time.time(), "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
     return encoded_jwt
 
@@ -63,8 +72,26 @@ async def get_current_user(
             detail="Authorization header required"
         )
 
+    # Verified tokens are cached until their exp; the returned dict is
+    # shared between requests with the same token and must not be modified
+    cache_key = token_cache.key(credentials.credentials)
+    user = token_cache.get(cache_key)
+    if user is not None:
+        TOKEN_CACHE_LOOKUPS.labels("hit").inc()
+    else:
+        TOKEN_CACHE_LOOKUPS.labels("miss").inc()
+        user = _verify_token(credentials.credentials)
+        token_cache.put(cache_key, user, user["exp"])
+
+    if revocations.is_revoked(user["jti"], user["user_id"], user["iat"]):
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+
+    return user
+
+def _verify_token(token: str) -> dict:
+    """Decode a token and build the standardized user object from its claims"""
     try:
-        payload = decode_token(credentials.credentials)
+        payload = decode_token(token)
     except HTTPException:
         raise
     except Exception as e:
@@ -80,15 +107,17 @@ async def get_current_user(
         )
 
     # Create standardized user object
-    user = {
+    return {
         "user_id": user_id,
         "username": payload.get("username"),
         "role": payload.get("role", "user"),
-        "sub": payload.get("sub", str(user_id))
+        "sub": payload.get("sub", str(user_id)),
+        "jti": payload.get("jti"),
+        "sid": payload.get("sid"),
+        "iat": payload.get("iat", 0),
+        "exp": payload["exp"]
     }
 
-    return user
-
 def check_role(allowed_roles: list):
     """Dependency to check user role"""
     async def role_checker(user: dict = Depends(get_current_user)):
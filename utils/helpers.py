@@ -5,20 +5,13 @@ Helper utilities for the Nightclub Booking System
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 import re
-import json
-from database import get_db_cursor
+from database import get_db_cursor, on_commit, prepared_statement, execute_prepared
+from utils.audit import audit_writer
+from utils.logging_config import should_sample
+from utils.tracing import span, traced
+from utils.user_cache import invalidate_all
 import logging
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('debug.log'),
-        logging.StreamHandler()
-    ]
-)
-
 logger = logging.getLogger('nightclub')
 
 def validate_phone_number(phone: str) -> bool:
@@ -144,14 +137,16 @@ def get_user_booking_history(user_id: int, limit: int = 10) -> List[Dict[str, An
         
         return [dict(booking) for booking in cur.fetchall()]
 
+_SEAT_AVAILABILITY = prepared_statement("seat_availability", """
+    SELECT COUNT(*) as count
+    FROM bookings
+    WHERE event_id = %s AND seat_id = %s AND status IN ('confirmed', 'pending')
+""")
+
 def check_seat_availability(event_id: int, seat_id: int) -> bool:
     """Check if a specific seat is available for an event"""
     with get_db_cursor() as cur:
-        cur.execute("""
-            SELECT COUNT(*) as count
-            FROM bookings
-            WHERE event_id = %s AND seat_id = %s AND status IN ('confirmed', 'pending')
-        """, (event_id, seat_id))
+        execute_prepared(cur, _SEAT_AVAILABILITY, (event_id, seat_id))
         
         result = cur.fetchone()
         return result["count"] == 0
@@ -230,10 +225,16 @@ def log_api_request(
 ) -> None:
     """
     Log detailed API request information for debugging
+
+    The payload is only built when DEBUG is enabled and the route is sampled;
+    serialization happens later in the logging listener thread. Errors are
+    always logged.
     """
+    if error is None and not (logger.isEnabledFor(logging.DEBUG) and should_sample(endpoint)):
+        return
+
     try:
         log_entry = {
-            "timestamp": datetime.now().isoformat(),
             "endpoint": endpoint,
             "method": method,
             "params": params,
@@ -260,27 +261,18 @@ def log_api_request(
                 "message": str(error),
                 "details": getattr(error, "detail", None)
             }
-
-        logger.debug(f"API Request: {json.dumps(log_entry, indent=2, default=str)}")
-
-        # If there's an error, log it as error level
-        if error:
-            logger.error(f"API Error in {method} {endpoint}: {str(error)}")
+            logger.error("API Error in %s %s: %s", method, endpoint, error, extra={"api": log_entry})
+        else:
+            logger.debug("API Request: %s %s", method, endpoint, extra={"api": log_entry})
 
     except Exception as e:
         logger.error(f"Error while logging API request: {str(e)}")
 
 def log_user_action(user_id: int, action: str, details: dict) -> None:
-    """Log user action to database"""
+    """Log user action to database (queued once the request's transaction commits, written in batches by utils.audit)"""
     try:
-        with get_db_cursor(commit=True) as cur:
-            cur.execute(
-                """
-                INSERT INTO audit_logs (user_id, action, details)
-                VALUES (%s, %s, %s)
-                """,
-                (user_id, action, json.dumps(details))
-            )
+        with span("audit.enqueue", {"audit.action": action}):
+            on_commit(lambda: audit_writer.submit(user_id, action, details))
     except Exception as e:
         logger.error(f"Failed to log user action: {str(e)}")
 
@@ -359,6 +351,7 @@ def generate_booking_confirmation_message(booking_id: int) -> str:
         Увидимся на мероприятии!
         """
 
+@traced("cleanup_expired_pending_bookings")
 def cleanup_expired_pending_bookings():
     """Remove pending bookings older than 15 minutes"""
     with get_db_cursor(commit=True) as cur:
@@ -372,6 +365,7 @@ def cleanup_expired_pending_bookings():
         
         deleted_count = cur.rowcount
         if deleted_count > 0:
+            invalidate_all(cur)
             print(f"Cleaned up {deleted_count} expired pending bookings")
         
         return deleted_count
\ No newline at end of file
@@ -0,0 +1,264 @@
+"""
+Load shedding per route class
+
+Without a limit, an overloaded worker accepts every request and they all
+queue together until the clients time out. LoadShedder caps how many
+requests of each route class a worker runs at once (catalog, seat_map,
+booking, auth, admin_analytics, default for the rest of the API); a request
+over the cap waits in its class's queue for at most the class's queue-time
+budget and then gets a 503 with Retry-After instead.
+
+Classes have priorities (booking highest, admin_analytics lowest) and low
+priority work is shed first: a class may only start a request while the
+worker's total in flight is under its share of LOAD_SHED_MAX_IN_FLIGHT (50%
+for admin_analytics up to 100% for booking), freed slots go to the highest
+priority waiter, and when the queues are full a new request pushes out the
+newest waiter of a lower priority class. Retry-After grows as priority
+drops.
+
+Each class's cap adapts to its latency: once a second, if the average
+service time was above the class's target the cap shrinks by a fifth,
+and if requests had to queue under a healthy latency it grows back, up to
+the configured concurrency. load_shed_requests_total counts shed requests
+per class and reason; load_shed_limit shows the current caps.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Dict, NamedTuple, Optional
+
+from config import API_PREFIX, LOAD_SHED_MAX_IN_FLIGHT, LOAD_SHED_LIMITS
+from utils.metrics import LOAD_SHED_REQUESTS, LOAD_SHED_QUEUE_WAIT, LOAD_SHED_LIMIT
+
+logger = logging.getLogger('nightclub')
+
+# Adapt a class's cap at most this often, from at least this many completed requests
+ADAPT_INTERVAL = 1.0
+ADAPT_MIN_SAMPLES = 5
+
+
+class ClassLimits(NamedTuple):
+    """concurrency: requests run at once (0 = unlimited); queue_timeout: seconds a
+    request may wait for a slot; target_latency: service time the cap adapts to"""
+    concurrency: int
+    queue_timeout: float
+    target_latency: float
+
+
+# In shedding order: lowest priority first
+_DEFAULT_LIMITS = {
+    "admin_analytics": ClassLimits(4, 0.5, 5.0),
+    "default": ClassLimits(32, 1.0, 1.0),
+    "catalog": ClassLimits(64, 1.0, 0.25),
+    "seat_map": ClassLimits(64, 2.0, 0.5),
+    "auth": ClassLimits(32, 2.0, 1.0),
+    "booking": ClassLimits(32, 3.0, 1.0),
+}
+PRIORITIES = {name: priority for priority, name in enumerate(_DEFAULT_LIMITS)}
+_TOP_PRIORITY = len(PRIORITIES) - 1
+
+
+def _parse_limits(spec: str) -> dict:
+    """Parse "class=concurrency/queue/target,..." over the defaults, ignoring malformed entries"""
+    limits = dict(_DEFAULT_LIMITS)
+    for item in spec.split(","):
+        route_class, _, values = item.strip().partition("=")
+        route_class = route_class.strip()
+        if route_class not in limits:
+            continue
+        try:
+            concurrency, queue_timeout, target_latency = values.split("/")
+            limits[route_class] = ClassLimits(int(concurrency), float(queue_timeout), float(target_latency))
+        except ValueError:
+            continue
+    return limits
+
+
+def classify(method: str, path: str) -> Optional[str]:
+    """Route class of a request, or None for paths that are never shed (health, metrics, static)"""
+    if not path.startswith(API_PREFIX + "/"):
+        return None
+    section, _, rest = path[len(API_PREFIX) + 1:].partition("/")
+    if section == "admin":
+        return "admin_analytics"
+    if section == "auth":
+        return "auth"
+    if section == "bookings":
+        return "booking"
+    if section == "events":
+        if rest.endswith("/waiting-room"):
+            # Status polls are answered from memory; joining is part of buying
+            return "booking" if method == "POST" else None
+        if method == "GET":
+            return "seat_map" if rest.endswith("/seats") else "catalog"
+    return "default"
+
+
+class Overloaded(Exception):
+    """A request was shed; respond 503 with Retry-After"""
+
+    def __init__(self, route_class: str, reason: str):
+        super().__init__(f"{route_class} request shed: {reason}")
+        self.route_class = route_class
+        self.reason = reason
+        self.retry_after = 1 + _TOP_PRIORITY - PRIORITIES[route_class]
+
+
+class _RouteClass:
+    def __init__(self, name: str, limits: ClassLimits, capacity: int):
+        self.name = name
+        self.priority = PRIORITIES[name]
+        self.limits = limits
+        self.limit = float(limits.concurrency)
+        # Share of the worker's total in flight this class may fill
+        self.max_total = capacity * (0.5 + 0.5 * self.priority / _TOP_PRIORITY)
+        self.in_flight = 0
+        self.waiters: deque = deque()
+        self.window_start = time.monotonic()
+        self.samples = 0
+        self.latency_sum = 0.0
+        self.saturated = False
+        LOAD_SHED_LIMIT.labels(name).set(limits.concurrency)
+
+    def observe(self, latency: float, now: float) -> None:
+        """Record one service time; every ADAPT_INTERVAL move the cap towards the target latency"""
+        self.samples += 1
+        self.latency_sum += latency
+        if now - self.window_start < ADAPT_INTERVAL or self.samples < ADAPT_MIN_SAMPLES:
+            return
+        average = self.latency_sum / self.samples
+        previous = int(self.limit)
+        if average > self.limits.target_latency:
+            self.limit = max(1.0, self.limit * 0.8)
+        elif self.saturated:
+            self.limit = min(float(self.limits.concurrency), self.limit + max(1.0, self.limit / 10))
+        if int(self.limit) != previous:
+            logger.info(
+                f"Load shedding: {self.name} limit {previous} -> {int(self.limit)} "
+                f"(average {average * 1000:.0f} ms, target {self.limits.target_latency * 1000:.0f} ms)"
+            )
+            LOAD_SHED_LIMIT.labels(self.name).set(int(self.limit))
+        self.window_start = now
+        self.samples = 0
+        self.latency_sum = 0.0
+        self.saturated = False
+
+
+class LoadShedder:
+    """Per-worker admission of requests by route class; used from the event loop only"""
+
+    def __init__(self, limits: Dict[str, ClassLimits], capacity: int):
+        self.capacity = capacity
+        self.in_flight = 0
+        self.queued = 0
+        self.classes = {
+            name: _RouteClass(name, class_limits, capacity)
+            for name, class_limits in limits.items()
+            if class_limits.concurrency > 0
+        }
+        # Highest priority first, for handing out freed slots
+        self._by_priority = sorted(self.classes.values(), key=lambda c: -c.priority)
+
+    def _can_start(self, route_class: _RouteClass) -> bool:
+        if route_class.in_flight >= int(route_class.limit):
+            route_class.saturated = True
+            return False
+        return self.in_flight < route_class.max_total
+
+    def _start(self, route_class: _RouteClass) -> None:
+        route_class.in_flight += 1
+        self.in_flight += 1
+
+    def _shed(self, route_class: _RouteClass, reason: str) -> Overloaded:
+        LOAD_SHED_REQUESTS.labels(route_class.name, reason).inc()
+        return Overloaded(route_class.name, reason)
+
+    def _make_room(self, route_class: _RouteClass) -> bool:
+        """Push out the newest waiter of the lowest priority class below route_class"""
+        for other in reversed(self._by_priority):
+            if other.priority >= route_class.priority:
+                return False
+            while other.waiters:
+                waiter = other.waiters.pop()
+                self.queued -= 1
+                if not waiter.done():
+                    waiter.set_exception(self._shed(other, "preempted"))
+                    return True
+        return False
+
+    async def acquire(self, name: Optional[str]) -> Optional[_RouteClass]:
+        """Wait for a slot of class `name`; returns the handle for release() or raises Overloaded"""
+        route_class = self.classes.get(name) if self.capacity > 0 else None
+        if route_class is None:
+            return None
+        if not route_class.waiters and self._can_start(route_class):
+            self._start(route_class)
+            return route_class
+
+        if route_class.limits.queue_timeout <= 0:
+            raise self._shed(route_class, "queue_full")
+        if self.queued >= self.capacity and not self._make_room(route_class):
+            raise self._shed(route_class, "queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        route_class.waiters.append(waiter)
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait((waiter,), timeout=route_class.limits.queue_timeout)
+        except asyncio.CancelledError:
+            # Client gone while queued; give back a slot handed over meanwhile
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                self.release(route_class)
+            else:
+                self._forget(route_class, waiter)
+            raise
+        LOAD_SHED_QUEUE_WAIT.labels(route_class.name).observe(time.monotonic() - started)
+        if not waiter.done():
+            self._forget(route_class, waiter)
+            raise self._shed(route_class, "queue_timeout")
+        waiter.result()
+        return route_class
+
+    def _forget(self, route_class: _RouteClass, waiter: asyncio.Future) -> None:
+        waiter.cancel()
+        try:
+            route_class.waiters.remove(waiter)
+            self.queued -= 1
+        except ValueError:
+            pass
+
+    def release(self, route_class: Optional[_RouteClass], latency: Optional[float] = None) -> None:
+        """Free a slot taken by acquire() and hand it to the highest priority waiter that fits"""
+        if route_class is None:
+            return
+        route_class.in_flight -= 1
+        self.in_flight -= 1
+        if latency is not None:
+            route_class.observe(latency, time.monotonic())
+        for candidate in self._by_priority:
+            while candidate.waiters and self._can_start(candidate):
+                waiter = candidate.waiters.popleft()
+                self.queued -= 1
+                if not waiter.done():
+                    self._start(candidate)
+                    waiter.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "classes": {
+                name: {
+                    "limit": int(c.limit),
+                    "in_flight": c.in_flight,
+                    "queued": len(c.waiters),
+                }
+                for name, c in self.classes.items()
+            },
+        }
+
+
+load_shedder = LoadShedder(_parse_limits(LOAD_SHED_LIMITS), LOAD_SHED_MAX_IN_FLIGHT)
@@ -0,0 +1,142 @@
+"""
+Structured, non-blocking logging for the Nightclub Booking System
+
+Log calls made from the event loop only enqueue the LogRecord. Formatting,
+JSON serialization and file I/O happen in a QueueListener thread, with
+size- or time-based rotation for the log file. log_api_request() style
+helpers can use should_sample() to drop most of the records of chatty
+routes before building any payload.
+"""
+
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from config import (
+    LOG_LEVEL,
+    LOG_FILE,
+    LOG_ROTATION,
+    LOG_MAX_BYTES,
+    LOG_BACKUP_COUNT,
+    LOG_ROTATION_WHEN,
+    LOG_SAMPLE_RATES,
+)
+
+CONSOLE_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_ROUTE_ID_RE = re.compile(r"/\d+(?=/|$)")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Render a record as one compact JSON line, including `extra` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves all formatting to the listener thread.
+
+    The stock QueueHandler.prepare() formats the message in the calling
+    thread so records can be pickled; the queue here is in-process, so the
+    record is enqueued untouched and the event loop pays only for the put.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _build_file_handler() -> logging.Handler:
+    if LOG_ROTATION == "time":
+        return logging.handlers.TimedRotatingFileHandler(
+            LOG_FILE, when=LOG_ROTATION_WHEN, backupCount=LOG_BACKUP_COUNT,
+            encoding="utf-8", delay=True
+        )
+    return logging.handlers.RotatingFileHandler(
+        LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+        encoding="utf-8", delay=True
+    )
+
+
+def setup_logging() -> None:
+    """Route all logging through a queue drained by a background listener.
+
+    Safe to call more than once; only the first call installs handlers.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+
+    handlers = [console_handler]
+    if LOG_FILE:
+        file_handler = _build_file_handler()
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(LOG_LEVEL)
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Parse "route=rate,route=rate" into a dict, ignoring malformed entries"""
+    rates = {}
+    for item in spec.split(","):
+        route, _, rate = item.strip().partition("=")
+        try:
+            rates[route.strip()] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            continue
+    return rates
+
+
+_sample_rates = _parse_sample_rates(LOG_SAMPLE_RATES)
+
+
+def route_template(endpoint: str) -> str:
+    """Collapse numeric path segments: /events/42/seats -> /events/{id}/seats"""
+    return _ROUTE_ID_RE.sub("/{id}", endpoint)
+
+
+def should_sample(endpoint: str) -> bool:
+    """Decide whether a debug record for this route should be emitted"""
+    rate = _sample_rates.get(route_template(endpoint), 1.0)
+    return rate >= 1.0 or random.random() < rate
@@ -0,0 +1,174 @@
+"""
+Prometheus metrics for the Nightclub Booking System
+
+All metrics live in the default registry. When several uvicorn workers are
+running, set PROMETHEUS_MULTIPROC_DIR to an empty, writable directory before
+the workers start: prometheus_client then keeps the values in per-process
+files and /metrics aggregates them across workers.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+MULTIPROCESS_MODE = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+# HTTP
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being processed",
+    multiprocess_mode="livesum",
+)
+
+# Database
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds",
+    "SQL statement latency by call site",
+    ["call_site"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+DB_CONNECTION_WAIT = Histogram(
+    "db_connection_wait_seconds",
+    "Time spent waiting to obtain a database connection",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+DB_CONNECTIONS_OPENED = Counter(
+    "db_connections_opened_total",
+    "Database connections opened because none was idle in the pool",
+)
+DB_QUERIES_INTERRUPTED = Counter(
+    "db_queries_interrupted_total",
+    "Requests whose database work was cut short (statement_timeout, lock_timeout, deadline, client_disconnected)",
+    ["reason"],
+)
+PREPARED_STATEMENT_CALLS = Counter(
+    "db_prepared_statement_calls_total",
+    "Prepared statement executions; 'prepared' means it was PREPAREd on that connection first",
+    ["statement", "outcome"],
+)
+
+SINGLE_FLIGHT_REQUESTS = Counter(
+    "single_flight_requests_total",
+    "Coalesced reads: 'leader' ran the query, 'follower' shared its result, 'rejected' hit the waiter limit",
+    ["group", "role"],
+)
+
+LOAD_SHED_REQUESTS = Counter(
+    "load_shed_requests_total",
+    "Requests answered 503 by load shedding: 'queue_full', 'queue_timeout' or 'preempted' by higher priority work",
+    ["route_class", "reason"],
+)
+LOAD_SHED_QUEUE_WAIT = Histogram(
+    "load_shed_queue_wait_seconds",
+    "Time requests waited for a slot of their route class",
+    ["route_class"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0),
+)
+LOAD_SHED_LIMIT = Gauge(
+    "load_shed_limit",
+    "Current adaptive concurrency limit per route class and worker",
+    ["route_class"],
+    multiprocess_mode="liveall",
+)
+
+# Password hashing
+BCRYPT_IN_PROGRESS = Gauge(
+    "bcrypt_operations_in_progress",
+    "bcrypt hash/verify calls currently queued or running",
+    ["operation"],
+    multiprocess_mode="livesum",
+)
+BCRYPT_LATENCY = Histogram(
+    "bcrypt_duration_seconds",
+    "bcrypt hash/verify latency",
+    ["operation"],
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0),
+)
+
+# Authentication
+TOKEN_CACHE_LOOKUPS = Counter(
+    "jwt_cache_lookups_total",
+    "Verified-token cache lookups",
+    ["result"],
+)
+USER_CACHE_LOOKUPS = Counter(
+    "user_cache_lookups_total",
+    "Current-user profile/stats cache lookups",
+    ["result"],
+)
+AUTH_RATE_LIMITED = Counter(
+    "auth_rate_limited_total",
+    "Login/registration attempts rejected by the rate limiter",
+    ["endpoint", "scope"],
+)
+
+# Audit log
+AUDIT_ROWS = Counter(
+    "audit_rows_total",
+    "Audit rows by outcome (written, failed, dropped)",
+    ["outcome"],
+)
+
+# Business counters
+BOOKINGS_CREATED = Counter("bookings_created_total", "Bookings created")
+PAYMENTS_PROCESSED = Counter("payments_processed_total", "Payments completed")
+PAYMENTS_AMOUNT = Counter("payments_amount_total", "Sum of completed payment amounts")
+AUTO_BOOKING_CLAIMS = Counter(
+    "auto_booking_claims_total",
+    "Best-available seat claims: 'claimed', 'conflict' (seats taken meanwhile, retried) or 'sold_out'",
+    ["outcome"],
+)
+WAITING_ROOM_CHECKS = Counter(
+    "waiting_room_checks_total",
+    "Waiting room joins and admission checks (joined, admitted, waiting, rejected)",
+    ["outcome"],
+)
+BOOKINGS_CANCELLED = Counter(
+    "bookings_cancelled_total",
+    "Bookings cancelled",
+    ["reason"],
+)
+
+
+@contextmanager
+def track_bcrypt(operation: str):
+    """Measure a bcrypt call and count it as in progress while it runs"""
+    gauge = BCRYPT_IN_PROGRESS.labels(operation)
+    gauge.inc()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        BCRYPT_LATENCY.labels(operation).observe(time.perf_counter() - start)
+        gauge.dec()
+
+
+def render_metrics() -> tuple:
+    """Return (payload, content type) for the /metrics endpoint"""
+    if MULTIPROCESS_MODE:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead() -> None:
+    """Drop live gauges of this worker from the multiprocess directory"""
+    if MULTIPROCESS_MODE:
+        multiprocess.mark_process_dead(os.getpid())
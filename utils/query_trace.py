@@ -0,0 +1,182 @@
+"""
+Per-request SQL tracing and slow query log
+
+database.InstrumentedCursor reports every statement here. Statements are
+attributed to the current HTTP request through a contextvar set by the
+tracing middleware in main.py, so a request can report how many queries it
+ran, how long they took and which SQL shapes were repeated (N+1 patterns).
+Statements slower than SLOW_QUERY_THRESHOLD_MS are logged with their plan,
+taken in the background on another connection (database.run_in_background)
+so the slow request does not also wait for the EXPLAIN; EXECUTEs of
+prepared statements are explained from their registered SQL.
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import List, Optional
+
+from config import SLOW_QUERY_THRESHOLD_MS, SLOW_QUERY_EXPLAIN, QUERY_BUDGET_PER_REQUEST
+
+logger = logging.getLogger('nightclub.sql')
+
+_EXPLAINABLE = ("select", "with", "insert", "update", "delete")
+_EXECUTE_RE = re.compile(r"\s*EXECUTE\s+(\w+)", re.IGNORECASE)
+# Plans are best effort: a short statement_timeout, and at most this many at
+# once so a burst of slow queries does not take over the shared worker threads
+EXPLAIN_TIMEOUT_SECONDS = 1
+_explain_slots = threading.BoundedSemaphore(2)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM_RE = re.compile(r"%(?:\(\w+\))?s")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql: str) -> str:
+    """Normalize a statement so that calls differing only in values compare equal"""
+    text = _STRING_RE.sub("?", sql)
+    text = _PARAM_RE.sub("?", text)
+    text = _NUMBER_RE.sub("?", text)
+    text = _IN_LIST_RE.sub("(?...)", text)
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+class QueryRecord:
+    __slots__ = ("fingerprint", "duration_ms", "rowcount", "call_site")
+
+    def __init__(self, fingerprint: str, duration_ms: float, rowcount: int, call_site: str):
+        self.fingerprint = fingerprint
+        self.duration_ms = duration_ms
+        self.rowcount = rowcount
+        self.call_site = call_site
+
+
+class RequestQueryTrace:
+    """Statements executed while serving one request"""
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.queries: List[QueryRecord] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    @property
+    def db_time_ms(self) -> float:
+        return sum(q.duration_ms for q in self.queries)
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def repeated(self, minimum: int = 3) -> list:
+        """Fingerprints executed at least `minimum` times - likely N+1 loops"""
+        counts = Counter(q.fingerprint for q in self.queries)
+        return [(fp, n) for fp, n in counts.most_common() if n >= minimum]
+
+    def server_timing(self) -> str:
+        return (
+            f'db;dur={self.db_time_ms:.1f};desc="{self.count} queries", '
+            f'app;dur={self.elapsed_ms():.1f}'
+        )
+
+
+_current_trace: ContextVar[Optional[RequestQueryTrace]] = ContextVar("request_query_trace", default=None)
+
+
+def start_request_trace(method: str, path: str):
+    """Begin tracing a request; returns (trace, token for finish_request_trace)"""
+    trace = RequestQueryTrace(method, path)
+    return trace, _current_trace.set(trace)
+
+
+def finish_request_trace(trace: RequestQueryTrace, token) -> None:
+    """Stop tracing and warn when the request went over its query budget"""
+    _current_trace.reset(token)
+    if trace.count > QUERY_BUDGET_PER_REQUEST:
+        logger.warning(
+            "Query budget exceeded: %s %s ran %d queries (budget %d) in %.1f ms",
+            trace.method, trace.path, trace.count, QUERY_BUDGET_PER_REQUEST, trace.db_time_ms,
+            extra={"repeated_queries": trace.repeated()}
+        )
+
+
+def current_trace() -> Optional[RequestQueryTrace]:
+    return _current_trace.get()
+
+
+def _explainable_sql(sql: str) -> Optional[str]:
+    """SQL to put after EXPLAIN: the statement itself, or the SQL of a prepared statement it EXECUTEs"""
+    match = _EXECUTE_RE.match(sql)
+    if match:
+        from database import PREPARED_STATEMENTS
+        statement = PREPARED_STATEMENTS.get(match.group(1))
+        return statement.sql if statement is not None else None
+    return sql if sql.lstrip().lower().startswith(_EXPLAINABLE) else None
+
+
+def _explain(sql: str, params) -> str:
+    """Plan of a statement, on a connection of its own"""
+    from database import get_db_cursor
+    # The EXPLAIN is not part of the request that ran the slow statement
+    _current_trace.set(None)
+    try:
+        with get_db_cursor(autocommit=True, statement_timeout=EXPLAIN_TIMEOUT_SECONDS) as cur:
+            cur.execute("EXPLAIN " + sql, params)
+            return "\n".join(row["QUERY PLAN"] for row in cur.fetchall())
+    except Exception as e:
+        return f"EXPLAIN failed: {e}"
+
+
+def _log_slow_query(sql: str, params, duration_ms: float, rowcount: int, call_site: str,
+                    request: Optional[str], explain_sql: Optional[str] = None) -> None:
+    try:
+        plan = _explain(explain_sql, params) if explain_sql is not None else None
+    finally:
+        if explain_sql is not None:
+            _explain_slots.release()
+    logger.warning(
+        "Slow query (%.1f ms, %d rows) at %s: %s",
+        duration_ms, rowcount, call_site, fingerprint(sql),
+        extra={"plan": plan, "request": request}
+    )
+
+
+def statement_text(cursor, sql) -> str:
+    """SQL text of a statement passed to cursor.execute (str, bytes or sql.Composed)"""
+    if hasattr(sql, "as_string"):
+        return sql.as_string(cursor)
+    if isinstance(sql, bytes):
+        return sql.decode()
+    return sql if isinstance(sql, str) else str(sql)
+
+
+def record_query(cursor, sql, params, duration: float, call_site: str) -> None:
+    """Attribute one executed statement to the current request and log it if slow"""
+    sql = statement_text(cursor, sql)
+    duration_ms = duration * 1000
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.queries.append(QueryRecord(fingerprint(sql), duration_ms, cursor.rowcount, call_site))
+
+    if duration_ms >= SLOW_QUERY_THRESHOLD_MS:
+        args = (sql, params, duration_ms, cursor.rowcount, call_site,
+                f"{trace.method} {trace.path}" if trace else None)
+        explain_sql = _explainable_sql(sql) if SLOW_QUERY_EXPLAIN else None
+        if explain_sql is not None and _explain_slots.acquire(blocking=False):
+            from database import run_in_background
+            try:
+                run_in_background(_log_slow_query, *args, explain_sql)
+                return
+            except Exception:
+                _explain_slots.release()
+        _log_slow_query(*args)
@@ -0,0 +1,213 @@
+"""
+Sliding-window rate limiting for login and registration
+
+Every attempt is checked against a limit per client IP and, for logins, per
+username, before the database lookup and long before bcrypt runs, so a
+credential-stuffing burst costs a dict lookup per attempt instead of a hash.
+
+Limits use the sliding window counter approximation: the count of the
+current fixed window plus the previous window's count weighted by how much
+of it still overlaps the sliding window. Rejected attempts are not counted.
+
+RATE_LIMIT_BACKEND selects where the counters live:
+
+- "memory" (default): per worker process
+- "postgres": shared by all workers through the UNLOGGED table from
+  migrations/13_rate_limits.sql, one statement per check; if the database
+  call fails the in-memory counters are used instead
+"""
+
+import logging
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import HTTPException, Request
+
+from config import (
+    RATE_LIMIT_BACKEND,
+    RATE_LIMIT_LOGIN_PER_IP,
+    RATE_LIMIT_LOGIN_PER_USERNAME,
+    RATE_LIMIT_REGISTER_PER_IP,
+)
+from database import get_db_cursor
+from utils.metrics import AUTH_RATE_LIMITED
+
+logger = logging.getLogger('nightclub')
+
+MAX_MEMORY_KEYS = 100_000
+
+
+def parse_limit(spec: str) -> Optional[tuple]:
+    """"20/60" -> (20, 60.0): 20 attempts per 60 seconds; None disables the limit"""
+    try:
+        count, _, period = spec.partition("/")
+        limit = (int(count), float(period))
+    except ValueError:
+        logger.error(f"Invalid rate limit '{spec}', expected '<count>/<seconds>'; limit disabled")
+        return None
+    return limit if limit[0] > 0 and limit[1] > 0 else None
+
+
+def _retry_after(limit: int, period: float, current: int, previous: int, now: float) -> int:
+    """Seconds until an attempt would fit under the limit again"""
+    elapsed = (now % period) / period
+    if current >= limit or previous == 0:
+        return max(1, math.ceil(period * (1 - elapsed)))
+    # Wait until the previous window's weight has decayed enough
+    needed = 1 - (limit - current) / previous
+    return max(1, math.ceil((needed - elapsed) * period))
+
+
+class MemoryStore:
+    """Per-process counters: key -> [window start, current count, previous count]
+
+    Least recently used first; past MAX_MEMORY_KEYS the oldest keys are
+    evicted, so a flood of distinct usernames cannot grow it without bound.
+    """
+
+    def __init__(self, max_keys: int = MAX_MEMORY_KEYS):
+        self.max_keys = max_keys
+        self._counters: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limit: int, period: float, now: float) -> int:
+        """Count an attempt if it fits; returns 0 or the Retry-After in seconds"""
+        window = now - now % period
+        with self._lock:
+            entry = self._counters.get(key)
+            if entry is None or entry[0] < window - period:
+                current, previous = 0, 0
+            elif entry[0] < window:
+                current, previous = 0, entry[1]
+            else:
+                current, previous = entry[1], entry[2]
+
+            weight = 1 - (now % period) / period
+            if previous * weight + current >= limit:
+                if entry is not None:
+                    # A key being throttled stays the least likely to be evicted
+                    self._counters.move_to_end(key)
+                return _retry_after(limit, period, current, previous, now)
+
+            self._counters[key] = [window, current + 1, previous]
+            self._counters.move_to_end(key)
+            while len(self._counters) > self.max_keys:
+                self._counters.popitem(last=False)
+            return 0
+
+    def reset(self, key: str) -> None:
+        with self._lock:
+            self._counters.pop(key, None)
+
+
+class PostgresStore:
+    """Counters shared across workers; one round trip per check"""
+
+    def __init__(self, fallback: MemoryStore):
+        self.fallback = fallback
+
+    def hit(self, key: str, limit: int, period: float, now: float) -> int:
+        window = int(now - now % period)
+        weight = 1 - (now % period) / period
+        try:
+            with get_db_cursor(commit=True) as cur:
+                cur.execute(
+                    """
+                    WITH counts AS (
+                        SELECT
+                            COALESCE(SUM(hits) FILTER (WHERE window_start = %(window)s), 0) AS current,
+                            COALESCE(SUM(hits) FILTER (WHERE window_start = %(previous)s), 0) AS previous
+                        FROM rate_limit_counters
+                        WHERE bucket = %(bucket)s AND window_start IN (%(window)s, %(previous)s)
+                    ), hit AS (
+                        INSERT INTO rate_limit_counters (bucket, window_start, hits)
+                        SELECT %(bucket)s, %(window)s, 1
+                        FROM counts
+                        WHERE counts.previous * %(weight)s + counts.current < %(limit)s
+                        ON CONFLICT (bucket, window_start)
+                        DO UPDATE SET hits = rate_limit_counters.hits + 1
+                        RETURNING hits
+                    )
+                    SELECT counts.current, counts.previous, EXISTS (SELECT 1 FROM hit) AS counted
+                    FROM counts
+                    """,
+                    {"bucket": key, "window": window, "previous": window - int(period),
+                     "weight": weight, "limit": limit}
+                )
+                row = cur.fetchone()
+                # Occasionally drop windows nobody will look at again
+                if random.random() < 0.001:
+                    cur.execute(
+                        "DELETE FROM rate_limit_counters WHERE window_start < %s",
+                        (window - 2 * int(_max_period()),)
+                    )
+        except Exception as e:
+            logger.error(f"Rate limit store unavailable, using in-process counters: {e}")
+            return self.fallback.hit(key, limit, period, now)
+
+        if row["counted"]:
+            return 0
+        return _retry_after(limit, period, row["current"], row["previous"], now)
+
+    def reset(self, key: str) -> None:
+        try:
+            with get_db_cursor(commit=True) as cur:
+                cur.execute("DELETE FROM rate_limit_counters WHERE bucket = %s", (key,))
+        except Exception as e:
+            logger.error(f"Failed to reset rate limit for {key}: {e}")
+        self.fallback.reset(key)
+
+
+LIMITS = {
+    ("login", "ip"): parse_limit(RATE_LIMIT_LOGIN_PER_IP),
+    ("login", "username"): parse_limit(RATE_LIMIT_LOGIN_PER_USERNAME),
+    ("register", "ip"): parse_limit(RATE_LIMIT_REGISTER_PER_IP),
+}
+
+
+def _max_period() -> float:
+    return max((limit[1] for limit in LIMITS.values() if limit), default=3600)
+
+
+_memory_store = MemoryStore()
+store = PostgresStore(_memory_store) if RATE_LIMIT_BACKEND == "postgres" else _memory_store
+
+
+def client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+def _bucket(endpoint: str, scope: str, value: str) -> str:
+    return f"{endpoint}:{scope}:{value}"
+
+
+def enforce_rate_limit(endpoint: str, request: Request, username: Optional[str] = None) -> None:
+    """Count an auth attempt, raising 429 with Retry-After when over a limit"""
+    now = time.time()
+    checks = [("ip", client_ip(request))]
+    if username is not None:
+        checks.append(("username", username.strip().lower()))
+
+    for scope, value in checks:
+        limit = LIMITS.get((endpoint, scope))
+        if limit is None:
+            continue
+        retry_after = store.hit(_bucket(endpoint, scope, value), limit[0], limit[1], now)
+        if retry_after:
+            AUTH_RATE_LIMITED.labels(endpoint, scope).inc()
+            logger.warning(f"Rate limited {endpoint} attempt by {scope} {value}")
+            raise HTTPException(
+                status_code=429,
+                detail="Too many attempts, please try again later",
+                headers={"Retry-After": str(retry_after)}
+            )
+
+
+def reset_rate_limit(endpoint: str, scope: str, value: str) -> None:
+    """Forget the attempts of a key, e.g. a username after a successful login"""
+    if LIMITS.get((endpoint, scope)) is not None:
+        store.reset(_bucket(endpoint, scope, value.strip().lower()))
@@ -0,0 +1,70 @@
+"""
+Fast JSON responses
+
+FastJSONResponse encodes with orjson (stdlib json if orjson is not
+installed) and understands what the routers return directly: RealDictRow,
+Decimal prices, datetime/date values and UUIDs, encoded the same way
+jsonable_encoder encodes them. main.py makes it the default response class.
+
+FastAPI still runs jsonable_encoder over a returned dict before the
+response class sees it; endpoints with large payloads (seat maps, lists,
+exports) return FastJSONResponse(...) themselves to skip that pass.
+Payloads serialized ahead of time, e.g. by a cache or by Postgres
+(database.fetch_json), are sent as they are with RawJSONResponse.
+"""
+
+import dataclasses
+import json
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Any
+from uuid import UUID
+
+from starlette.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        # Same as jsonable_encoder: whole numbers as int, the rest as float
+        return int(obj) if obj.as_tuple().exponent >= 0 else float(obj)
+    if isinstance(obj, timedelta):
+        return obj.total_seconds()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, "_asdict"):
+        # Rows of get_db_cursor(records=True)
+        return obj._asdict()
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json")
+    if orjson is None:
+        if isinstance(obj, (datetime, date, time)):
+            return obj.isoformat()
+        if isinstance(obj, UUID):
+            return str(obj)
+        if dataclasses.is_dataclass(obj):
+            return dataclasses.asdict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode a response payload to JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class RawJSONResponse(Response):
+    """Already encoded JSON bytes, sent without re-encoding"""
+    media_type = "application/json"
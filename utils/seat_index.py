@@ -0,0 +1,138 @@
+"""
+Per-event seat availability index for best-available booking
+
+POST /bookings/auto asks for `quantity` adjacent seats in a zone instead of
+a specific seat_id. Seats are ranked by their position in the venue layout
+(utils.venue, zone then seat_number order), and each worker keeps an index
+of the seats already taken per event so picking seats costs no query.
+
+The index may lag behind other workers' bookings; the booking INSERT is
+what claims seats (the unique idx_bookings_active_seat decides), and seats
+found taken there are marked so the next pick avoids them. Seats handed
+to a request are held until its claim ends, and each pick chooses at
+random among the best few free blocks, so concurrent requests spread over
+different seats instead of colliding on the front row. Entries are rebuilt
+after SEAT_INDEX_TTL_SECONDS or when the venue changes.
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+from config import SEAT_INDEX_TTL_SECONDS, AUTO_BOOKING_SPREAD
+from database import prepared_statement, execute_prepared
+from utils.venue import venue
+
+logger = logging.getLogger('nightclub')
+
+# Events kept per worker; an on-sale rush concerns a handful of them
+MAX_EVENTS = 256
+
+_EVENT_BOOKED_SEATS = prepared_statement("event_booked_seats", """
+    SELECT COALESCE(array_agg(seat_id), '{}') as seat_ids
+    FROM bookings
+    WHERE event_id = %s AND status IN ('confirmed', 'pending')
+""")
+
+
+def booked_seat_ids(cur, event_id: int) -> set:
+    """seat_ids with a pending or confirmed booking for the event"""
+    execute_prepared(cur, _EVENT_BOOKED_SEATS, (event_id,))
+    return set(cur.fetchone()["seat_ids"])
+
+
+class EventSeats:
+    """Taken and held seats of one event"""
+
+    def __init__(self, venue_version: int, taken: set):
+        self.venue_version = venue_version
+        self.loaded_at = time.monotonic()
+        self.taken = taken
+        self.held = set()
+
+    def pick(self, ranked: tuple, quantity: int, spread: int) -> Optional[List[int]]:
+        """Hold `quantity` adjacent free seats among the best `spread` blocks"""
+        unavailable = self.taken | self.held
+        blocks = []
+        run = 0
+        for position, seat_id in enumerate(ranked):
+            run = 0 if seat_id in unavailable else run + 1
+            if run == quantity:
+                blocks.append(ranked[position - quantity + 1:position + 1])
+                # Blocks do not overlap, so concurrent picks get disjoint seats
+                run = 0
+                if len(blocks) >= spread:
+                    break
+        if not blocks:
+            return None
+        seats = list(random.choice(blocks))
+        self.held.update(seats)
+        return seats
+
+
+class SeatIndex:
+    def __init__(self, max_events: int = MAX_EVENTS):
+        self.max_events = max_events
+        self._events: "OrderedDict[int, EventSeats]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(self, cur, event_id: int) -> EventSeats:
+        version = venue().version
+        with self._lock:
+            entry = self._events.get(event_id)
+            if (entry is not None and entry.venue_version == version
+                    and time.monotonic() - entry.loaded_at < SEAT_INDEX_TTL_SECONDS):
+                self._events.move_to_end(event_id)
+                return entry
+        fresh = EventSeats(version, booked_seat_ids(cur, event_id))
+        with self._lock:
+            if entry is not None:
+                # Seats still being claimed stay held
+                fresh.held = entry.held
+            self._events[event_id] = fresh
+            self._events.move_to_end(event_id)
+            while len(self._events) > self.max_events:
+                self._events.popitem(last=False)
+        return fresh
+
+    def hold(self, cur, event_id: int, zone_id: int, quantity: int) -> Optional[List[int]]:
+        """Best `quantity` adjacent free seats of the zone, held for the caller; None if there are none"""
+        entry = self._entry(cur, event_id)
+        ranked = tuple(seat.seat_id for seat in venue().seats_by_zone.get(zone_id, ()))
+        with self._lock:
+            return entry.pick(ranked, quantity, AUTO_BOOKING_SPREAD)
+
+    def settle(self, event_id: int, held: Iterable[int], taken: Iterable[int] = (),
+               stale: bool = False) -> None:
+        """End a hold; `taken` are the seats now booked (by the caller or by someone else).
+
+        stale=True reloads the event's bookings before the next pick, after
+        a claim found the index behind other workers' bookings.
+        """
+        with self._lock:
+            entry = self._events.get(event_id)
+            if entry is None:
+                return
+            entry.held.difference_update(held)
+            entry.taken.update(taken)
+            if stale:
+                entry.loaded_at = float("-inf")
+
+    def mark_taken(self, event_id: int, seat_ids: Iterable[int]) -> None:
+        with self._lock:
+            entry = self._events.get(event_id)
+            if entry is not None:
+                entry.taken.update(seat_ids)
+
+    def release(self, event_id: int, seat_ids: Iterable[int]) -> None:
+        """Seats freed by a cancellation in this worker"""
+        with self._lock:
+            entry = self._events.get(event_id)
+            if entry is not None:
+                entry.taken.difference_update(seat_ids)
+
+
+seat_index = SeatIndex()
@@ -0,0 +1,172 @@
+"""
+Per-device sessions and rotating refresh tokens
+
+A login opens a session (one row in auth_sessions) and hands out an opaque
+refresh token; only its SHA-256 is stored. POST /auth/refresh exchanges a
+refresh token for a new access token and a new refresh token of the same
+session, marking the old one as used. Presenting a used refresh token again
+means it was copied: the session is revoked together with the user's
+outstanding access tokens. The only exception is a request arriving within
+REFRESH_REUSE_GRACE_SECONDS of the rotation, which is what two browser tabs
+refreshing at the same time look like; it gets an access token but no new
+refresh token.
+
+All functions take the caller's cursor so they commit together with it;
+rotate_refresh_token() commits a revocation itself before failing.
+"""
+
+import hashlib
+import logging
+import secrets
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import HTTPException
+
+from config import REFRESH_TOKEN_EXPIRE_DAYS, REFRESH_REUSE_GRACE_SECONDS
+from database import prepared_statement, execute_prepared, commit_now
+from utils.token_store import revoke_user_tokens
+
+logger = logging.getLogger('nightclub')
+
+
+def _hash(refresh_token: str) -> str:
+    return hashlib.sha256(refresh_token.encode()).hexdigest()
+
+
+def _issue_refresh_token(cur, session_id: str) -> str:
+    refresh_token = secrets.token_urlsafe(32)
+    cur.execute(
+        """
+        INSERT INTO refresh_tokens (token_hash, session_id, expires_at)
+        VALUES (%s, %s, CURRENT_TIMESTAMP + make_interval(days => %s))
+        """,
+        (_hash(refresh_token), session_id, REFRESH_TOKEN_EXPIRE_DAYS)
+    )
+    return refresh_token
+
+
+def create_session(cur, user_id: int, user_agent: Optional[str], ip_address: Optional[str]) -> tuple:
+    """Open a session for a fresh login in one statement; returns (session_id, refresh_token)"""
+    session_id = str(uuid.uuid4())
+    refresh_token = secrets.token_urlsafe(32)
+    cur.execute(
+        """
+        WITH new_session AS (
+            INSERT INTO auth_sessions (session_id, user_id, user_agent, ip_address)
+            VALUES (%s, %s, %s, %s)
+            RETURNING session_id
+        )
+        INSERT INTO refresh_tokens (token_hash, session_id, expires_at)
+        SELECT %s, session_id, CURRENT_TIMESTAMP + make_interval(days => %s)
+        FROM new_session
+        """,
+        (session_id, user_id, (user_agent or "")[:500], ip_address,
+         _hash(refresh_token), REFRESH_TOKEN_EXPIRE_DAYS)
+    )
+    return session_id, refresh_token
+
+
+_REFRESH_TOKEN_LOOKUP = prepared_statement("refresh_token_lookup", """
+    SELECT rt.session_id, rt.expires_at, rt.used_at, s.revoked_at,
+           u.user_id, u.username, u.role, u.is_active
+    FROM refresh_tokens rt
+    JOIN auth_sessions s ON s.session_id = rt.session_id
+    JOIN users u ON u.user_id = s.user_id
+    WHERE rt.token_hash = %s
+    FOR UPDATE OF rt, s
+""")
+
+
+def rotate_refresh_token(cur, refresh_token: str) -> tuple:
+    """Consume a refresh token; returns (user row, session_id, new refresh token or None)
+
+    Raises 401 for unknown, expired or revoked tokens and on reuse.
+    """
+    execute_prepared(cur, _REFRESH_TOKEN_LOOKUP, (_hash(refresh_token),))
+    row = cur.fetchone()
+    now = datetime.now(timezone.utc)
+
+    if not row or row["revoked_at"] is not None or row["expires_at"] <= now:
+        raise HTTPException(status_code=401, detail="Invalid or expired refresh token")
+
+    session_id = str(row["session_id"])
+    if not row["is_active"]:
+        revoke_session(cur, session_id, "account_inactive")
+        commit_now(cur)
+        raise HTTPException(status_code=401, detail="Invalid or expired refresh token")
+
+    if row["used_at"] is not None:
+        if now - row["used_at"] <= timedelta(seconds=REFRESH_REUSE_GRACE_SECONDS):
+            return row, session_id, None
+        logger.warning(f"Refresh token reuse detected for user {row['user_id']}, revoking session {session_id}")
+        revoke_session(cur, session_id, "token_reuse")
+        revoke_user_tokens(cur, row["user_id"])
+        # Keep the revocation even though the request fails
+        commit_now(cur)
+        raise HTTPException(status_code=401, detail="Refresh token reuse detected, session revoked")
+
+    cur.execute(
+        "UPDATE refresh_tokens SET used_at = CURRENT_TIMESTAMP WHERE token_hash = %s",
+        (_hash(refresh_token),)
+    )
+    cur.execute(
+        """
+        DELETE FROM refresh_tokens
+        WHERE session_id = %s AND expires_at < CURRENT_TIMESTAMP
+        """,
+        (session_id,)
+    )
+    cur.execute(
+        "UPDATE auth_sessions SET last_used_at = CURRENT_TIMESTAMP WHERE session_id = %s",
+        (session_id,)
+    )
+    return row, session_id, _issue_refresh_token(cur, session_id)
+
+
+def revoke_session(cur, session_id: str, reason: str, user_id: Optional[int] = None) -> bool:
+    """Revoke one session (optionally only if it belongs to user_id)"""
+    cur.execute(
+        """
+        UPDATE auth_sessions
+        SET revoked_at = CURRENT_TIMESTAMP, revoked_reason = %s
+        WHERE session_id = %s AND revoked_at IS NULL
+          AND (%s::int IS NULL OR user_id = %s)
+        """,
+        (reason, session_id, user_id, user_id)
+    )
+    return cur.rowcount > 0
+
+
+def revoke_user_sessions(cur, user_id: int, reason: str, keep_session: Optional[str] = None) -> int:
+    """Revoke every session of a user except keep_session"""
+    cur.execute(
+        """
+        UPDATE auth_sessions
+        SET revoked_at = CURRENT_TIMESTAMP, revoked_reason = %s
+        WHERE user_id = %s AND revoked_at IS NULL
+          AND (%s::uuid IS NULL OR session_id <> %s::uuid)
+        """,
+        (reason, user_id, keep_session, keep_session)
+    )
+    return cur.rowcount
+
+
+def list_sessions(cur, user_id: int) -> list:
+    """Active sessions of a user, most recently used first"""
+    cur.execute(
+        """
+        SELECT session_id, user_agent, ip_address, created_at, last_used_at
+        FROM auth_sessions
+        WHERE user_id = %s AND revoked_at IS NULL
+          AND EXISTS (
+              SELECT 1 FROM refresh_tokens rt
+              WHERE rt.session_id = auth_sessions.session_id
+                AND rt.used_at IS NULL AND rt.expires_at > CURRENT_TIMESTAMP
+          )
+        ORDER BY last_used_at DESC
+        """,
+        (user_id,)
+    )
+    return [dict(row, session_id=str(row["session_id"])) for row in cur.fetchall()]
@@ -0,0 +1,72 @@
+"""
+Single-flight coalescing of identical reads
+
+When an event goes on sale, thousands of clients ask for the same event
+page and seat map at once. A SingleFlight group lets the first request for
+a key (the leader) run the load in a worker thread (database.run_detached)
+while later requests for the same key await that result instead of running
+the query again. The result is shared, so loaders return immutable values,
+e.g. encoded JSON bytes; an exception is raised in every waiter.
+
+At most `max_waiters` requests wait on one key; the rest get a 503 with
+Retry-After. single_flight_requests_total counts leaders, followers and
+rejections per group: followers / (leaders + followers) is the coalescing
+ratio.
+"""
+
+import asyncio
+import logging
+
+from fastapi import HTTPException
+
+from config import SINGLE_FLIGHT_MAX_WAITERS
+from database import run_detached
+from utils.metrics import SINGLE_FLIGHT_REQUESTS
+
+logger = logging.getLogger('nightclub')
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Per-worker group of in-flight loads keyed by what they read"""
+
+    def __init__(self, name: str, max_waiters: int = SINGLE_FLIGHT_MAX_WAITERS):
+        self.name = name
+        self.max_waiters = max_waiters
+        self._calls: dict = {}
+
+    async def do(self, key, fn, *args):
+        """Return fn(*args), sharing the run already in flight for `key` if there is one"""
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(run_detached(fn, *args)))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _, key=key: self._calls.pop(key, None))
+            SINGLE_FLIGHT_REQUESTS.labels(self.name, "leader").inc()
+        elif call.waiters >= self.max_waiters:
+            SINGLE_FLIGHT_REQUESTS.labels(self.name, "rejected").inc()
+            logger.warning(f"Single-flight {self.name} {key!r}: {call.waiters} waiters, rejecting")
+            raise HTTPException(
+                status_code=503,
+                detail="Too many concurrent requests, please retry",
+                headers={"Retry-After": "1"}
+            )
+        else:
+            SINGLE_FLIGHT_REQUESTS.labels(self.name, "follower").inc()
+
+        call.waiters += 1
+        try:
+            # Shielded: a waiter going away does not cancel the load for the others
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+
+    def __len__(self) -> int:
+        return len(self._calls)
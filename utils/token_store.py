@@ -0,0 +1,240 @@
+"""
+Verified JWT cache and token revocation list
+
+get_current_user() used to run a full HMAC verification for every request.
+TokenCache keeps the claims of recently verified tokens in a bounded LRU,
+keyed by the SHA-256 of the token and valid until the token's `exp`.
+
+RevocationList answers "is this token revoked?" with two dict lookups:
+
+- by `jti`, for a single token (logout)
+- by user, for every token issued before a cutoff (password change,
+  account deletion, role or status change)
+
+Revocations are written to Postgres (migrations/11_token_revocation.sql) and
+announced with NOTIFY in the same transaction. Every worker runs a listener
+thread that loads the tables at startup, applies notifications as they
+arrive and reloads periodically in case a notification was missed. Other
+per-worker caches can have their own channels served by the same thread,
+see subscribe().
+"""
+
+import hashlib
+import json
+import logging
+import select
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import psycopg2
+
+from config import DATABASE_URL, TOKEN_CACHE_SIZE, TOKEN_REVOCATION_SYNC_SECONDS
+from database import on_commit
+
+logger = logging.getLogger('nightclub')
+
+CHANNEL = "token_revoked"
+
+
+class TokenCache:
+    """Bounded LRU of verified token claims, expiring at the token's exp"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, key: bytes) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        claims, expires = entry
+        if expires <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return claims
+
+    def put(self, key: bytes, claims: dict, expires: float) -> None:
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = (claims, expires)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RevocationList:
+    """Revoked jtis and per-user cutoffs, mirrored from Postgres"""
+
+    def __init__(self):
+        self._jtis = {}      # jti -> exp (epoch seconds)
+        self._cutoffs = {}   # user_id -> tokens issued before this epoch are revoked
+
+    def is_revoked(self, jti: Optional[str], user_id: int, issued_at: float) -> bool:
+        if jti is not None and jti in self._jtis:
+            return True
+        cutoff = self._cutoffs.get(user_id)
+        return cutoff is not None and issued_at < cutoff
+
+    def add_jti(self, jti: str, expires: float) -> None:
+        self._jtis[jti] = expires
+
+    def add_cutoff(self, user_id: int, cutoff: float) -> None:
+        if cutoff > self._cutoffs.get(user_id, 0):
+            self._cutoffs[user_id] = cutoff
+
+    def replace(self, jtis: dict, cutoffs: dict) -> None:
+        self._jtis = jtis
+        self._cutoffs = cutoffs
+
+    def apply(self, payload: str) -> None:
+        """Apply a NOTIFY payload sent by revoke_token / revoke_user_tokens"""
+        try:
+            message = json.loads(payload)
+            if "jti" in message:
+                self.add_jti(message["jti"], float(message["exp"]))
+            else:
+                self.add_cutoff(int(message["user_id"]), float(message["before"]))
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring malformed revocation notification {payload!r}: {e}")
+
+    def __len__(self) -> int:
+        return len(self._jtis) + len(self._cutoffs)
+
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
+revocations = RevocationList()
+
+
+def revoke_token(cur, jti: str, user_id: int, expires: float) -> None:
+    """Revoke one token; takes effect in every worker when `cur` commits"""
+    cur.execute(
+        """
+        INSERT INTO revoked_tokens (jti, user_id, expires_at)
+        VALUES (%s, %s, to_timestamp(%s))
+        ON CONFLICT (jti) DO NOTHING
+        """,
+        (jti, user_id, expires)
+    )
+    cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, json.dumps({"jti": jti, "exp": expires})))
+    # Here at once on commit, without waiting for our own NOTIFY; never if rolled back
+    on_commit(lambda: revocations.add_jti(jti, expires))
+
+
+def revoke_user_tokens(cur, user_id: int) -> None:
+    """Revoke every token of a user issued until now"""
+    before = time.time()
+    cur.execute(
+        """
+        INSERT INTO user_token_cutoffs (user_id, revoked_before)
+        VALUES (%s, to_timestamp(%s))
+        ON CONFLICT (user_id) DO UPDATE
+        SET revoked_before = GREATEST(user_token_cutoffs.revoked_before, EXCLUDED.revoked_before)
+        """,
+        (user_id, before)
+    )
+    cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, json.dumps({"user_id": user_id, "before": before})))
+    on_commit(lambda: revocations.add_cutoff(user_id, before))
+
+
+def _load(conn, max_token_age: float) -> None:
+    """Replace the in-memory list with the unexpired rows and purge the rest"""
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM revoked_tokens WHERE expires_at < now()")
+        cur.execute("SELECT jti, EXTRACT(EPOCH FROM expires_at) FROM revoked_tokens")
+        jtis = {jti: float(exp) for jti, exp in cur.fetchall()}
+        # Cutoffs older than the longest token lifetime cannot match a live token
+        cur.execute(
+            """
+            SELECT user_id, EXTRACT(EPOCH FROM revoked_before)
+            FROM user_token_cutoffs
+            WHERE revoked_before > now() - make_interval(secs => %s)
+            """,
+            (max_token_age,)
+        )
+        cutoffs = {user_id: float(before) for user_id, before in cur.fetchall()}
+    revocations.replace(jtis, cutoffs)
+
+
+# Extra NOTIFY channels served by the listener thread: channel -> handler(payload)
+_subscriptions = {}
+
+
+def subscribe(channel: str, handler) -> None:
+    """Have the listener pass notifications on `channel` to handler(payload)"""
+    _subscriptions[channel] = handler
+
+
+class RevocationListener(threading.Thread):
+    """LISTENs for revocations from other workers and keeps the list in sync"""
+
+    def __init__(self, max_token_age: float):
+        super().__init__(name="token-revocation-listener", daemon=True)
+        self.max_token_age = max_token_age
+        self._stop_event = threading.Event()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self._listen()
+            except Exception as e:
+                logger.error(f"Token revocation listener error: {e}")
+                self._stop_event.wait(5)
+
+    def _listen(self) -> None:
+        conn = psycopg2.connect(DATABASE_URL)
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CHANNEL}")
+                for channel in _subscriptions:
+                    cur.execute(f"LISTEN {channel}")
+            _load(conn, self.max_token_age)
+            synced = time.monotonic()
+            while not self._stop_event.is_set():
+                if select.select([conn], [], [], 1.0)[0]:
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        if notify.channel == CHANNEL:
+                            revocations.apply(notify.payload)
+                        elif notify.channel in _subscriptions:
+                            _subscriptions[notify.channel](notify.payload)
+                if time.monotonic() - synced >= TOKEN_REVOCATION_SYNC_SECONDS:
+                    _load(conn, self.max_token_age)
+                    synced = time.monotonic()
+        finally:
+            conn.close()
+
+
+_listener: Optional[RevocationListener] = None
+
+
+def start_revocation_listener(max_token_age: float) -> None:
+    global _listener
+    if _listener is None:
+        _listener = RevocationListener(max_token_age)
+        _listener.start()
+
+
+def stop_revocation_listener() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener.join(timeout=2)
+        _listener = None
@@ -0,0 +1,121 @@
+"""
+OpenTelemetry tracing for the Nightclub Booking System
+
+setup_tracing() installs a tracer provider according to TRACING_EXPORTER:
+
+- "none" (default): tracing disabled, span() is a no-op
+- "console": spans printed to stdout
+- "file": one JSON span per line in TRACING_FILE
+- "otlp": OTLP/gRPC export (opentelemetry-exporter-otlp), to OTEL_EXPORTER_OTLP_ENDPOINT
+
+The HTTP middleware in main.py opens a span per request; SQL statements,
+bcrypt calls and audit writes open child spans. Trace and span ids are
+attached to every log record created while a span is active.
+"""
+
+import functools
+import inspect
+import logging
+from contextlib import nullcontext
+from typing import Optional
+
+from opentelemetry import trace
+
+from config import TRACING_EXPORTER, TRACING_FILE, TRACING_SERVICE_NAME
+
+logger = logging.getLogger('nightclub')
+
+tracer = trace.get_tracer("nightclub")
+
+_provider = None
+_enabled = False
+
+
+def _build_exporter():
+    from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+
+    if TRACING_EXPORTER == "console":
+        return ConsoleSpanExporter()
+    if TRACING_EXPORTER == "file":
+        out = open(TRACING_FILE, "a", encoding="utf-8")
+        return ConsoleSpanExporter(out=out, formatter=lambda s: s.to_json(indent=None) + "\n")
+    if TRACING_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    raise ValueError(f"Unknown TRACING_EXPORTER: {TRACING_EXPORTER}")
+
+
+def _install_log_correlation() -> None:
+    """Stamp trace_id/span_id on log records, in the thread that logs them"""
+    factory = logging.getLogRecordFactory()
+
+    def record_factory(*args, **kwargs):
+        record = factory(*args, **kwargs)
+        context = trace.get_current_span().get_span_context()
+        if context.is_valid:
+            record.trace_id = format(context.trace_id, "032x")
+            record.span_id = format(context.span_id, "016x")
+        return record
+
+    logging.setLogRecordFactory(record_factory)
+
+
+def setup_tracing() -> None:
+    """Install the tracer provider selected by TRACING_EXPORTER"""
+    global _provider, _enabled
+    if _enabled or TRACING_EXPORTER == "none":
+        return
+
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+    try:
+        exporter = _build_exporter()
+    except Exception as e:
+        logger.error(f"Tracing disabled, could not create '{TRACING_EXPORTER}' exporter: {e}")
+        return
+
+    _provider = TracerProvider(resource=Resource.create({"service.name": TRACING_SERVICE_NAME}))
+    _provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(_provider)
+    _install_log_correlation()
+    _enabled = True
+    logger.info(f"Tracing enabled with '{TRACING_EXPORTER}' exporter")
+
+
+def shutdown_tracing() -> None:
+    """Flush pending spans"""
+    if _provider is not None:
+        _provider.shutdown()
+
+
+def tracing_enabled() -> bool:
+    return _enabled
+
+
+def span(name: str, attributes: Optional[dict] = None):
+    """Start a child span of the current one; a no-op when tracing is disabled"""
+    if not _enabled:
+        return nullcontext()
+    return tracer.start_as_current_span(name, attributes=attributes)
+
+
+def traced(name: Optional[str] = None):
+    """Decorator running a function (sync or async) inside its own span"""
+    def decorator(func):
+        span_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
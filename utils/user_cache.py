@@ -0,0 +1,162 @@
+"""
+Per-user profile and booking stats cache
+
+The frontend asks for the current user (GET /auth/me, /users/me) on every
+page load, and each call joined users with user_profiles and counted the
+user's bookings. get_user_summary() answers from a per-worker LRU instead,
+running one query on a miss. Entries keep the encoded JSON next to the
+dict, so user_summary_response() sends cached bytes without re-encoding.
+
+Entries are dropped by invalidate_user() / invalidate_all() whenever a
+profile or a booking changes. Both take the caller's cursor: the entry is
+dropped locally at once, and a NOTIFY sent in the caller's transaction
+drops it in every worker (this one included) once the change commits, so
+a request that read the old row just before the commit cannot keep it.
+USER_CACHE_TTL_SECONDS bounds staleness for writes that bypass the API.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import HTTPException
+
+from config import USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS
+from database import get_db_cursor, prepared_statement, execute_prepared
+from utils.metrics import USER_CACHE_LOOKUPS
+from utils.responses import RawJSONResponse, dumps
+from utils.token_store import subscribe
+
+logger = logging.getLogger('nightclub')
+
+CHANNEL = "user_changed"
+ALL_USERS = "*"
+
+
+class UserCache:
+    """Bounded LRU of (summary, encoded summary) with a TTL; safe to invalidate from any thread"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every invalidation; a fill that started before one is discarded
+        self.generation = 0
+
+    def get(self, user_id: int) -> Optional[tuple]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            summary, body, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return summary, body
+
+    def put(self, user_id: int, summary: dict, body: bytes, generation: int) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[user_id] = (summary, body, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, user_id: int) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def apply(self, payload: str) -> None:
+        """Apply a NOTIFY payload: a user_id or "*" """
+        if payload == ALL_USERS:
+            self.clear()
+            return
+        try:
+            self.discard(int(payload))
+        except ValueError:
+            logger.warning(f"Ignoring malformed user cache notification {payload!r}")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+subscribe(CHANNEL, user_cache.apply)
+
+
+_USER_SUMMARY = prepared_statement("user_summary", """
+    SELECT u.user_id, u.username, u.email, u.role, u.is_active, u.created_at,
+           p.first_name, p.last_name, p.phone, p.birth_date,
+           s.total_bookings, s.active_bookings, s.cancelled_bookings
+    FROM users u
+    LEFT JOIN user_profiles p ON u.user_id = p.user_id
+    CROSS JOIN LATERAL (
+        SELECT
+            COUNT(*) as total_bookings,
+            COUNT(CASE WHEN status = 'confirmed' THEN 1 END) as active_bookings,
+            COUNT(CASE WHEN status = 'cancelled' THEN 1 END) as cancelled_bookings
+        FROM bookings
+        WHERE user_id = u.user_id
+    ) s
+    WHERE u.user_id = %s AND u.is_active = true
+""")
+
+
+def _lookup(user_id: int) -> tuple:
+    entry = user_cache.get(user_id)
+    if entry is not None:
+        USER_CACHE_LOOKUPS.labels("hit").inc()
+        return entry
+    USER_CACHE_LOOKUPS.labels("miss").inc()
+
+    generation = user_cache.generation
+    with get_db_cursor() as cur:
+        execute_prepared(cur, _USER_SUMMARY, (user_id,))
+        row = cur.fetchone()
+
+    if not row:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    summary = dict(row)
+    summary["stats"] = {
+        key: summary.pop(key)
+        for key in ("total_bookings", "active_bookings", "cancelled_bookings")
+    }
+    body = dumps(summary)
+    user_cache.put(user_id, summary, body, generation)
+    return summary, body
+
+
+def get_user_summary(user_id: int) -> dict:
+    """Profile plus booking stats of a user; the returned dict is shared, do not mutate it"""
+    return _lookup(user_id)[0]
+
+
+def user_summary_response(user_id: int) -> RawJSONResponse:
+    """get_user_summary() as a response, from the cached encoding"""
+    return RawJSONResponse(_lookup(user_id)[1])
+
+
+def invalidate_user(cur, user_id: int) -> None:
+    """Drop a user's entry here now and in every worker when `cur` commits"""
+    user_cache.discard(user_id)
+    cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, str(user_id)))
+
+
+def invalidate_all(cur) -> None:
+    """Drop every entry, for changes touching many users (e.g. an event cancellation)"""
+    user_cache.clear()
+    cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, ALL_USERS))
@@ -0,0 +1,146 @@
+"""
+Venue reference data kept in memory
+
+Zones, seats and event categories change only when an admin edits the
+venue, yet the catalog, seat map and booking endpoints read them on every
+call. Each worker loads them once at startup (main.lifespan) into an
+immutable Venue snapshot. A statement trigger (migrations/14_venue_notify.sql)
+sends NOTIFY venue_changed on any change to those tables, and every worker
+then loads a new snapshot with the next version number; requests keep using
+the snapshot they started with.
+
+Responses that depend only on the venue (zones, categories) are encoded
+once per snapshot. The seat map is assembled from pre-encoded per-seat
+fragments plus the event's zone prices and booked seats.
+"""
+
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from database import get_db_cursor
+from utils.responses import dumps
+from utils.token_store import subscribe
+
+logger = logging.getLogger('nightclub')
+
+CHANNEL = "venue_changed"
+
+
+class Zone(NamedTuple):
+    zone_id: int
+    name: str
+    description: Optional[str]
+    capacity: int
+
+
+class Seat(NamedTuple):
+    seat_id: int
+    seat_number: str
+    zone_id: int
+
+
+class Venue:
+    """One version of the venue: zones, seats (in seat map order) and categories"""
+
+    def __init__(self, version: int, zones: Iterable[Zone], seats: Iterable[Seat], categories: list):
+        self.version = version
+        self.loaded_at = datetime.now()
+        self.zones: Dict[int, Zone] = {zone.zone_id: zone for zone in zones}
+        # Seats of unknown zones never appear on a seat map
+        self.seats: Dict[int, Seat] = {
+            seat.seat_id: seat for seat in seats if seat.zone_id in self.zones
+        }
+        self.seats_by_zone: Dict[int, tuple] = {
+            zone_id: tuple(seat for seat in self.seats.values() if seat.zone_id == zone_id)
+            for zone_id in self.zones
+        }
+        self.categories = tuple(categories)
+        self.category_ids = frozenset(category["category_id"] for category in self.categories)
+
+        self.zones_json = dumps([
+            dict(zone._asdict(), total_seats=len(self.seats_by_zone[zone.zone_id]))
+            for zone in self.zones.values()
+        ])
+        self.categories_json = dumps(self.categories)
+        # Seat JSON up to the event-specific zone_price and is_booked values
+        self._seat_prefixes = {
+            seat.seat_id: dumps({
+                "seat_id": seat.seat_id,
+                "seat_number": seat.seat_number,
+                "zone_id": seat.zone_id,
+                "zone_name": self.zones[seat.zone_id].name,
+            })[:-1] + b',"zone_price":'
+            for seat in self.seats.values()
+        }
+
+    def seat_map_json(self, prices: dict, default_price, booked: set,
+                      zone_id: Optional[int] = None) -> bytes:
+        """JSON array of seats ordered by zone and seat number.
+
+        prices maps zone_id to the event's zone price; zones without one
+        use default_price. booked holds the seat_ids taken for the event.
+        """
+        zone_ids = [zone_id] if zone_id is not None else list(self.zones)
+        prefixes = self._seat_prefixes
+        parts = []
+        for zid in zone_ids:
+            price = str(prices.get(zid, default_price)).encode()
+            free = price + b',"is_booked":false}'
+            taken = price + b',"is_booked":true}'
+            parts.extend(
+                prefixes[seat.seat_id] + (taken if seat.seat_id in booked else free)
+                for seat in self.seats_by_zone.get(zid, ())
+            )
+        return b"[" + b",".join(parts) + b"]"
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at.isoformat(),
+            "zones": len(self.zones),
+            "seats": len(self.seats),
+            "categories": len(self.categories),
+        }
+
+
+_venue: Optional[Venue] = None
+_lock = threading.Lock()
+
+
+def load_venue() -> Venue:
+    """Read the venue from the database and make it the current snapshot"""
+    global _venue
+    with get_db_cursor() as cur:
+        cur.execute("SELECT zone_id, name, description, capacity FROM club_zones ORDER BY zone_id")
+        zones = [Zone(**row) for row in cur.fetchall()]
+        cur.execute("SELECT seat_id, seat_number, zone_id FROM seats ORDER BY zone_id, seat_number")
+        seats = [Seat(**row) for row in cur.fetchall()]
+        cur.execute("SELECT * FROM event_categories ORDER BY name")
+        categories = [dict(row) for row in cur.fetchall()]
+
+    with _lock:
+        version = _venue.version + 1 if _venue is not None else 1
+        _venue = Venue(version, zones, seats, categories)
+    logger.info(
+        f"Venue v{version} loaded: {len(_venue.zones)} zones, "
+        f"{len(_venue.seats)} seats, {len(_venue.categories)} categories"
+    )
+    return _venue
+
+
+def venue() -> Venue:
+    """The current snapshot, loaded on first use if startup did not"""
+    current = _venue
+    return current if current is not None else load_venue()
+
+
+def _on_venue_changed(table: str) -> None:
+    try:
+        load_venue()
+    except Exception as e:
+        logger.error(f"Failed to reload venue after a change to {table}: {e}")
+
+
+subscribe(CHANNEL, _on_venue_changed)
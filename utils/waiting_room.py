@@ -0,0 +1,209 @@
+"""
+Virtual waiting room for on-sale events
+
+When an admin opens a waiting room for an event, booking it (POST /bookings,
+POST /bookings/auto) needs an admission ticket in the X-Queue-Token header.
+Users get one from POST /events/{id}/waiting-room: the only database write,
+a single statement that hands out the event's next admission slot. Slots are 1 / admit_per_second apart, so however many users
+join at once, the booking endpoints see at most that many new users per
+second. A user who joins again keeps their ticket.
+
+A ticket is signed (HMAC-SHA256) and carries its admission time, so the
+status endpoint (position, ETA) and the admission check run from memory:
+no query, whichever worker gets the request. A ticket admits from its
+admission time for WAITING_ROOM_ADMISSION_MINUTES. Open rooms are kept in
+memory per worker and reloaded on NOTIFY waiting_room_changed.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import math
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+
+from fastapi import HTTPException
+
+from config import WAITING_ROOM_SECRET, WAITING_ROOM_ADMISSION_MINUTES
+from database import get_db_cursor
+from utils.metrics import WAITING_ROOM_CHECKS
+from utils.token_store import subscribe
+
+logger = logging.getLogger('nightclub')
+
+CHANNEL = "waiting_room_changed"
+TOKEN_HEADER = "X-Queue-Token"
+_ADMISSION_WINDOW = WAITING_ROOM_ADMISSION_MINUTES * 60
+_KEY = hashlib.sha256(b"waiting-room:" + WAITING_ROOM_SECRET.encode()).digest()
+
+
+class Room(NamedTuple):
+    event_id: int
+    admit_per_second: float
+    opened_at: float
+
+
+class Ticket(NamedTuple):
+    event_id: int
+    user_id: int
+    seq: int
+    admit_at: float
+
+
+# None until the first successful load
+_rooms: Optional[Dict[int, Room]] = None
+_lock = threading.Lock()
+
+
+def load_rooms() -> Dict[int, Room]:
+    """Read the open rooms from the database"""
+    global _rooms
+    with get_db_cursor() as cur:
+        cur.execute(
+            """
+            SELECT event_id, admit_per_second::float AS admit_per_second,
+                   EXTRACT(EPOCH FROM opened_at)::float AS opened_at
+            FROM waiting_rooms
+            """
+        )
+        rooms = {row["event_id"]: Room(**row) for row in cur.fetchall()}
+    with _lock:
+        _rooms = rooms
+    logger.info(f"Waiting rooms loaded: {sorted(rooms) or 'none'}")
+    return rooms
+
+
+def get_room(event_id: int) -> Optional[Room]:
+    """The event's open room; the rooms are loaded on first use if startup did not"""
+    rooms = _rooms
+    if rooms is None:
+        rooms = load_rooms()
+    return rooms.get(event_id)
+
+
+def notify_rooms_changed(cur, event_id: int) -> None:
+    """Have every worker reload the rooms once `cur` commits"""
+    cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, str(event_id)))
+
+
+def _on_rooms_changed(payload: str) -> None:
+    try:
+        load_rooms()
+    except Exception as e:
+        logger.error(f"Failed to reload waiting rooms after a change to event {payload}: {e}")
+
+
+subscribe(CHANNEL, _on_rooms_changed)
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64(hmac.new(_KEY, payload.encode(), hashlib.sha256).digest())
+
+
+def encode_ticket(ticket: Ticket) -> str:
+    payload = _b64(json.dumps(list(ticket), separators=(",", ":")).encode())
+    return f"{payload}.{_sign(payload)}"
+
+
+def decode_ticket(token: Optional[str]) -> Optional[Ticket]:
+    """The ticket in a token, or None if it is missing, malformed or not signed by us"""
+    if not token:
+        return None
+    payload, _, signature = token.partition(".")
+    # Bytes: compare_digest refuses non-ASCII str, and the signature is client input
+    if not hmac.compare_digest(signature.encode(), _sign(payload).encode()):
+        return None
+    try:
+        return Ticket(*json.loads(_unb64(payload)))
+    except (ValueError, TypeError):
+        return None
+
+
+def join(event_id: int, user_id: int) -> Optional[Ticket]:
+    """Take the next admission slot, or return the user's live ticket; None if no room is open"""
+    with get_db_cursor(autocommit=True) as cur:
+        cur.execute(
+            """
+            WITH current AS (
+                SELECT seq, admit_at FROM waiting_room_tickets
+                WHERE event_id = %(event_id)s AND user_id = %(user_id)s
+                  AND admit_at > CURRENT_TIMESTAMP - make_interval(secs => %(window)s)
+            ), slot AS (
+                UPDATE waiting_rooms
+                SET issued = issued + 1,
+                    next_slot = GREATEST(next_slot, CURRENT_TIMESTAMP)
+                                + make_interval(secs => 1.0 / admit_per_second)
+                WHERE event_id = %(event_id)s AND NOT EXISTS (SELECT 1 FROM current)
+                RETURNING issued AS seq, next_slot - make_interval(secs => 1.0 / admit_per_second) AS admit_at
+            ), ticket AS (
+                INSERT INTO waiting_room_tickets (event_id, user_id, seq, admit_at)
+                SELECT %(event_id)s, %(user_id)s, seq, admit_at FROM slot
+                ON CONFLICT (event_id, user_id) DO UPDATE
+                SET seq = EXCLUDED.seq, admit_at = EXCLUDED.admit_at
+                RETURNING seq, admit_at
+            )
+            SELECT seq, EXTRACT(EPOCH FROM admit_at)::float AS admit_at FROM ticket
+            UNION ALL
+            SELECT seq, EXTRACT(EPOCH FROM admit_at)::float AS admit_at FROM current
+            """,
+            {"event_id": event_id, "user_id": user_id, "window": _ADMISSION_WINDOW}
+        )
+        row = cur.fetchone()
+    if row is None:
+        return None
+    WAITING_ROOM_CHECKS.labels("joined").inc()
+    return Ticket(event_id, user_id, row["seq"], row["admit_at"])
+
+
+def ticket_status(ticket: Ticket, now: Optional[float] = None) -> dict:
+    """Position and ETA of a ticket, computed from the ticket and the room alone"""
+    now = time.time() if now is None else now
+    room = get_room(ticket.event_id)
+    wait = max(0.0, ticket.admit_at - now)
+    rate = room.admit_per_second if room is not None else 0.0
+    return {
+        "event_id": ticket.event_id,
+        "admitted": room is None or wait == 0,
+        "position": math.ceil(wait * rate),
+        "eta_seconds": round(wait, 1),
+        "admit_at": ticket.admit_at,
+        "expires_at": ticket.admit_at + _ADMISSION_WINDOW,
+    }
+
+
+def enforce_admission(event_id: int, token: Optional[str], user_id: Optional[int] = None) -> None:
+    """Let a request for `event_id` through only with an admitted ticket while its room is open.
+
+    user_id, when the caller is authenticated, must be the ticket's owner.
+    """
+    if get_room(event_id) is None:
+        return
+    ticket = decode_ticket(token)
+    now = time.time()
+    if (ticket is None or ticket.event_id != event_id
+            or (user_id is not None and ticket.user_id != user_id)
+            or now >= ticket.admit_at + _ADMISSION_WINDOW):
+        WAITING_ROOM_CHECKS.labels("rejected").inc()
+        raise HTTPException(
+            status_code=403,
+            detail=f"Event is in a waiting room: join the queue and send the ticket in {TOKEN_HEADER}"
+        )
+    if now < ticket.admit_at:
+        WAITING_ROOM_CHECKS.labels("waiting").inc()
+        raise HTTPException(
+            status_code=429,
+            detail="Not admitted yet",
+            headers={"Retry-After": str(math.ceil(ticket.admit_at - now))}
+        )
+    WAITING_ROOM_CHECKS.labels("admitted").inc()